@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Measure what version history costs a `batch` that updates many secrets
+Usage: python benchmarks/bench_batch.py [--entries N] [--runs N]
+
+Each run updates every secret in one batch. The save archives one history
+file per replaced entry, written in a single grouped pass; the table
+compares that against ENVLOCKR_HISTORY=0 at each durability level.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from io import StringIO
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import envlockr  # noqa: E402
+
+
+def run_batch(entries, round_):
+    ops = "".join(json.dumps({"op": "update", "name": f"SECRET_{i}",
+                              "value": f"value-{round_}-{i}"}) + "\n"
+                  for i in range(entries))
+    args = argparse.Namespace(file='-', dry_run=False)
+    with patch('sys.stdin', StringIO(ops)), patch('sys.stdout', new=StringIO()):
+        start = time.perf_counter()
+        envlockr.batch_command(args)
+        return time.perf_counter() - start
+
+
+def bench(entries, runs, history, durability):
+    """Best wall time of an all-entries batch update, in seconds."""
+    os.environ["ENVLOCKR_HISTORY"] = history
+    os.environ["ENVLOCKR_DURABILITY"] = durability
+    envlockr.BASE_DIR = tempfile.mkdtemp()
+    envlockr.set_profile("default")
+    try:
+        with patch('sys.stdout', new=StringIO()):
+            fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({f"SECRET_{i}": fernet.encrypt(b"initial").decode()
+                             for i in range(entries)})
+        return min(run_batch(entries, r) for r in range(runs))
+    finally:
+        shutil.rmtree(envlockr.BASE_DIR, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch updates with history")
+    parser.add_argument('--entries', type=int, default=1000, help='Secrets updated per batch')
+    parser.add_argument('--runs', type=int, default=3, help='Batches per case (best is kept)')
+    args = parser.parse_args()
+
+    envlockr.KEYRING_AVAILABLE = False
+    print(f"batch update of {args.entries} entries")
+    print(f"{'durability':<12} {'no history':>12} {'history':>12} {'per entry':>10}")
+    for durability in envlockr.DURABILITY_LEVELS:
+        off = bench(args.entries, args.runs, "0", durability)
+        on = bench(args.entries, args.runs, str(envlockr.HISTORY_KEEP), durability)
+        print(f"{durability:<12} {off * 1000:>10.1f}ms {on * 1000:>10.1f}ms "
+              f"{(on - off) / args.entries * 1e6:>8.1f}us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Compare the per-entry cipher backends (Fernet vs AES-GCM vs ChaCha20-Poly1305)
+Usage: python benchmarks/bench_ciphers.py [--entries N] [--size BYTES]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import envlockr  # noqa: E402
+from cryptography.fernet import Fernet  # noqa: E402
+
+
+def bench(cipher, fernet, values):
+    """Encrypt then decrypt every value; returns (enc_s, dec_s, stored_bytes)."""
+    os.environ["ENVLOCKR_CIPHER"] = cipher
+    start = time.perf_counter()
+    stored = {name: envlockr._encrypt_value(fernet, name, v) for name, v in values.items()}
+    enc = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name, token in stored.items():
+        envlockr._decrypt_value(fernet, token, name)
+    dec = time.perf_counter() - start
+    return enc, dec, sum(len(t) for t in stored.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entry ciphers")
+    parser.add_argument('--entries', type=int, default=20000, help='Number of entries')
+    parser.add_argument('--size', type=int, default=40, help='Plaintext bytes per entry')
+    args = parser.parse_args()
+
+    fernet = envlockr._make_fernet(Fernet.generate_key())
+    values = {f"SECRET_{i}": os.urandom(args.size // 2 + 1).hex()[:args.size]
+              for i in range(args.entries)}
+    plain = sum(len(v) for v in values.values())
+
+    print(f"{args.entries} entries x {args.size} bytes")
+    print(f"{'cipher':<10} {'encrypt':>10} {'decrypt':>10} {'stored':>12} {'overhead':>9}")
+    for cipher in ("fernet", "aesgcm", "chacha20"):
+        enc, dec, size = bench(cipher, fernet, values)
+        print(f"{cipher:<10} {enc * 1000:>8.1f}ms {dec * 1000:>8.1f}ms "
+              f"{size:>12,} {(size - plain) / plain:>8.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Measure the plaintext copies `run` leaves behind while building a child environment
+Usage: python benchmarks/bench_run_memory.py [--entries N] [--size BYTES]
+
+Compares the str pipeline (decrypt_secret + os.environ.copy) against the
+arena pipeline `run` uses. Each pipeline runs in a fresh interpreter that
+records tracemalloc heap usage, drops the environment it built and then, on
+Linux, scans its own writable memory for plaintext that is still readable —
+live or freed-but-never-zeroed.
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import envlockr  # noqa: E402
+from cryptography.fernet import Fernet  # noqa: E402
+
+MARKER = b"PLAINTEXT-"
+
+
+def str_pipeline(fernet, vault):
+    values = envlockr._resolve_secrets(fernet, vault, sorted(vault))
+    env = os.environ.copy()
+    env.update(values)
+    return len(env)
+
+
+def arena_pipeline(fernet, vault):
+    with envlockr._SecretArena(sum(len(v) for v in vault.values())) as arena:
+        values = envlockr._resolve_secrets(fernet, vault, sorted(vault), arena=arena)
+        env = dict(os.environb)
+        secrets = {os.fsencode(n): bytes(v) for n, v in values.items()}
+        env.update(secrets)
+        for value in secrets.values():
+            envlockr._wipe_bytes(value)
+        return len(env)
+
+
+def readable_copies():
+    """Occurrences of MARKER in this process's writable mappings (Linux only)."""
+    if not os.path.exists('/proc/self/maps'):
+        return None
+    needle = bytearray(MARKER)  # not a bytes constant, so it is not counted itself
+    found = 0
+    with open('/proc/self/maps') as maps, open('/proc/self/mem', 'rb', 0) as mem:
+        for line in maps:
+            fields = line.split()
+            if 'rw' not in fields[1] or (len(fields) > 5 and fields[5].startswith('[v')):
+                continue
+            start, end = (int(x, 16) for x in fields[0].split('-'))
+            try:
+                mem.seek(start)
+                found += mem.read(end - start).count(needle)
+            except (OSError, OverflowError, ValueError):
+                continue
+    return found
+
+
+def child(pipeline, path):
+    with open(path) as f:
+        data = json.load(f)
+    fernet = envlockr._make_fernet(data["key"].encode())
+    vault = data["vault"]
+    tracemalloc.start()
+    {"str": str_pipeline, "arena": arena_pipeline}[pipeline](fernet, vault)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    print(json.dumps({"peak": peak, "copies": readable_copies()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure run's plaintext copies")
+    parser.add_argument('--entries', type=int, default=10000, help='Number of entries')
+    parser.add_argument('--size', type=int, default=64, help='Plaintext bytes per entry')
+    parser.add_argument('--child', nargs=2, metavar=('PIPELINE', 'VAULT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return 0
+    if not os.supports_bytes_environ:
+        print("This platform has no bytes environment; nothing to compare.")
+        return 1
+
+    key = Fernet.generate_key()
+    fernet = envlockr._make_fernet(key)
+    pad = max(args.size - len(MARKER) - 7, 0)
+    vault = {f"SECRET_{i}": fernet.encrypt(MARKER + b"%06d-" % i + b"x" * pad).decode()
+             for i in range(args.entries)}
+    fd, path = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"key": key.decode(), "vault": vault}, f)
+        print(f"{args.entries} entries x {args.size} bytes")
+        print(f"{'pipeline':<8} {'peak heap':>12} {'plaintext copies left':>22}")
+        for pipeline in ("str", "arena"):
+            out = subprocess.run([sys.executable, __file__, '--child', pipeline, path],
+                                 capture_output=True, text=True, check=True).stdout
+            result = json.loads(out)
+            copies = "n/a" if result["copies"] is None else f"{result['copies']:,}"
+            print(f"{pipeline:<8} {result['peak'] / 1024:>10,.0f}KiB {copies:>22}")
+    finally:
+        os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Measure the wall time of a real `envlockr get` against its baselines
+Usage: python benchmarks/bench_startup.py [--runs N]
+
+Every row is a fresh interpreter reading one secret from a throwaway vault:
+a bare interpreter and a bare `import envlockr` show the fixed cost, and the
+last two rows run `get` with the selected-command parser and with every
+command's parser built, which is what main() did before the dispatch table.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FULL_PARSER = ("import envlockr; build = envlockr._build_parser; "
+               "envlockr._build_parser = lambda command=None: build(None); ")
+
+CASES = (
+    ("python -c pass", ["-c", "pass"]),
+    ("import envlockr", ["-c", "import envlockr"]),
+    ("get (full parser)", ["-c", FULL_PARSER + "envlockr.main(['get', 'API_KEY'])"]),
+    ("python -m envlockr get", ["-m", "envlockr", "get", "API_KEY"]),
+)
+
+
+def wall_ms(argv, env, runs):
+    """Best and median wall time of `python argv` over `runs` runs."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup")
+    parser.add_argument('--runs', type=int, default=30, help='Runs per case')
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, ENVLOCKR_HOME=home,
+               PYTHON_KEYRING_BACKEND="keyring.backends.fail.Keyring")
+    try:
+        subprocess.run([sys.executable, "-m", "envlockr", "add", "API_KEY", "--value", "x"],
+                       cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        print(f"{'case':<24} {'best':>9} {'median':>9}")
+        for label, argv in CASES:
+            best, median = wall_ms(argv, env, args.runs)
+            print(f"{label:<24} {best:>7.1f}ms {median:>7.1f}ms")
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,20 @@
 import argparse
 import base64
+import contextlib
 import getpass
 import hashlib
+import importlib.util
+import itertools
 import json
 import os
+import re
+import shutil
 import stat
+import struct
 import subprocess
 import sys
+import tempfile
+import time
 
 # Version
 __version__ = "2.0.0"
@@ -28,7 +36,13 @@ try:
 except ImportError:
     KEYRING_AVAILABLE = False
 
+# YAML support for `import --format yaml` (k8s manifests also parse without it).
+# Only probed here; PyYAML itself is imported on first use, since importing it
+# costs more than starting the rest of the CLI.
+YAML_AVAILABLE = importlib.util.find_spec("yaml") is not None
+
 try:
+    from cryptography.exceptions import InvalidTag
     from cryptography.fernet import Fernet, InvalidToken
 except ImportError:
     print("❌ Error: 'cryptography' package is required.")
@@ -41,6 +55,7 @@ BASE_DIR = os.environ.get("ENVLOCKR_HOME", os.path.expanduser("~/.envlockr"))
 # Active vault paths. The "default" profile lives at the base root for backward
 # compatibility; named profiles live under <base>/envs/<name>/. set_profile()
 # resets these globals once the --env flag has been parsed.
+PROFILE = "default"
 VAULT_DIR = BASE_DIR
 VAULT_FILE = os.path.join(VAULT_DIR, "vault.json")
 KEY_FILE = os.path.join(VAULT_DIR, "key.key")
@@ -61,7 +76,8 @@ def set_profile(name):
     The 'default' profile stays at the base root so existing vaults keep
     working untouched. Named profiles are isolated under <base>/envs/<name>/.
     """
-    global VAULT_DIR, VAULT_FILE, KEY_FILE
+    global PROFILE, VAULT_DIR, VAULT_FILE, KEY_FILE
+    PROFILE = name or "default"
     if name and name != "default":
         VAULT_DIR = os.path.join(BASE_DIR, "envs", name)
     else:
@@ -85,25 +101,10 @@ class Colors:
         """Disable colors (for non-TTY or Windows without color support)"""
         cls.RED = cls.GREEN = cls.YELLOW = cls.BLUE = cls.CYAN = cls.BOLD = cls.NC = ''
 
-# Ensure stdout/stderr can encode emoji/Unicode on Windows (cp1252 consoles
-# otherwise raise UnicodeEncodeError on the ✅/❌/🔐 status glyphs).
-for _stream in (sys.stdout, sys.stderr):
-    try:
-        _stream.reconfigure(encoding='utf-8', errors='replace')
-    except (AttributeError, ValueError):
-        pass
-
-# Disable colors if not a TTY or on Windows without proper support
+# Disable colors if not a TTY. Stream encoding and Windows console setup happen
+# in _setup_console() when the CLI starts, not on import.
 if not sys.stdout.isatty():
     Colors.disable()
-elif sys.platform == 'win32':
-    try:
-        # Enable ANSI colors on Windows 10+
-        import ctypes
-        kernel32 = ctypes.windll.kernel32
-        kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
-    except Exception:
-        Colors.disable()
 
 
 def print_success(message):
@@ -151,50 +152,93 @@ def check_key_file_security():
 
 
 # Utilities
+KEYRING_TIMEOUT = 5.0      # seconds; ENVLOCKR_KEYRING_TIMEOUT overrides
+_keychain_stalled = False  # set once a keychain call times out in this run
+
+
 def _keyring_id():
     """Stable per-vault identity used as the keychain account name."""
     return f"key:{os.path.abspath(VAULT_DIR)}"
 
 
+def _keyring_call(fn, *args):
+    """Run a python-keyring call under a hard timeout.
+
+    Returns (True, result), or (False, exception-or-None) when the backend
+    failed or did not answer. A call hung on D-Bus/libsecret is abandoned in
+    a daemon thread and the keychain is skipped for the rest of the run.
+    """
+    global _keychain_stalled
+    if _keychain_stalled:
+        return False, None
+    import threading
+    raw = os.environ.get("ENVLOCKR_KEYRING_TIMEOUT", "").strip()
+    try:
+        timeout = float(raw) if raw else KEYRING_TIMEOUT
+    except ValueError:
+        print_error(f"Invalid ENVLOCKR_KEYRING_TIMEOUT '{raw}': expected seconds.")
+        sys.exit(1)
+    outcome = {}
+
+    def call():
+        try:
+            outcome["value"] = fn(*args)
+        except Exception as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=call, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        _keychain_stalled = True
+        print_warning(f"OS keychain did not answer within {timeout:g}s; skipping it.")
+        return False, None
+    if "error" in outcome:
+        return False, outcome["error"]
+    return True, outcome.get("value")
+
+
 def _keyring_get_key():
     """Return the master key bytes from the OS keychain, or None."""
     if not KEYRING_AVAILABLE:
         return None
-    try:
-        stored = keyring.get_password(KEYRING_SERVICE, _keyring_id())
-    except Exception:
-        return None
-    return stored.encode() if stored else None
+    ok, stored = _keyring_call(keyring.get_password, KEYRING_SERVICE, _keyring_id())
+    return stored.encode() if ok and stored else None
 
 
 def _keyring_set_key(key):
     """Store the master key bytes in the OS keychain. Returns True on success."""
     if not KEYRING_AVAILABLE:
         return False
-    try:
-        keyring.set_password(KEYRING_SERVICE, _keyring_id(), key.decode())
-        return True
-    except Exception as e:
-        print_warning(f"Could not write to OS keychain: {e}")
-        return False
+    ok, error = _keyring_call(keyring.set_password, KEYRING_SERVICE, _keyring_id(), key.decode())
+    if not ok and error is not None:
+        print_warning(f"Could not write to OS keychain: {error}")
+    return ok
 
 
 def _write_key_file(key):
     """Write the master key to disk with secure (0600) permissions."""
-    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
-    if sys.platform != 'win32':
-        fd = os.open(KEY_FILE, flags, 0o600)
-        with os.fdopen(fd, 'wb') as f:
-            f.write(key)
-    else:
-        with open(KEY_FILE, 'wb') as f:
-            f.write(key)
+    _atomic_write(KEY_FILE, key)
+    _session_cache_clear()
+
+
+class _MasterFernet(Fernet):
+    """Fernet that also keeps its raw 32-byte key.
+
+    Per the Fernet spec the first 16 bytes are the signing key and the last
+    16 the encryption key; subkeys and the in-place decrypt path read them
+    from here rather than from Fernet's private attributes.
+    """
+
+    def __init__(self, key):
+        super().__init__(key)
+        self.raw_key = base64.urlsafe_b64decode(key)
 
 
 def _make_fernet(key):
     """Build a Fernet instance, exiting cleanly on a corrupt key."""
     try:
-        return Fernet(key)
+        return _MasterFernet(key)
     except Exception:
         print_error("Invalid or corrupted master key.")
         print_info("You may need to remove the key and start fresh.")
@@ -202,54 +246,521 @@ def _make_fernet(key):
         sys.exit(1)
 
 
+def _subkey(fernet, purpose):
+    """Derive an independent 32-byte key for `purpose` from the master key (HKDF-SHA256).
+
+    Lets features such as backups get their own key without another KDF
+    password prompt and without ever reusing the Fernet keys directly.
+    """
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=b"envlockr/" + purpose.encode()).derive(fernet.raw_key)
+
+
+# --- Locking and atomic writes -----------------------------------------------
+# Writers serialize on an advisory lock, <vault>/.lock (fcntl.flock on POSIX,
+# msvcrt.locking on Windows), and replace files through a temp file and
+# os.replace, so readers never see a partial file and a crash leaves either the
+# old or the new version. load_vault()/load_meta() remember what they read; if
+# another process saved in between, save_vault()/save_meta() rebase this
+# process's per-key changes onto the current file instead of overwriting it.
+#
+# ENVLOCKR_DURABILITY: fast (no fsync), normal (fsync the file before the
+# rename; default) or full (also fsync the directory after it).
+
+DURABILITY_LEVELS = ('fast', 'normal', 'full')
+LOCK_TIMEOUT = 30.0  # seconds to wait for another writer before giving up
+_lock_depth = {}     # lock path -> nesting depth held by this process
+_loaded = {}         # file path -> contents as last read or written here
+_MISSING = object()
+
+
+def _durability():
+    level = os.environ.get("ENVLOCKR_DURABILITY", "normal").strip().lower() or "normal"
+    if level not in DURABILITY_LEVELS:
+        print_error(f"Unknown ENVLOCKR_DURABILITY '{level}'.")
+        print_info("Choose one of: " + ", ".join(DURABILITY_LEVELS))
+        sys.exit(1)
+    return level
+
+
+def _try_lock(fd):
+    """Take the exclusive lock on `fd` without blocking; True on success."""
+    os.lseek(fd, 0, os.SEEK_SET)
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd):
+    os.lseek(fd, 0, os.SEEK_SET)
+    if os.name == 'nt':
+        import msvcrt
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _wait_for_lock(fd, timeout=LOCK_TIMEOUT):
+    """Poll for the lock on `fd` with backoff; False once `timeout` has passed."""
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while not _try_lock(fd):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    return True
+
+
+@contextlib.contextmanager
+def _vault_lock():
+    """Hold the active profile's write lock (re-entrant within a process)."""
+    ensure_vault_dir()
+    path = os.path.join(VAULT_DIR, ".lock")
+    if _lock_depth.get(path):
+        _lock_depth[path] += 1
+        try:
+            yield
+        finally:
+            _lock_depth[path] -= 1
+        return
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if not _wait_for_lock(fd):
+            print_error(f"Timed out waiting for another envlockr process ({path}).")
+            sys.exit(1)
+        _lock_depth[path] = 1
+        try:
+            yield
+        finally:
+            _lock_depth[path] = 0
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path, data, mode=None, sync=True):
+    """Replace `path` with `data` via a temp file (0600 unless `mode`) and os.replace.
+
+    `sync=False` skips fsync regardless of ENVLOCKR_DURABILITY (derived files).
+    """
+    _atomic_write_many({path: data}, mode, sync)
+
+
+def _atomic_write_many(files, mode=None, sync=True):
+    """_atomic_write for several {path: data} in one pass.
+
+    Every file is staged before any is synced, the fsyncs run back to back
+    and the renames follow, with one directory fsync per directory at 'full'
+    durability; a failure before the renames leaves every target untouched.
+    """
+    level = _durability() if sync else 'fast'
+    staged, renamed = [], 0
+    try:
+        for path, data in files.items():
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                       prefix=f".{os.path.basename(path)}.")
+            f = os.fdopen(fd, 'wb')
+            staged.append((f, tmp, path))
+            if mode is not None:
+                os.chmod(tmp, mode)
+            f.write(data)
+            f.flush()
+        for f, _tmp, _path in staged:
+            if level != 'fast':
+                os.fsync(f.fileno())
+            f.close()
+        for _f, tmp, path in staged:
+            os.replace(tmp, path)
+            renamed += 1
+    except BaseException:
+        for f, tmp, _path in staged[renamed:]:
+            f.close()
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        raise
+    if level == 'full' and os.name != 'nt':
+        for directory in {os.path.dirname(path) or '.' for path in files}:
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+
+def _read_json_file(path, default):
+    """Parsed JSON at `path`; `default` if missing, None if unreadable/corrupt."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError):
+        return None
+
+
+def _rebase(base, ours, theirs):
+    """Replay the keys `ours` changed relative to `base` on top of `theirs`.
+
+    Returns (merged, conflicts); conflicts are keys the other side changed
+    differently too. This process's value wins for those.
+    """
+    merged = dict(theirs)
+    conflicts = []
+    for key in set(base) | set(ours):
+        mine = ours.get(key, _MISSING)
+        original = base.get(key, _MISSING)
+        if mine == original:
+            continue
+        if theirs.get(key, _MISSING) not in (original, mine):
+            conflicts.append(key)
+        if mine is _MISSING:
+            merged.pop(key, None)
+        else:
+            merged[key] = mine
+    return merged, sorted(conflicts)
+
+
+# --- Metrics -----------------------------------------------------------------
+# With ENVLOCKR_METRICS_FILE set (e.g. to a file in node_exporter's textfile
+# collector directory), each run adds its counters and latency observations to
+# that file in Prometheus text format. Runs merge under <file>.lock and replace
+# the file atomically, so a scrape never sees a partial file and concurrent
+# runs add up. When the variable is unset nothing is recorded.
+
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_FAMILIES = {
+    "envlockr_command_runs_total":
+        ("counter", "envlockr invocations by command and exit status."),
+    "envlockr_command_duration_seconds":
+        ("histogram", "Wall time of envlockr commands."),
+    "envlockr_phase_duration_seconds":
+        ("histogram", "Time spent loading the key and vault, decrypting, and in verify HTTP calls."),
+    "envlockr_decrypt_failures_total":
+        ("counter", "Entries that failed to decrypt."),
+}
+_metrics = {}              # series ('name{labels}') -> value for this run
+_metrics_command = "none"  # set by main()
+
+
+def _label_value(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels) + "}"
+
+
+def _metric_inc(name, labels=(), amount=1):
+    if os.environ.get("ENVLOCKR_METRICS_FILE"):
+        key = _series(name, (("command", _metrics_command),) + tuple(labels))
+        _metrics[key] = _metrics.get(key, 0) + amount
+
+
+def _observe(name, labels, seconds):
+    """Record one latency observation as a Prometheus histogram."""
+    for le in METRICS_BUCKETS:  # every bucket, so each series exists from the start
+        _metric_inc(name + "_bucket", labels + (("le", f"{le:g}"),), int(seconds <= le))
+    _metric_inc(name + "_bucket", labels + (("le", "+Inf"),))
+    _metric_inc(name + "_sum", labels, seconds)
+    _metric_inc(name + "_count", labels)
+
+
+@contextlib.contextmanager
+def _timed(phase):
+    """Time the block (or, as a decorator, each call) as `phase`."""
+    if not os.environ.get("ENVLOCKR_METRICS_FILE"):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe("envlockr_phase_duration_seconds", (("phase", phase),),
+                 time.perf_counter() - start)
+
+
+def _family(series):
+    name = series.split("{", 1)[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRIC_FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def _format_metrics(values):
+    """Prometheus text for {series: value}, one contiguous block per family."""
+    families = {}
+    for series, value in values.items():
+        families.setdefault(_family(series), []).append((series, value))
+    lines = []
+    for family in sorted(families):
+        if family in METRIC_FAMILIES:
+            kind, help_text = METRIC_FAMILIES[family]
+            lines += [f"# HELP {family} {help_text}", f"# TYPE {family} {kind}"]
+        for series, value in families[family]:
+            lines.append(f"{series} {int(value) if float(value).is_integer() else repr(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _parse_metrics(text):
+    values = {}
+    for line in text.splitlines():
+        if not line.strip() or line.startswith('#'):
+            continue
+        series, _, value = line.rpartition(' ')
+        try:
+            values[series] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+def _flush_metrics():
+    """Merge this run's metrics into ENVLOCKR_METRICS_FILE. Never raises."""
+    path = os.environ.get("ENVLOCKR_METRICS_FILE")
+    if not path or not _metrics:
+        return
+    try:
+        fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not _wait_for_lock(fd):
+                return
+            try:
+                try:
+                    with open(path) as f:
+                        values = _parse_metrics(f.read())
+                except FileNotFoundError:
+                    values = {}
+                for series, amount in _metrics.items():
+                    values[series] = values.get(series, 0) + amount
+                # node_exporter usually runs as another user, so the file is world-readable.
+                _atomic_write(path, _format_metrics(values).encode(), mode=0o644)
+            finally:
+                _unlock(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass  # metrics must never break a command
+    _metrics.clear()
+
+
+# --- Session key cache -------------------------------------------------------
+# Opt-in with ENVLOCKR_SESSION_CACHE=<seconds> (Linux). Once the master key has
+# been read from the keychain or key file, it is parked in the kernel session
+# keyring (see `keyctl show @s`) as a "user" key that expires after that many
+# seconds, and later commands in the same login session fetch it with a couple
+# of syscalls instead of going through python-keyring and D-Bus. The key never
+# touches disk, only processes that possess the session keyring can read it,
+# and writing a key file or importing a bundle invalidates it.
+
+KEY_SPEC_SESSION_KEYRING = -3
+KEYCTL_READ = 11
+KEYCTL_SET_TIMEOUT = 15
+KEYCTL_INVALIDATE = 21
+_KEYCTL_SYSCALLS = {  # machine -> (add_key, request_key, keyctl)
+    'x86_64': (248, 249, 250), 'aarch64': (217, 218, 219), 'riscv64': (217, 218, 219),
+    'i386': (286, 287, 288), 'i686': (286, 287, 288), 'armv7l': (309, 310, 311),
+    'ppc64le': (269, 270, 271), 's390x': (278, 279, 280),
+}
+_keyctl = None  # (libc syscall, numbers) once probed; False if unavailable
+
+
+def _session_cache_timeout():
+    raw = os.environ.get("ENVLOCKR_SESSION_CACHE", "").strip()
+    if not raw:
+        return 0
+    try:
+        seconds = int(raw)
+    except ValueError:
+        seconds = -1
+    if seconds < 0:
+        print_error(f"Invalid ENVLOCKR_SESSION_CACHE '{raw}': expected seconds (0 disables).")
+        sys.exit(1)
+    return seconds
+
+
+def _keyctl_syscall():
+    global _keyctl
+    if _keyctl is None:
+        _keyctl = False
+        numbers = _KEYCTL_SYSCALLS.get(os.uname().machine) \
+            if sys.platform.startswith('linux') else None
+        if numbers:
+            import ctypes
+            try:
+                syscall = ctypes.CDLL(None, use_errno=True).syscall
+                syscall.restype = ctypes.c_long
+                _keyctl = (syscall, numbers)
+            except (OSError, AttributeError):
+                pass
+    return _keyctl or None
+
+
+def _session_key_description():
+    return b"envlockr:" + hashlib.sha256(os.path.abspath(VAULT_DIR).encode()).hexdigest()[:16].encode()
+
+
+def _session_key_serial():
+    """Serial of this vault's cached key in the session keyring, or None."""
+    import ctypes
+    syscall, (_add_key, request_key, _ctl) = _keyctl_syscall()
+    # No callout info, so a miss fails with ENOKEY instead of running /sbin/request-key.
+    serial = syscall(ctypes.c_long(request_key), b"user", _session_key_description(), None,
+                     ctypes.c_long(0))
+    return serial if serial > 0 else None
+
+
+def _session_cache_get():
+    """The master key cached for this vault, or None (disabled, missing, expired)."""
+    if not _session_cache_timeout() or not _keyctl_syscall():
+        return None
+    import ctypes
+    syscall, (_add_key, _request_key, keyctl) = _keyctl_syscall()
+    serial = _session_key_serial()
+    if serial is None:
+        return None
+    L = ctypes.c_long
+    size = syscall(L(keyctl), L(KEYCTL_READ), L(serial), None, L(0))
+    if not 0 < size <= 4096:
+        return None
+    buf = ctypes.create_string_buffer(size)
+    try:
+        if syscall(L(keyctl), L(KEYCTL_READ), L(serial), buf, L(size)) != size:
+            return None
+        key = buf.raw
+    finally:
+        ctypes.memset(buf, 0, size)
+    try:
+        Fernet(key)
+    except Exception:
+        return None
+    return key
+
+
+def _session_cache_put(key):
+    """Cache `key` in the session keyring for ENVLOCKR_SESSION_CACHE seconds."""
+    timeout = _session_cache_timeout()
+    if not timeout or not _keyctl_syscall():
+        return
+    import ctypes
+    syscall, (add_key, _request_key, keyctl) = _keyctl_syscall()
+    L = ctypes.c_long
+    serial = syscall(L(add_key), b"user", _session_key_description(), key, ctypes.c_size_t(len(key)),
+                     L(KEY_SPEC_SESSION_KEYRING))
+    if serial > 0:
+        syscall(L(keyctl), L(KEYCTL_SET_TIMEOUT), L(serial), L(timeout))
+
+
+def _session_cache_clear():
+    """Drop this vault's cached key, whether or not caching is enabled now."""
+    if not _keyctl_syscall():
+        return
+    import ctypes
+    syscall, (_add_key, _request_key, keyctl) = _keyctl_syscall()
+    serial = _session_key_serial()
+    if serial is not None:
+        syscall(ctypes.c_long(keyctl), ctypes.c_long(KEYCTL_INVALIDATE), ctypes.c_long(serial))
+
+
+@_timed("key_load")
 def load_or_create_key():
-    """Load the master key, preferring the OS keychain over an on-disk file.
+    """Load the master key, trying each provider in turn.
 
     Resolution order:
-      1. OS keychain (no key material touches disk) — if a key is stored there.
-      2. Legacy/on-disk key file (existing installs, or systems without keyring).
-      3. Create a new key: into the keychain when available, else a 0600 file
+      1. Session key cache (opt-in, Linux kernel keyring) — only while a vault
+         or key file exists, so a wiped vault never inherits a stale key.
+      2. OS keychain (no key material touches disk) — if a key is stored there.
+         Each call has a hard timeout; a keychain that hangs is skipped.
+      3. Legacy/on-disk key file (existing installs, or systems without keyring).
+      4. Create a new key: into the keychain when available, else a 0600 file
          with an explicit warning about the weaker disk-compromise posture.
     """
     ensure_vault_dir()
+    check_key_file_security()
+
+    if os.path.exists(VAULT_FILE) or os.path.exists(KEY_FILE):
+        cached = _session_cache_get()
+        if cached:
+            return _make_fernet(cached)
 
     kr_key = _keyring_get_key()
     if kr_key:
+        _session_cache_put(kr_key)
         return _make_fernet(kr_key)
 
     if os.path.exists(KEY_FILE):
-        try:
-            with open(KEY_FILE, 'rb') as f:
-                key = f.read()
-        except PermissionError:
-            print_error(f"Permission denied reading key file: {KEY_FILE}")
-            sys.exit(1)
-        except IOError as e:
-            print_error(f"Error reading key file: {e}")
-            sys.exit(1)
+        key = _read_key_file()
+        _session_cache_put(key)
         return _make_fernet(key)
 
-    # No key anywhere — create one.
-    key = Fernet.generate_key()
-    if _keyring_set_key(key):
-        print_info("Master key stored in your OS keychain (not on disk).")
-    else:
-        _write_key_file(key)
-        if not KEYRING_AVAILABLE:
-            print_warning("OS keychain support not installed — master key written to disk.")
-            print_info("For disk-compromise protection install: pip install envlockr[keychain]")
+    # No key anywhere — create one. Under the vault lock, so that processes
+    # racing on a first run all end up with the same key.
+    with _vault_lock():
+        kr_key = _keyring_get_key()
+        if kr_key:
+            return _make_fernet(kr_key)
+        if os.path.exists(KEY_FILE):
+            return _make_fernet(_read_key_file())
+        if _keychain_stalled:
+            # The key may well be in the keychain; never shadow it with a new one.
+            print_error("The OS keychain did not answer, so envlockr cannot tell "
+                        "whether a master key is stored there.")
+            print_info("Retry, or raise ENVLOCKR_KEYRING_TIMEOUT.")
+            sys.exit(1)
+
+        key = Fernet.generate_key()
+        if _keyring_set_key(key):
+            print_info("Master key stored in your OS keychain (not on disk).")
+        else:
+            _write_key_file(key)
+            if not KEYRING_AVAILABLE:
+                print_warning("OS keychain support not installed — master key written to disk.")
+                print_info("For disk-compromise protection install: pip install envlockr[keychain]")
     return _make_fernet(key)
 
+
+def _read_key_file():
+    try:
+        with open(KEY_FILE, 'rb') as f:
+            return f.read()
+    except PermissionError:
+        print_error(f"Permission denied reading key file: {KEY_FILE}")
+        sys.exit(1)
+    except IOError as e:
+        print_error(f"Error reading key file: {e}")
+        sys.exit(1)
+
+
+@_timed("vault_load")
 def load_vault():
     """Load the encrypted vault from disk"""
     ensure_vault_dir()
     
     if not os.path.exists(VAULT_FILE):
+        _loaded[VAULT_FILE] = {}
         return {}
     
     try:
         with open(VAULT_FILE, 'r') as f:
-            return json.load(f)
+            vault = json.load(f)
+        _loaded[VAULT_FILE] = dict(vault)
+        return vault
     except json.JSONDecodeError:
         print_error("Vault file is corrupted.")
         print_info("You may need to delete ~/.envlockr/vault.json and start fresh.")
@@ -262,13 +773,54 @@ def load_vault():
         sys.exit(1)
 
 
-def save_vault(vault):
-    """Save the vault to disk"""
+def save_vault(vault, fernet=None):
+    """Save the vault to disk, atomically and without losing concurrent saves.
+
+    If another process saved since this one loaded, our per-key changes are
+    rebased onto its version, and `vault` is updated in place to match.
+    Pass `fernet` when the caller already holds the master key; it is only
+    needed to update the integrity tree, and otherwise loaded before locking.
+    """
     ensure_vault_dir()
-    
+    policy = _history_policy()
+    if fernet is None and os.path.exists(_integrity_file()):
+        fernet = load_or_create_key()  # may prompt or wait on the keychain
+
     try:
-        with open(VAULT_FILE, 'w') as f:
-            json.dump(vault, f, indent=4)
+        with _vault_lock():
+            base = _loaded.get(VAULT_FILE)
+            current = _read_json_file(VAULT_FILE, {})
+            if not isinstance(current, dict):
+                if base is not None:
+                    # Corrupted since we loaded it: nothing to rebase onto,
+                    # and overwriting would hide what happened.
+                    print_error(f"Vault file {VAULT_FILE} is unreadable or corrupted; "
+                                "not saving over it.")
+                    print_info("Restore it with 'envlockr restore latest' or from a copy.")
+                    sys.exit(1)
+                current = {}  # a caller replacing the vault outright (restore)
+            if base is not None and current != base:
+                merged, conflicts = _rebase(base, vault, current)
+                for name in conflicts:
+                    print_warning(f"Secret '{name}' was also changed by another process; "
+                                  "keeping this change.")
+                vault.clear()
+                vault.update(merged)
+            expired = []
+            if current and policy[0]:
+                replaced = {n: v for n, v in current.items() if vault.get(n) != v}
+                if replaced:
+                    expired = _archive_versions(replaced, policy)
+            _atomic_write(VAULT_FILE, json.dumps(vault, indent=4).encode())
+            _update_integrity(fernet, current or {}, vault)
+            # Blobs whose last vault reference just went away (archived ones
+            # are still referenced from history and survive).
+            _gc_blobs((_blob_references(current or {}) - _blob_references(vault)) |
+                      {a for a in map(_blob_address, expired) if a})
+            _loaded[VAULT_FILE] = dict(vault)
+            if base is None or base.keys() != vault.keys() \
+                    or not os.path.exists(_names_cache_file()):
+                _write_names_cache(vault)
     except PermissionError:
         print_error(f"Permission denied writing to vault: {VAULT_FILE}")
         sys.exit(1)
@@ -277,259 +829,1992 @@ def save_vault(vault):
         sys.exit(1)
 
 
-def decrypt_secret(fernet, encrypted_value):
-    """Safely decrypt a secret value"""
+def _names_cache_file():
+    return os.path.join(VAULT_DIR, "names.cache")
+
+
+def _write_names_cache(names):
+    """Rewrite the plain, sorted name list that shell completion reads."""
     try:
-        return fernet.decrypt(encrypted_value.encode()).decode()
-    except InvalidToken:
-        print_error("Failed to decrypt secret. Key may have changed.")
-        print_info("If you regenerated your key, existing secrets cannot be recovered.")
-        return None
-    except Exception as e:
-        print_error(f"Decryption error: {e}")
-        return None
+        _atomic_write(_names_cache_file(),
+                      "".join(n + "\n" for n in sorted(names)).encode(), sync=False)
+    except OSError:
+        pass  # completion is a convenience; never fail a save over it
+
+
+# --- Metadata sidecar --------------------------------------------------------
+# vault.json stays a flat name -> ciphertext map; everything that can be known
+# without decrypting (timestamps, plaintext length, provider guess, tags) lives
+# in meta.json next to it so `list --long/--json` never needs the key.
+
+_PROVIDER_PREFIXES = (
+    (('sk_live_', 'sk_test_', 'rk_live_', 'rk_test_'), 'Stripe'),
+    (('sk-ant-',), 'Anthropic'),
+    (('sk-', 'sk-proj-'), 'OpenAI'),
+    (('ghp_', 'gho_', 'ghu_', 'ghs_', 'github_pat_'), 'GitHub'),
+    (('xoxb-', 'xoxp-', 'xoxa-'), 'Slack'),
+    (('dop_v1_',), 'DigitalOcean'),
+)
+
+
+def _guess_provider(value):
+    """Best-effort provider name from a secret's prefix (no network)."""
+    for prefixes, provider in _PROVIDER_PREFIXES:
+        if value.startswith(prefixes):
+            return provider
+    return None
+
+
+def _meta_file():
+    return os.path.join(VAULT_DIR, "meta.json")
+
+
+def _utcnow():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def load_meta():
+    """Load the metadata sidecar ({"entries": {name: {...}}}); empty if missing."""
+    meta = _read_json_file(_meta_file(), {})
+    if not isinstance(meta, dict):
+        meta = {}
+    if not isinstance(meta.get("entries"), dict):
+        meta["entries"] = {}
+    _loaded[_meta_file()] = json.loads(json.dumps(meta))
+    return meta
+
+
+def _rebase_meta(base, ours, theirs):
+    """save_meta's rebase: per entry, and per top-level key for the rest."""
+    entries, _ = _rebase(base["entries"], ours["entries"], theirs["entries"])
+    merged, _ = _rebase({k: v for k, v in base.items() if k != "entries"},
+                        {k: v for k, v in ours.items() if k != "entries"},
+                        {k: v for k, v in theirs.items() if k != "entries"})
+    if theirs.get("index_key") not in (None, base.get("index_key"), ours.get("index_key")):
+        # Another process created the fingerprint key first. Keep it; the
+        # fingerprints we computed under ours are dropped and get backfilled.
+        merged["index_key"], merged["index_id"] = theirs["index_key"], theirs.get("index_id")
+        for name, entry in entries.items():
+            if entry is ours["entries"].get(name):
+                entry.pop("fp", None)
+    merged["entries"] = entries
+    return merged
+
+
+def save_meta(meta):
+    """Save the metadata sidecar. Metadata is advisory, so failures only warn."""
+    path = _meta_file()
+    try:
+        with _vault_lock():
+            base = _loaded.get(path)
+            current = _read_json_file(path, {"entries": {}}) if base is not None else None
+            if isinstance(current, dict) and isinstance(current.get("entries"), dict) \
+                    and current != base:
+                merged = _rebase_meta(base, meta, current)
+                meta.clear()
+                meta.update(merged)
+            _atomic_write(path, json.dumps(meta, indent=4, sort_keys=True).encode())
+            _loaded[path] = json.loads(json.dumps(meta))
+    except IOError as e:
+        print_warning(f"Could not save secret metadata: {e}")
 
 
-# CLI Commands
-def _resolve_secret_value(args, prompt):
-    """Get a secret value from --value, --stdin, or an interactive prompt.
+def _index_key(fernet, meta):
+    """The fingerprint key: 32 random bytes stored in meta.json, wrapped by the master key.
 
-    Falls back to getpass only when attached to a TTY, so piping into the
-    command (CI / scripts) never hangs waiting on console input.
+    Created on first use. `index_id` identifies the key without revealing it,
+    so two fingerprint sets can be checked for comparability up front.
     """
-    if getattr(args, 'value', None) is not None:
-        return args.value
-    if getattr(args, 'stdin', False):
-        return sys.stdin.readline().rstrip('\n')
-    if not sys.stdin.isatty():
-        # Piped input without --stdin: read it rather than blocking on getpass.
-        return sys.stdin.readline().rstrip('\n')
-    return getpass.getpass(prompt=prompt)
-
+    import hmac
+    wrapped = meta.get("index_key")
+    if wrapped:
+        try:
+            return fernet.decrypt(wrapped.encode())
+        except InvalidToken:
+            pass  # index from another master key (e.g. restored meta); start over
+    key = os.urandom(32)
+    meta["index_key"] = fernet.encrypt(key).decode()
+    meta["index_id"] = hmac.new(key, b"envlockr-index-id", hashlib.sha256).hexdigest()[:16]
+    for entry in meta["entries"].values():
+        entry.pop("fp", None)
+    return key
+
+
+def _fingerprint(index_key, plaintext):
+    """Keyed, ciphertext-independent fingerprint of a secret value."""
+    import hmac
+    return hmac.new(index_key, plaintext.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _record_meta(meta, name, plaintext, tags=None, fernet=None):
+    """Create or refresh the metadata entry for a secret that was just written."""
+    now = _utcnow()
+    entry = meta["entries"].get(name) or {"created": now}
+    entry["updated"] = now
+    entry["length"] = len(plaintext.encode())
+    entry["provider"] = _guess_provider(plaintext)
+    # A new entry continues the numbering of any history the name already has.
+    previous = entry.get("version")
+    entry["version"] = (_last_version(name) if previous is None else previous) + 1
+    if fernet is not None:
+        entry["fp"] = _fingerprint(_index_key(fernet, meta), plaintext)
+    if tags is not None:
+        entry["tags"] = sorted(set(tags))
+    entry.setdefault("tags", [])
+    meta["entries"][name] = entry
+    return entry
+
+
+def _ensure_fingerprints(fernet, vault, meta):
+    """Backfill fingerprints for entries written before they existed.
+
+    Decrypts only entries that lack one; returns True if meta changed.
+    """
+    wrapped = meta.get("index_key")
+    index_key = _index_key(fernet, meta)
+    changed = meta.get("index_key") != wrapped
+    for name, value in vault.items():
+        entry = meta["entries"].setdefault(name, {"tags": []})
+        if entry.get("fp"):
+            continue
+        plaintext = decrypt_secret(fernet, value, name)
+        if plaintext is not None:
+            entry["fp"] = _fingerprint(index_key, plaintext)
+            changed = True
+    return changed
 
-def add_secret(args):
-    """Add a new secret to the vault"""
-    fernet = load_or_create_key()
-    vault = load_vault()
 
-    if args.name in vault and not getattr(args, 'force', False):
-        print_warning(f"Secret '{args.name}' already exists.")
-        response = input("Overwrite? [y/N]: ").strip().lower()
-        if response != 'y':
-            print_info("Operation cancelled.")
-            return
-    
-    secret = _resolve_secret_value(args, "Enter secret value: ")
-    if not secret:
-        print_error("Secret value cannot be empty.")
-        return
+# --- Version history ---------------------------------------------------------
+# vault.json only ever holds the current ciphertext, so loading and listing
+# cost the same however much history there is. When save_vault overwrites or
+# removes an entry, the replaced ciphertext is appended to that secret's own
+# file, <vault>/history/<sha256(name)>.json, with its metadata version and
+# timestamps. Each append compacts the file: versions beyond ENVLOCKR_HISTORY
+# (default 10; 0 disables history) or replaced longer ago than
+# ENVLOCKR_HISTORY_MAX_AGE (e.g. 90d) are dropped. `history --compact` applies
+# the policy to every file, including those of deleted secrets.
 
-    encrypted = fernet.encrypt(secret.encode()).decode()
-    vault[args.name] = encrypted
-    save_vault(vault)
-    print_success(f"Secret '{args.name}' added successfully.")
+HISTORY_KEEP = 10
 
 
-def get_secret(args):
-    """Retrieve and display a secret"""
-    fernet = load_or_create_key()
-    vault = load_vault()
-    
-    if args.name not in vault:
-        print_error(f"Secret '{args.name}' not found.")
-        print_info("Use 'envlockr list' to see available secrets.")
-        return
-    
-    decrypted = decrypt_secret(fernet, vault[args.name])
-    if decrypted is not None:
-        print(decrypted)
+def _history_dir():
+    return os.path.join(VAULT_DIR, "history")
 
 
-def list_secrets(args):
-    """List all stored secret names"""
-    vault = load_vault()
-    
-    if not vault:
-        print_info("No secrets stored yet.")
-        print_info("Add your first secret: envlockr add MY_SECRET")
-        return
-    
-    print(f"{Colors.CYAN}🔐 Stored Secrets ({len(vault)}){Colors.NC}")
-    for name in sorted(vault.keys()):
-        print(f"   {Colors.BOLD}•{Colors.NC} {name}")
+def _history_file(name):
+    return os.path.join(_history_dir(), hashlib.sha256(name.encode()).hexdigest()[:32] + ".json")
 
 
-def copy_secret(args):
-    """Copy a secret to clipboard"""
-    if not PYPERCLIP_AVAILABLE:
-        print_error("Clipboard support not available.")
-        print_info("Install pyperclip: pip install pyperclip")
-        return
-    
-    fernet = load_or_create_key()
-    vault = load_vault()
-    
-    if args.name not in vault:
-        print_error(f"Secret '{args.name}' not found.")
-        return
-    
-    decrypted = decrypt_secret(fernet, vault[args.name])
-    if decrypted is not None:
+def _history_policy(keep=None, max_age=None):
+    """(versions to keep, oldest `replaced` time kept or None); env defaults."""
+    if keep is None:
+        raw = os.environ.get("ENVLOCKR_HISTORY", str(HISTORY_KEEP))
         try:
-            pyperclip.copy(decrypted)  # type: ignore[union-attr]
-            print_success(f"Secret '{args.name}' copied to clipboard.")
-        except Exception as e:
-            print_error(f"Failed to copy to clipboard: {e}")
-            print_info("Use 'envlockr get' to display the secret instead.")
+            keep = int(raw)
+        except ValueError:
+            keep = -1
+        if keep < 0:
+            print_error(f"Invalid ENVLOCKR_HISTORY '{raw}': expected a number of versions.")
+            sys.exit(1)
+    if max_age is None:
+        max_age = os.environ.get("ENVLOCKR_HISTORY_MAX_AGE") or None
+    if max_age and not re.match(r'^\d+[smhd]$', max_age.strip()):
+        print_error(f"Invalid history age '{max_age}': use e.g. 12h, 30d.")
+        sys.exit(1)
+    return keep, (_parse_audit_time(max_age) + "Z" if max_age else None)
 
 
-def delete_secret(args):
-    """Delete a secret from the vault"""
-    vault = load_vault()
-    
-    if args.name not in vault:
-        print_error(f"Secret '{args.name}' not found.")
-        return
-    
-    if not getattr(args, 'force', False):
-        response = input(f"Delete secret '{args.name}'? [y/N]: ").strip().lower()
-        if response != 'y':
-            print_info("Operation cancelled.")
-            return
-    
-    del vault[args.name]
-    save_vault(vault)
-    print_success(f"Secret '{args.name}' deleted.")
+def _compact_versions(versions, keep, cutoff):
+    if cutoff:
+        versions = [v for v in versions if v.get("replaced", "") >= cutoff]
+    return versions[-keep:] if keep else []
 
 
-def update_secret(args):
-    """Update an existing secret"""
-    fernet = load_or_create_key()
-    vault = load_vault()
-    
-    if args.name not in vault:
-        print_error(f"Secret '{args.name}' not found.")
-        print_info("Use 'envlockr add' to create a new secret.")
-        return
-    
-    secret = _resolve_secret_value(args, "Enter new secret value: ")
-    if not secret:
-        print_error("Secret value cannot be empty.")
-        return
+def _load_history(name):
+    """Archived versions of `name`, oldest first ([] if none)."""
+    data = _read_json_file(_history_file(name), {})
+    versions = data.get("versions") if isinstance(data, dict) else None
+    return versions if isinstance(versions, list) else []
 
-    encrypted = fernet.encrypt(secret.encode()).decode()
-    vault[args.name] = encrypted
-    save_vault(vault)
-    print_success(f"Secret '{args.name}' updated.")
 
+def _last_version(name):
+    versions = _load_history(name)
+    return versions[-1].get("version", 0) if versions else 0
 
-def export_secrets(args):
-    """Export all secrets to a .env file"""
-    fernet = load_or_create_key()
-    vault = load_vault()
-    
-    if not vault:
-        print_info("No secrets to export.")
-        return
-    
-    output_file = args.output if args.output else ".env"
-    
-    # Check if file exists
-    if os.path.exists(output_file) and not getattr(args, 'force', False):
-        print_warning(f"File '{output_file}' already exists.")
-        response = input("Overwrite? [y/N]: ").strip().lower()
-        if response != 'y':
-            print_info("Operation cancelled.")
-            return
-    
-    try:
-        exported_count = 0
-        with open(output_file, 'w') as f:
-            f.write(f"# Generated by EnvLockr v{__version__}\n")
-            f.write(f"# {len(vault)} secrets exported\n\n")
-            for name, encrypted_value in sorted(vault.items()):
-                decrypted = decrypt_secret(fernet, encrypted_value)
-                if decrypted is not None:
-                    # Handle multi-line values and special characters
-                    if '\n' in decrypted or '"' in decrypted:
-                        f.write(f'{name}="{decrypted}"\n')
-                    else:
-                        f.write(f"{name}={decrypted}\n")
-                    exported_count += 1
-        
-        print_success(f"Exported {exported_count} secrets to '{output_file}'")
-        print_warning(f"Remember: Add '{output_file}' to .gitignore!")
-    except PermissionError:
-        print_error(f"Permission denied writing to '{output_file}'")
-    except IOError as e:
-        print_error(f"Error exporting secrets: {e}")
 
+def _archive_versions(replaced, policy):
+    """Append replaced ciphertexts ({name: value}) to their history files.
+
+    Called by save_vault with the lock held, before meta.json records the
+    new versions, so the on-disk metadata still describes the old values.
+    All history files of one save are written in a single grouped pass.
+    Returns the values that compaction dropped.
+    """
+    keep, cutoff = policy
+    meta = _read_json_file(_meta_file(), {})
+    entries = meta.get("entries", {}) if isinstance(meta, dict) else {}
+    os.makedirs(_history_dir(), mode=0o700, exist_ok=True)
+    now = _utcnow()
+    expired, files = [], {}
+    for name, value in replaced.items():
+        versions = _load_history(name)
+        entry = entries.get(name) or {}
+        version = entry.get("version") or (versions[-1].get("version", 0) + 1 if versions else 1)
+        versions.append({"version": version, "value": value, "updated": entry.get("updated"),
+                         "length": entry.get("length"), "replaced": now})
+        kept = _compact_versions(versions, keep, cutoff)
+        expired.extend(v.get("value") or "" for v in versions if v not in kept)
+        files[_history_file(name)] = json.dumps({"name": name, "versions": kept},
+                                                indent=4).encode()
+    _atomic_write_many(files)
+    return expired
+
+
+# --- Vault integrity -----------------------------------------------------------
+# Opt-in with `envlockr fsck --init`. Every entry has a leaf: an HMAC of its
+# (name, ciphertext) under a subkey of the master key. Leaves are XORed into
+# one of INTEGRITY_BUCKETS buckets chosen by the name, and a binary hash tree
+# over the buckets gives a root. integrity.json keeps the tree and a write
+# counter, with a MAC over root, counter and entry count. A save updates only
+# the buckets of the entries it changed and their log2(buckets) ancestors, so
+# keeping the tree current costs a few HMACs and hashes per changed entry. The
+# counter is also kept in the OS keychain (integrity.counter without one).
+# `fsck` recomputes every leaf from vault.json, with no decryption. It
+# reports entries that were added, removed, altered or swapped between names,
+# by bucket, as well as an edited integrity.json and a vault rolled back to an
+# earlier state, whose counter is then behind the keychain's.
+
+INTEGRITY_BUCKETS = 256
+
+
+def _integrity_file():
+    return os.path.join(VAULT_DIR, "integrity.json")
+
+
+def _integrity_counter_file():
+    return os.path.join(VAULT_DIR, "integrity.counter")
+
+
+def _integrity_key(fernet):
+    return _subkey(fernet, "integrity")
+
+
+def _bucket_of(name):
+    return int.from_bytes(hashlib.sha256(name.encode()).digest()[:4], 'big') % INTEGRITY_BUCKETS
+
+
+def _leaf(key, name, value):
+    import hmac
+    encoded = name.encode()
+    return int.from_bytes(hmac.new(key, struct.pack('>I', len(encoded)) + encoded + value.encode(),
+                                   hashlib.sha256).digest(), 'big')
+
+
+def _rehash(tree, nodes):
+    """Recompute the given inner nodes and all their ancestors, bottom up."""
+    while nodes:
+        for i in sorted(nodes, reverse=True):
+            tree[i] = hashlib.sha256(tree[2 * i] + tree[2 * i + 1]).digest()
+        nodes = {i // 2 for i in nodes if i > 1}
+
+
+def _integrity_tree(key, vault):
+    """The full tree as a list of digests: root at [1], bucket b at [BUCKETS + b]."""
+    buckets = [0] * INTEGRITY_BUCKETS
+    for name, value in vault.items():
+        buckets[_bucket_of(name)] ^= _leaf(key, name, value)
+    tree = [b""] * INTEGRITY_BUCKETS + [b.to_bytes(32, 'big') for b in buckets]
+    _rehash(tree, set(range(INTEGRITY_BUCKETS // 2, INTEGRITY_BUCKETS)))
+    return tree
+
+
+def _integrity_mac(key, tree, counter, entries):
+    import hmac
+    message = json.dumps({"buckets": INTEGRITY_BUCKETS, "counter": counter,
+                          "entries": entries, "root": tree[1].hex()}, sort_keys=True)
+    return hmac.new(key, message.encode(), hashlib.sha256).hexdigest()
+
+
+def _load_integrity(key):
+    """(tree, counter, entries) from integrity.json; None if tracking is off.
+
+    Raises ValueError if the file is malformed or its MAC does not verify.
+    """
+    import hmac
+    state = _read_json_file(_integrity_file(), None)
+    if state is None:
+        return None
+    try:
+        tree = [b""] + [bytes.fromhex(h) for h in state["tree"]]
+        counter, entries = int(state["counter"]), int(state["entries"])
+        valid = state["buckets"] == INTEGRITY_BUCKETS and len(tree) == 2 * INTEGRITY_BUCKETS
+    except (KeyError, TypeError, ValueError):
+        valid = False
+    if not valid or not hmac.compare_digest(
+            str(state.get("mac")), _integrity_mac(key, tree, counter, entries)):
+        raise ValueError("integrity.json does not verify (edited, or written with another key)")
+    return tree, counter, entries
+
+
+def _integrity_counter():
+    """The last write counter recorded outside integrity.json (0 if none)."""
+    stored = None
+    if KEYRING_AVAILABLE:
+        ok, result = _keyring_call(keyring.get_password, KEYRING_SERVICE,
+                                   f"integrity:{os.path.abspath(VAULT_DIR)}")
+        if ok:
+            stored = result  # on failure `result` is the exception, not a value
+    try:
+        with open(_integrity_counter_file()) as f:
+            local = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        local = 0
+    try:
+        return max(int(stored or 0), local)
+    except (TypeError, ValueError):
+        return local
+
+
+def _write_integrity(key, tree, counter, entries):
+    """Write integrity.json, then the counter (keychain, else file)."""
+    _atomic_write(_integrity_file(), json.dumps({
+        "buckets": INTEGRITY_BUCKETS, "counter": counter, "entries": entries,
+        "tree": [node.hex() for node in tree[1:]],
+        "mac": _integrity_mac(key, tree, counter, entries)}).encode())
+    # integrity.json first: a crash in between leaves the counter behind the
+    # file (harmless), never ahead of it (a false rollback alarm).
+    if KEYRING_AVAILABLE:
+        ok, _ = _keyring_call(keyring.set_password, KEYRING_SERVICE,
+                              f"integrity:{os.path.abspath(VAULT_DIR)}", str(counter))
+        if ok:
+            return
+    _atomic_write(_integrity_counter_file(), f"{counter}\n".encode())
+
+
+def _init_integrity(fernet, vault):
+    """(Re)build the whole tree for `vault`; the counter keeps increasing."""
+    key = _integrity_key(fernet)
+    try:
+        state = _load_integrity(key)
+    except ValueError:
+        state = None
+    counter = max(_integrity_counter(), state[1] if state else 0) + 1
+    _write_integrity(key, _integrity_tree(key, vault), counter, len(vault))
+
+
+def _update_integrity(fernet, before, after):
+    """Carry the tree over a save from `before` to `after` (vault lock held).
+
+    A tree that no longer verifies, or is behind the keychain counter, is left
+    alone so that `fsck` keeps reporting it; a save never launders tampering.
+    """
+    if not os.path.exists(_integrity_file()):
+        return
+    # Tracking enabled by another process after save_vault checked for it.
+    key = _integrity_key(fernet or load_or_create_key())
+    try:
+        state = _load_integrity(key)
+    except ValueError:
+        state = None
+    if state is None or state[1] < _integrity_counter():
+        print_warning("Vault integrity check failed; not updating it. Run 'envlockr fsck'.")
+        return
+    tree, counter, entries = state
+    changed = {n for n in before.keys() | after.keys() if before.get(n) != after.get(n)}
+    buckets = {}
+    for name in changed:
+        b = INTEGRITY_BUCKETS + _bucket_of(name)
+        acc = buckets.get(b, int.from_bytes(tree[b], 'big'))
+        for side in (before, after):
+            if name in side:
+                acc ^= _leaf(key, name, side[name])
+        buckets[b] = acc
+    for b, acc in buckets.items():
+        tree[b] = acc.to_bytes(32, 'big')
+    _rehash(tree, {b // 2 for b in buckets})
+    _write_integrity(key, tree, counter + 1, entries + len(after) - len(before))
+
+
+def fsck_command(args):
+    """Verify vault.json against its integrity tree, without decrypting anything"""
+    fernet = load_or_create_key()
+    key = _integrity_key(fernet)
+    if getattr(args, 'init', False):
+        with _vault_lock():
+            vault = _read_json_file(VAULT_FILE, {}) or {}
+            _init_integrity(fernet, vault)
+        print_success(f"Integrity tracking enabled for {len(vault)} secret(s).")
+        print_info("Every save now updates it; run 'envlockr fsck' to verify.")
+        return
+
+    start = time.perf_counter()
+    with _vault_lock():
+        vault = _read_json_file(VAULT_FILE, {}) or {}
+        try:
+            state = _load_integrity(key)
+        except ValueError as e:
+            print_error(str(e))
+            sys.exit(1)
+        recorded = _integrity_counter()
+    if state is None:
+        print_error("Integrity tracking is not enabled for this vault.")
+        print_info("Run 'envlockr fsck --init' to start tracking it.")
+        sys.exit(1)
+
+    tree, counter, entries = state
+    actual = _integrity_tree(key, vault)
+    problems = []
+    if counter < recorded:
+        problems.append(f"vault rolled back: write {counter} is older than the last "
+                        f"recorded write {recorded}")
+    if entries != len(vault):
+        problems.append(f"{entries} secret(s) expected, {len(vault)} present")
+    if actual[1] != tree[1]:
+        bad = [b for b in range(INTEGRITY_BUCKETS)
+               if actual[INTEGRITY_BUCKETS + b] != tree[INTEGRITY_BUCKETS + b]]
+        suspects = sorted(n for n in vault if _bucket_of(n) in bad)
+        problems.append(f"{len(bad)} bucket(s) differ; secrets in them: "
+                        f"{', '.join(suspects) or '(none left)'}")
+    elapsed = (time.perf_counter() - start) * 1000
+    if problems:
+        for problem in problems:
+            print_error(problem)
+        print_info("If these changes are yours (e.g. a restored copy), "
+                   "'envlockr fsck --init' accepts the current vault.")
+        sys.exit(1)
+    if counter > recorded:
+        _write_integrity(key, tree, counter, entries)  # a crash left the counter behind
+    print_success(f"Vault OK: {len(vault)} secret(s) match the integrity tree "
+                  f"(write {counter}, {elapsed:.0f} ms, nothing decrypted).")
+
+
+# --- Entry ciphers -----------------------------------------------------------
+# Entries are Fernet tokens by default. With ENVLOCKR_CIPHER=aesgcm|chacha20,
+# entries written from then on use a one-pass AEAD instead: "<tag>:" followed by
+# base64url(nonce || ciphertext), with the entry name bound as associated data
+# so a value cannot be moved to another name. The key is an HKDF subkey of the
+# master key. Fernet tokens never contain ':', so both formats coexist and a
+# vault migrates lazily, entry by entry, as secrets are rewritten.
+ENTRY_CIPHERS = {"aesgcm": "g1", "chacha20": "c1"}
+_entry_aeads = {}
+
+
+def _entry_cipher():
+    """The cipher new entries are written with (ENVLOCKR_CIPHER, default fernet)."""
+    cipher = os.environ.get("ENVLOCKR_CIPHER", "fernet").strip().lower() or "fernet"
+    if cipher != "fernet" and cipher not in ENTRY_CIPHERS:
+        print_error(f"Unknown ENVLOCKR_CIPHER '{cipher}'.")
+        print_info("Choose one of: fernet, " + ", ".join(ENTRY_CIPHERS))
+        sys.exit(1)
+    return cipher
+
+
+def _entry_aead(fernet, tag):
+    """AEAD instance for an entry tag, derived once per master key."""
+    cache_key = (fernet.raw_key, tag)
+    aead = _entry_aeads.get(cache_key)
+    if aead is None:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+        if tag == ENTRY_CIPHERS["aesgcm"]:
+            aead = AESGCM(_subkey(fernet, "entry/aesgcm"))
+        elif tag == ENTRY_CIPHERS["chacha20"]:
+            aead = ChaCha20Poly1305(_subkey(fernet, "entry/chacha20"))
+        else:
+            raise InvalidToken
+        _entry_aeads[cache_key] = aead
+    return aead
+
+
+def _encrypt_value(fernet, name, plaintext):
+    """Encrypt one vault entry with the configured cipher; returns the stored string."""
+    data = plaintext.encode() if isinstance(plaintext, str) else bytes(plaintext)
+    cipher = _entry_cipher()
+    if cipher == "fernet":
+        return fernet.encrypt(data).decode()
+    tag = ENTRY_CIPHERS[cipher]
+    nonce = os.urandom(12)
+    sealed = _entry_aead(fernet, tag).encrypt(nonce, data, name.encode())
+    return tag + ":" + base64.urlsafe_b64encode(nonce + sealed).decode().rstrip("=")
+
+
+def _decrypt_value(fernet, encrypted_value, name=None):
+    """Decrypt one stored entry of any format; raises InvalidToken on failure."""
+    tag, sep, body = encrypted_value.partition(":")
+    if not sep:
+        return fernet.decrypt(encrypted_value.encode())
+    if tag == BLOB_TAG:
+        if not _blob_address(encrypted_value):
+            raise InvalidToken
+        return b"".join(_read_blob(fernet, body))
+    if name is None:
+        raise InvalidToken
+    try:
+        blob = base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))
+        return _entry_aead(fernet, tag).decrypt(blob[:12], blob[12:], name.encode())
+    except (InvalidTag, ValueError):
+        raise InvalidToken
+
+
+def decrypt_secret(fernet, encrypted_value, name=None):
+    """Safely decrypt a secret value (pass `name` for AEAD-format entries)"""
+    try:
+        return _decrypt_value(fernet, encrypted_value, name).decode()
+    except InvalidToken:
+        _metric_inc("envlockr_decrypt_failures_total")
+        print_error("Failed to decrypt secret. Key may have changed.")
+        print_info("If you regenerated your key, existing secrets cannot be recovered.")
+        return None
+    except Exception as e:
+        _metric_inc("envlockr_decrypt_failures_total")
+        print_error(f"Decryption error: {e}")
+        return None
+
+
+# --- Plaintext buffers -------------------------------------------------------
+# `run` and `mount` keep plaintext out of immutable str/bytes objects, which can
+# never be wiped: entries are decrypted straight into an anonymous mmap that is
+# mlock'ed (best effort — RLIMIT_MEMLOCK may refuse) and excluded from core
+# dumps, handed around as memoryviews, and zeroed when the command is done.
+
+SECRET_ARENA_MIN = 64 * 1024
+
+
+def _buffer_address(buf):
+    import ctypes
+    view = ctypes.c_char.from_buffer(buf)
+    try:
+        return ctypes.addressof(view)
+    finally:
+        del view
+
+
+def _memlock(buf, lock=True):
+    """mlock/munlock (VirtualLock on Windows) `buf`; returns True on success."""
+    import ctypes
+    try:
+        addr, size = ctypes.c_void_p(_buffer_address(buf)), ctypes.c_size_t(len(buf))
+        if os.name == 'nt':
+            kernel32 = ctypes.windll.kernel32
+            return bool((kernel32.VirtualLock if lock else kernel32.VirtualUnlock)(addr, size))
+        libc = ctypes.CDLL(None, use_errno=True)
+        return (libc.mlock if lock else libc.munlock)(addr, size) == 0
+    except (OSError, AttributeError, ValueError, TypeError):
+        return False
+
+
+def _wipe_bytes(data):
+    """Zero an immutable bytes object we own, in place (CPython only).
+
+    Used for the one transient copy the AEAD and subprocess APIs force on us.
+    Length 0/1 bytes are interned singletons and are never touched.
+    """
+    if type(data) is not bytes or len(data) < 2 or sys.implementation.name != 'cpython':
+        return
+    import ctypes
+    ctypes.memset(id(data) + bytes.__basicsize__ - 1, 0, len(data))
+
+
+class _SecretArena:
+    """Page-locked scratch memory for plaintext, zeroed on close."""
+
+    def __init__(self, size=0):
+        self._segments = []
+        self._free = memoryview(b"")
+        self._grow(size)
+
+    def _grow(self, size):
+        import mmap
+        mm = mmap.mmap(-1, max(size, SECRET_ARENA_MIN))
+        if hasattr(mmap, 'MADV_DONTDUMP'):
+            try:
+                mm.madvise(mmap.MADV_DONTDUMP)
+            except OSError:
+                pass
+        self._segments.append((mm, _memlock(mm)))
+        self._free = memoryview(mm)
+
+    def alloc(self, size):
+        """A writable, zero-filled memoryview of `size` bytes."""
+        if size > len(self._free):
+            self._grow(size)
+        view, self._free = self._free[:size], self._free[size:]
+        return view
+
+    def join(self, pieces):
+        """Concatenate str-free byte pieces into a new arena view."""
+        out = self.alloc(sum(len(p) for p in pieces))
+        pos = 0
+        for piece in pieces:
+            out[pos:pos + len(piece)] = piece
+            pos += len(piece)
+        return out
+
+    def close(self):
+        self._free.release()
+        for mm, locked in self._segments:
+            mm[:] = bytes(len(mm))
+            if locked:
+                _memlock(mm, lock=False)
+            try:
+                mm.close()
+            except BufferError:
+                pass  # a caller still holds a view; the pages are already zeroed
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _decrypt_fernet_into(arena, fernet, token):
+    """Fernet decrypt that writes plaintext only into the arena.
+
+    Same checks as Fernet.decrypt (version byte, HMAC before decrypting, PKCS7),
+    but via update_into so no intermediate plaintext bytes are allocated.
+    """
+    from cryptography.hazmat.primitives import hashes, hmac
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    try:
+        data = base64.urlsafe_b64decode(token)
+    except ValueError:
+        raise InvalidToken
+    if len(data) < 57 or data[0] != 0x80 or (len(data) - 57) % 16:
+        raise InvalidToken
+    mac = hmac.HMAC(fernet.raw_key[:16], hashes.SHA256())
+    mac.update(data[:-32])
+    try:
+        mac.verify(data[-32:])
+    except Exception:
+        raise InvalidToken
+    ciphertext = data[25:-32]
+    out = arena.alloc(len(ciphertext) + 15)
+    decryptor = Cipher(algorithms.AES(fernet.raw_key[16:]), modes.CBC(data[9:25])).decryptor()
+    n = decryptor.update_into(ciphertext, out)
+    decryptor.finalize()
+    pad = out[n - 1]
+    if not 1 <= pad <= 16 or any(b != pad for b in out[n - pad:n]):
+        out[:] = bytes(len(out))
+        raise InvalidToken
+    return out[:n - pad]
+
+
+def _decrypt_into(arena, fernet, encrypted_value, name):
+    """Decrypt one entry into `arena`; returns a memoryview, or None on failure."""
+    try:
+        if ":" not in encrypted_value:
+            return _decrypt_fernet_into(arena, fernet, encrypted_value.encode())
+        plaintext = _decrypt_value(fernet, encrypted_value, name)
+        view = arena.alloc(len(plaintext))
+        view[:] = plaintext
+        _wipe_bytes(plaintext)
+        return view
+    except InvalidToken:
+        _metric_inc("envlockr_decrypt_failures_total")
+        print_error("Failed to decrypt secret. Key may have changed.")
+        print_info("If you regenerated your key, existing secrets cannot be recovered.")
+        return None
+    except OSError as e:
+        _metric_inc("envlockr_decrypt_failures_total")
+        print_error(f"Error reading '{name}': {e}")
+        return None
+
+
+# --- Access audit log --------------------------------------------------------
+# One JSON line per secret touched by get/copy/run/export/render/mount, in
+# <vault>/audit.log. Each command's records are joined and appended with a
+# single write() on an O_APPEND descriptor, so concurrent processes never
+# interleave partial records. Past AUDIT_MAX_BYTES the log is renamed aside;
+# older rotated files are gzipped on the following rotation (giving any writer
+# still holding the old inode time to finish) and only AUDIT_KEEP are kept.
+# Set ENVLOCKR_AUDIT=0 to disable.
+
+AUDIT_MAX_BYTES = 1024 * 1024
+AUDIT_KEEP = 5
+
+
+def _audit_file():
+    return os.path.join(VAULT_DIR, "audit.log")
+
+
+def _rotate_audit_log():
+    import glob
+    import gzip
+    path = _audit_file()
+    now = time.time()
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) + f"{int(now * 1e6) % 1000000:06d}"
+    try:
+        os.rename(path, f"{path}.{stamp}-{os.getpid()}")
+    except OSError:
+        return  # another process rotated it first
+    rotated = sorted(glob.glob(path + ".*"))
+    for old in rotated[:-1]:
+        if old.endswith(".gz"):
+            continue
+        try:
+            with open(old, 'rb') as src, gzip.open(old + ".gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(old)
+        except OSError:
+            pass
+    archives = sorted(glob.glob(path + ".*"))
+    for old in archives[:-AUDIT_KEEP]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+def _audit(command, names):
+    """Append one record per secret name for `command`. Never raises."""
+    if not names or os.environ.get("ENVLOCKR_AUDIT", "1") == "0":
+        return
+    now = time.time()
+    ts = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)) + f".{int(now * 1000) % 1000:03d}Z"
+    pid = os.getpid()
+    data = "".join(
+        json.dumps({"ts": ts, "command": command, "name": name, "pid": pid,
+                    "profile": PROFILE}, separators=(',', ':')) + "\n"
+        for name in names).encode()
+    try:
+        path = _audit_file()
+        try:
+            if os.path.getsize(path) > AUDIT_MAX_BYTES:
+                _rotate_audit_log()
+        except OSError:
+            pass
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass  # auditing must never break secret access
+
+
+def _parse_audit_time(value):
+    """'30m' / '12h' / '7d' (relative) or an ISO date/time -> comparable ISO string."""
+    m = re.match(r'^(\d+)([smhd])$', value.strip())
+    if m:
+        seconds = int(m.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[m.group(2)]
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(time.time() - seconds))
+    return value.strip().replace(' ', 'T')
+
+
+def _audit_records():
+    """Yield audit records oldest first, across rotated (and gzipped) files."""
+    import glob
+    import gzip
+    path = _audit_file()
+    for archive in sorted(glob.glob(path + ".*")) + [path]:
+        opener = gzip.open if archive.endswith(".gz") else open
+        try:
+            with opener(archive, 'rt') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+
+
+def audit_command(args):
+    """Query the access audit log"""
+    since = _parse_audit_time(args.since) if getattr(args, 'since', None) else None
+    until = _parse_audit_time(args.until) if getattr(args, 'until', None) else None
+    name, command = getattr(args, 'name', None), getattr(args, 'cmd', None)
+    rows = [r for r in _audit_records()
+            if (not name or r.get("name") == name)
+            and (not command or r.get("command") == command)
+            and (not since or r.get("ts", "") >= since)
+            # Compared at the precision given, so `--until 2024-05-01` takes
+            # in that whole day and `--until 2024-05-01T10:00` that minute.
+            and (not until or r.get("ts", "")[:len(until)] <= until)]
+    limit = getattr(args, 'limit', None)
+    if limit is not None:
+        rows = rows[-limit:]
+
+    if getattr(args, 'json', False):
+        for row in rows:
+            print(json.dumps(row))
+        return
+    if not rows:
+        print_info("No matching audit records.")
+        return
+    for row in rows:
+        print(f"   {row.get('ts')}  {row.get('command', ''):<7} "
+              f"{Colors.BOLD}{row.get('name')}{Colors.NC}  pid={row.get('pid')}")
+
+
+# --- Secret interpolation ----------------------------------------------------
+# A value may reference other secrets as ${NAME}; "$${" escapes a literal "${".
+# References to names that are not in the vault are left untouched, so values
+# that merely contain shell-style placeholders keep working, and a value with
+# no reference at all is passed through verbatim ("$${" included), so values
+# stored before interpolation existed never change. A reference to a secret
+# that fails to decrypt is an error, never an empty splice.
+
+_REF_PATTERN = re.compile(r'\$\$\{|\$\{([A-Za-z_][A-Za-z0-9_]*)\}')
+_REF_PATTERN_BYTES = re.compile(_REF_PATTERN.pattern.encode())
+
+
+def _ref_name(match):
+    """Referenced name of a pattern match (str), or None for the "$${" escape."""
+    name = match.group(1)
+    return name.decode() if isinstance(name, bytes) else name
+
+
+def _references(value, vault):
+    """Names of vault secrets referenced by `value`, in order of appearance."""
+    pattern = _REF_PATTERN if isinstance(value, str) else _REF_PATTERN_BYTES
+    refs = []
+    for m in pattern.finditer(value):
+        name = _ref_name(m)
+        if name and name in vault and name not in refs:
+            refs.append(name)
+    return refs
+
+
+@_timed("decrypt")
+def _resolve_secrets(fernet, vault, wanted, interpolate=True, arena=None):
+    """Decrypt `wanted` (plus what they reference) and expand references.
+
+    Walks the dependency graph depth-first from the requested names only, so
+    `--only` decrypts just the transitive closure it needs. Every secret is
+    decrypted at most once; values are expanded in topological order. Raises
+    ValueError naming the cycle if references loop. Returns {name: value} for
+    the requested names that decrypted successfully — str values, or arena
+    memoryviews when an `arena` is given.
+    """
+    raw = {}
+    empty = "" if arena is None else b""
+
+    def plain(name):
+        if name not in raw:
+            if arena is None:
+                raw[name] = decrypt_secret(fernet, vault[name], name)
+            else:
+                raw[name] = _decrypt_into(arena, fernet, vault[name], name)
+        return raw[name]
+
+    if not interpolate:
+        return {n: plain(n) for n in wanted if n in vault and plain(n) is not None}
+
+    order, done, visiting = [], set(), []
+    for root in wanted:
+        if root not in vault or root in done:
+            continue
+        stack = [(root, iter(_references(plain(root) or empty, vault)))]
+        visiting.append(root)
+        while stack:
+            name, deps = stack[-1]
+            dep = next(deps, None)
+            if dep is None:
+                stack.pop()
+                visiting.pop()
+                done.add(name)
+                order.append(name)
+            elif dep in visiting:
+                cycle = visiting[visiting.index(dep):] + [dep]
+                raise ValueError("Reference cycle: " + " -> ".join(cycle))
+            elif dep not in done:
+                visiting.append(dep)
+                stack.append((dep, iter(_references(plain(dep) or empty, vault))))
+
+    resolved = {}
+    pattern = _REF_PATTERN if arena is None else _REF_PATTERN_BYTES
+    join = "".join if arena is None else arena.join
+
+    def expand(name, value):
+        # Splice slices of the value with referenced values; for arena views
+        # every piece is a view, so the result is assembled without copies.
+        matches = list(pattern.finditer(value))
+        if not any(_ref_name(m) in vault for m in matches):
+            return value
+        pieces, last = [], 0
+        for m in matches:
+            ref = _ref_name(m)
+            pieces.append(value[last:m.start()])
+            if ref is None:
+                pieces.append(value[m.start() + 1:m.end()])  # "$${" -> "${"
+            elif ref not in vault:
+                pieces.append(value[m.start():m.end()])
+            elif ref not in resolved:
+                raise ValueError(f"Secret '{name}' references '{ref}', which could not be decrypted.")
+            else:
+                pieces.append(resolved[ref])
+            last = m.end()
+        pieces.append(value[last:])
+        return join(pieces)
+
+    for name in order:
+        if raw[name] is not None:
+            resolved[name] = expand(name, raw[name])
+    return {n: resolved[n] for n in wanted if n in resolved}
+
+
+def _selected_names(args, vault):
+    """Names picked by --only (comma-separated), else every secret in the vault."""
+    if getattr(args, 'only', None):
+        return [n.strip() for n in args.only.split(',') if n.strip()]
+    return sorted(vault.keys())
+
+
+# CLI Commands
+def _resolve_secret_value(args, prompt):
+    """Get a secret value from --value, --stdin, or an interactive prompt.
+
+    Falls back to getpass only when attached to a TTY, so piping into the
+    command (CI / scripts) never hangs waiting on console input.
+    """
+    if getattr(args, 'value', None) is not None:
+        return args.value
+    if getattr(args, 'stdin', False) or not sys.stdin.isatty():
+        # Piped input without --stdin is read too, rather than blocking on getpass.
+        return b"".join(_stdin_chunks()).decode()
+    return getpass.getpass(prompt=prompt)
+
+
+def _stdin_chunks():
+    """All of stdin as UTF-8 chunks, minus one trailing newline."""
+    pending = ""
+    for piece in iter(lambda: sys.stdin.read(STREAM_CHUNK_SIZE), ""):
+        if pending:
+            yield pending.encode()
+        pending = piece
+    if pending.endswith("\n"):
+        pending = pending[:-2] if pending.endswith("\r\n") else pending[:-1]
+    yield pending.encode()
+
+
+def _secret_chunks(args, prompt):
+    """The new value as byte chunks from --file, --value, --stdin or a prompt.
+
+    A file (verbatim) and stdin are read STREAM_CHUNK_SIZE at a time, so a
+    large value is never held whole on its way into the blob store.
+    """
+    path = getattr(args, 'file', None)
+    if path:
+        with open(path, 'rb') as f:
+            yield from iter(lambda: f.read(STREAM_CHUNK_SIZE), b"")
+    elif getattr(args, 'value', None) is None and \
+            (getattr(args, 'stdin', False) or not sys.stdin.isatty()):
+        yield from _stdin_chunks()
+    else:
+        yield _resolve_secret_value(args, prompt).encode()
+
+
+def _store_secret(fernet, vault, args, prompt):
+    """Read, encrypt and save the value for args.name; False if nothing was written."""
+    meta = load_meta()
+    try:
+        stored = _store_chunks(fernet, args.name, _secret_chunks(args, prompt),
+                               _index_key(fernet, meta))
+    except OSError as e:
+        print_error(f"Error reading secret value: {e}")
+        return False
+    if stored is None:
+        print_error("Secret value cannot be empty.")
+        return False
+
+    vault[args.name], fields = stored
+    save_vault(vault, fernet)
+    entry = _record_meta(meta, args.name, "", getattr(args, 'tag', None))
+    entry.update(fields)
+    save_meta(meta)
+    return True
+
+
+def add_secret(args):
+    """Add a new secret to the vault"""
+    fernet = load_or_create_key()
+    vault = load_vault()
+
+    if args.name in vault and not getattr(args, 'force', False):
+        print_warning(f"Secret '{args.name}' already exists.")
+        response = input("Overwrite? [y/N]: ").strip().lower()
+        if response != 'y':
+            print_info("Operation cancelled.")
+            return
+    
+    if _store_secret(fernet, vault, args, "Enter secret value: "):
+        print_success(f"Secret '{args.name}' added successfully.")
+
+
+def get_secret(args):
+    """Retrieve and display a secret"""
+    fernet = load_or_create_key()
+    vault = load_vault()
+
+    version = getattr(args, 'version', None)
+    if version is not None:
+        value = _versioned_value(args.name, version, vault)
+        if value is None:
+            return
+    elif args.name not in vault:
+        print_error(f"Secret '{args.name}' not found.")
+        print_info("Use 'envlockr list' to see available secrets.")
+        return
+    else:
+        value = vault[args.name]
+
+    output = getattr(args, 'output', None)
+    if output:
+        _write_secret_file(fernet, args.name, value, output)
+        return
+    decrypted = decrypt_secret(fernet, value, args.name)
+    if decrypted is not None:
+        _audit("get", [args.name])
+        print(decrypted)
+
+
+def _write_secret_file(fernet, name, value, path):
+    """`get --output`: decrypt into a 0600 file, streaming blobs chunk by chunk.
+
+    Written to a temp file beside `path` and renamed only once the whole value
+    authenticated, so a failure never leaves partial plaintext at `path`.
+    """
+    address = _blob_address(value)
+    size = 0
+    try:
+        chunks = _read_blob(fernet, address) if address else [_decrypt_value(fernet, value, name)]
+        fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.",
+                                   dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except InvalidToken:
+        _metric_inc("envlockr_decrypt_failures_total")
+        print_error("Failed to decrypt secret. Key may have changed.")
+        sys.exit(1)
+    except OSError as e:
+        print_error(f"Error retrieving secret: {e}")
+        sys.exit(1)
+    _audit("get", [name])
+    print_success(f"Wrote '{name}' ({_format_size(size)}) to '{path}'")
+
+
+def _format_size(n):
+    """Human-readable byte count for `list --long`."""
+    if n is None:
+        return "-"
+    for unit in ("B", "KB", "MB"):
+        if n < 1024 or unit == "MB":
+            return f"{n} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+# Metadata fields `list --json` exposes; internal ones (fp, ...) stay private.
+LIST_JSON_FIELDS = ("created", "updated", "length", "provider", "tags", "version")
+
+
+def list_secrets(args):
+    """List all stored secret names (metadata only — never loads the key)"""
+    vault = load_vault()
+    entries = load_meta()["entries"]
+
+    tag = getattr(args, 'tag', None)
+    names = [n for n in vault if not tag or tag in entries.get(n, {}).get("tags", [])]
+
+    # Sort from metadata, newest/largest first; entries written before
+    # metadata existed sort last.
+    sort = getattr(args, 'sort', 'name')
+    if sort in ('created', 'updated'):
+        names.sort(key=lambda n: entries.get(n, {}).get(sort) or "", reverse=True)
+    elif sort == 'size':
+        names.sort(key=lambda n: entries.get(n, {}).get("length") or -1, reverse=True)
+    else:
+        names.sort()
+
+    if getattr(args, 'json', False):
+        rows = []
+        for name in names:
+            entry = entries.get(name, {})
+            row = {"name": name}
+            row.update((field, entry[field]) for field in LIST_JSON_FIELDS if field in entry)
+            rows.append(row)
+        print(json.dumps(rows, indent=2))
+        return
+
+    if not names:
+        if vault:
+            print_info(f"No secrets tagged '{tag}'.")
+            return
+        print_info("No secrets stored yet.")
+        print_info("Add your first secret: envlockr add MY_SECRET")
+        return
+
+    print(f"{Colors.CYAN}🔐 Stored Secrets ({len(names)}){Colors.NC}")
+    if getattr(args, 'long', False):
+        width = max(len(n) for n in names)
+        for name in names:
+            e = entries.get(name, {})
+            tags = ",".join(e.get("tags", [])) or "-"
+            print(f"   {Colors.BOLD}•{Colors.NC} {name:<{width}}  "
+                  f"{_format_size(e.get('length')):>8}  {e.get('updated') or '-':<20}  "
+                  f"{e.get('provider') or '-':<12}  {tags}")
+        return
+    for name in names:
+        print(f"   {Colors.BOLD}•{Colors.NC} {name}")
+
+
+def copy_secret(args):
+    """Copy a secret to clipboard"""
+    if not PYPERCLIP_AVAILABLE:
+        print_error("Clipboard support not available.")
+        print_info("Install pyperclip: pip install pyperclip")
+        return
+    
+    fernet = load_or_create_key()
+    vault = load_vault()
+    
+    if args.name not in vault:
+        print_error(f"Secret '{args.name}' not found.")
+        return
+    
+    decrypted = decrypt_secret(fernet, vault[args.name], args.name)
+    if decrypted is not None:
+        _audit("copy", [args.name])
+        try:
+            pyperclip.copy(decrypted)  # type: ignore[union-attr]
+            print_success(f"Secret '{args.name}' copied to clipboard.")
+        except Exception as e:
+            print_error(f"Failed to copy to clipboard: {e}")
+            print_info("Use 'envlockr get' to display the secret instead.")
+
+
+def delete_secret(args):
+    """Delete a secret from the vault"""
+    vault = load_vault()
+    
+    if args.name not in vault:
+        print_error(f"Secret '{args.name}' not found.")
+        return
+    
+    if not getattr(args, 'force', False):
+        response = input(f"Delete secret '{args.name}'? [y/N]: ").strip().lower()
+        if response != 'y':
+            print_info("Operation cancelled.")
+            return
+    
+    del vault[args.name]
+    save_vault(vault)
+    meta = load_meta()
+    if meta["entries"].pop(args.name, None) is not None:
+        save_meta(meta)
+    print_success(f"Secret '{args.name}' deleted.")
+
+
+def update_secret(args):
+    """Update an existing secret"""
+    fernet = load_or_create_key()
+    vault = load_vault()
+    
+    if args.name not in vault:
+        print_error(f"Secret '{args.name}' not found.")
+        print_info("Use 'envlockr add' to create a new secret.")
+        return
+    
+    if _store_secret(fernet, vault, args, "Enter new secret value: "):
+        print_success(f"Secret '{args.name}' updated.")
+
+
+def _versioned_value(name, version, vault):
+    """Ciphertext of `name` at `version` (current or archived); None if reported missing."""
+    if name in vault and load_meta()["entries"].get(name, {}).get("version") == version:
+        return vault[name]
+    for entry in _load_history(name):
+        if entry.get("version") == version:
+            return entry.get("value")
+    print_error(f"Version {version} of '{name}' not found.")
+    print_info(f"Use 'envlockr history {name}' to see the versions kept.")
+    return None
+
+
+def history_command(args):
+    """Show a secret's kept versions, or compact every history file"""
+    if getattr(args, 'compact', False):
+        _compact_history(args)
+        return
+    if not args.name:
+        print_error("Name a secret, or pass --compact.")
+        sys.exit(1)
+
+    vault = load_vault()
+    current = load_meta()["entries"].get(args.name, {}) if args.name in vault else None
+    versions = _load_history(args.name)
+    if current is None and not versions:
+        print_error(f"No history for '{args.name}'.")
+        return
 
-def import_secrets(args):
-    """Import secrets from a .env file"""
+    print(f"{Colors.CYAN}🕘 History of '{args.name}'{Colors.NC}")
+    if current is not None:
+        print(f"   {Colors.BOLD}v{current.get('version', '?')}{Colors.NC}  "
+              f"{current.get('updated') or '-':<20}  {_format_size(current.get('length')):>8}  (current)")
+    for entry in reversed(versions):
+        print(f"   v{entry.get('version', '?')}  {entry.get('updated') or '-':<20}  "
+              f"{_format_size(entry.get('length')):>8}  replaced {entry.get('replaced')}")
+    if current is None:
+        print_info(f"'{args.name}' is deleted; `envlockr rollback {args.name}` restores it.")
+
+
+def _compact_history(args):
+    """Apply the retention policy to every history file."""
+    import glob
+    keep, cutoff = _history_policy(getattr(args, 'keep', None), getattr(args, 'max_age', None))
+    if not keep:
+        print_info("History is disabled (keep 0); nothing compacted.")
+        return
+    dropped = files = 0
+    expired = set()
+    with _vault_lock():
+        for path in glob.glob(os.path.join(_history_dir(), "*.json")):
+            data = _read_json_file(path, None)
+            if not isinstance(data, dict) or not isinstance(data.get("versions"), list):
+                continue
+            kept = _compact_versions(data["versions"], keep, cutoff)
+            if len(kept) == len(data["versions"]):
+                continue
+            dropped += len(data["versions"]) - len(kept)
+            files += 1
+            expired.update(_blob_address(v.get("value") or "")
+                           for v in data["versions"] if v not in kept)
+            if kept:
+                data["versions"] = kept
+                _atomic_write(path, json.dumps(data, indent=4).encode())
+            else:
+                os.remove(path)
+        _gc_blobs(expired - {None})
+    print_success(f"Dropped {dropped} old version(s) from {files} history file(s).")
+
+
+def rollback_command(args):
+    """Restore an earlier version of a secret (itself kept in history)"""
+    fernet = load_or_create_key()
+    vault = load_vault()
+    versions = _load_history(args.name)
+    if not versions:
+        print_error(f"No history for '{args.name}'.")
+        return
+
+    version = getattr(args, 'version', None)
+    if version is None:
+        target = versions[-1]  # the most recently replaced value
+    else:
+        target = next((v for v in versions if v.get("version") == version), None)
+        if target is None:
+            print_error(f"Version {version} of '{args.name}' not found.")
+            print_info(f"Use 'envlockr history {args.name}' to see the versions kept.")
+            return
+
+    meta = load_meta()
+    try:
+        fields = _value_fields(fernet, args.name, target["value"], _index_key(fernet, meta))
+    except InvalidToken:
+        _metric_inc("envlockr_decrypt_failures_total")
+        print_error(f"Failed to decrypt version {target.get('version')} of '{args.name}'.")
+        sys.exit(1)
+    except OSError as e:
+        print_error(f"Error reading version {target.get('version')} of '{args.name}': {e}")
+        sys.exit(1)
+    vault[args.name] = target["value"]
+    save_vault(vault, fernet)
+    entry = _record_meta(meta, args.name, "")
+    entry.update(fields)
+    save_meta(meta)
+    print_success(f"Secret '{args.name}' rolled back to version {target.get('version')} "
+                  f"(now version {entry['version']}).")
+
+
+# --- Batch transactions ------------------------------------------------------
+# `batch` applies newline-delimited JSON ops, one per line:
+#   {"op": "add", "name": "API_KEY", "value": "...", "tags": ["prod"], "force": false}
+#   {"op": "update", "name": "API_KEY", "value": "..."}
+#   {"op": "delete", "name": "OLD_KEY"}
+#   {"op": "rename", "name": "OLD", "to": "NEW", "force": false}
+# Every op is validated against the vault as it would be at that point in the
+# batch before anything is encrypted; then the whole batch is written with one
+# vault save and one metadata save, or not at all.
+
+BATCH_OPS = ('add', 'update', 'delete', 'rename')
+
+
+def _parse_batch(lines, names):
+    """Validate NDJSON ops against `names` (the vault's keys).
+
+    Returns (ops, errors); errors are "line N: message" strings.
+    """
+    ops, errors = [], []
+    present = set(names)
+    for line_num, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            op = json.loads(line)
+        except ValueError as e:
+            errors.append(f"line {line_num}: invalid JSON ({e})")
+            continue
+        if not isinstance(op, dict) or op.get("op") not in BATCH_OPS:
+            errors.append(f"line {line_num}: \"op\" must be one of {', '.join(BATCH_OPS)}")
+            continue
+        kind, name = op["op"], op.get("name")
+        if not isinstance(name, str) or not name:
+            errors.append(f"line {line_num}: {kind} needs a \"name\"")
+            continue
+        problem = None
+        if kind in ('add', 'update'):
+            if not isinstance(op.get("value"), str) or not op["value"]:
+                problem = "value must be a non-empty string"
+            elif op.get("tags") is not None and not (
+                    isinstance(op["tags"], list) and all(isinstance(t, str) for t in op["tags"])):
+                problem = "tags must be a list of strings"
+            elif kind == 'add' and name in present and not op.get("force"):
+                problem = "already exists (set \"force\": true to overwrite)"
+            elif kind == 'update' and name not in present:
+                problem = "not found"
+        elif name not in present:
+            problem = "not found"
+        elif kind == 'rename':
+            to = op.get("to")
+            if not isinstance(to, str) or not to:
+                problem = "rename needs a \"to\""
+            elif to in present and to != name and not op.get("force"):
+                problem = f"'{to}' already exists (set \"force\": true to overwrite)"
+        if problem:
+            errors.append(f"line {line_num}: {kind} '{name}': {problem}")
+            continue
+        if kind == 'delete':
+            present.discard(name)
+        elif kind == 'rename':
+            present.discard(name)
+            present.add(op["to"])
+        else:
+            present.add(name)
+        op["line"] = line_num
+        ops.append(op)
+    return ops, errors
+
+
+def batch_command(args):
+    """Apply add/update/delete/rename ops from NDJSON in one all-or-nothing write"""
+    source = getattr(args, 'file', None) or '-'
+    try:
+        if source == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(source, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+    except OSError as e:
+        print_error(f"Error reading batch: {e}")
+        sys.exit(1)
+
+    vault = load_vault()
+    ops, errors = _parse_batch(lines, vault)
+    if errors:
+        for error in errors:
+            print_error(error)
+        print_error(f"{len(errors)} invalid op(s) — nothing was written.")
+        sys.exit(1)
+    if not ops:
+        print_info("No ops to apply.")
+        return
+
+    def describe(op):
+        return f"{op['name']} -> {op['to']}" if op["op"] == 'rename' else op["name"]
+
+    if getattr(args, 'dry_run', False):
+        print_info(f"Dry run: {len(ops)} valid op(s), nothing written")
+        for op in ops:
+            print(f"   {op['op']:<7} {describe(op)}")
+        return
+
+    fernet = load_or_create_key()
+    meta = load_meta()
+    index_key = _index_key(fernet, meta)
+    for op in ops:
+        kind, name = op["op"], op["name"]
+        if kind in ('add', 'update'):
+            vault[name], fields = _store_text(fernet, name, op["value"], index_key)
+            _record_meta(meta, name, "", op.get("tags")).update(fields)
+        elif kind == 'delete':
+            del vault[name]
+            meta["entries"].pop(name, None)
+        elif op["to"] != name:
+            value = vault.pop(name)
+            if ":" in value and not _blob_address(value):
+                # AEAD entries are bound to their name: re-encrypt under the new one.
+                try:
+                    plaintext = _decrypt_value(fernet, value, name)
+                except InvalidToken:
+                    print_error(f"line {op['line']}: cannot decrypt '{name}' — nothing was written.")
+                    sys.exit(1)
+                value = _encrypt_value(fernet, op["to"], plaintext)
+                _wipe_bytes(plaintext)
+            vault[op["to"]] = value
+            entry = meta["entries"].pop(name, None)
+            if entry is not None:
+                meta["entries"][op["to"]] = entry
+
+    # One write for the whole batch.
+    save_vault(vault, fernet)
+    save_meta(meta)
+
+    counts = {kind: sum(1 for op in ops if op["op"] == kind) for kind in BATCH_OPS}
+    for op in ops:
+        print(f"   ✓ {op['op']:<7} {describe(op)}")
+    print_success(f"Applied {len(ops)} op(s) in one write: " +
+                  ", ".join(f"{counts[k]} {k}" for k in BATCH_OPS if counts[k]))
+
+
+EXPORT_FORMATS = ('dotenv', 'docker', 'json')
+FIFO_TIMEOUT = 60.0
+
+
+def _render_export(values, fmt):
+    """Render decrypted {name: value} as .env, docker --env-file or JSON text.
+
+    docker env-files take values literally, one per line, so multi-line values
+    are left out of that format (with a warning).
+    """
+    if fmt == 'json':
+        return json.dumps({n: values[n] for n in sorted(values)}, indent=2) + "\n"
+    lines = [f"# Generated by EnvLockr v{__version__}", f"# {len(values)} secrets exported", ""]
+    for name in sorted(values):
+        decrypted = values[name]
+        if fmt == 'docker':
+            if '\n' in decrypted:
+                print_warning(f"'{name}' is multi-line; docker env-files can't hold it, skipping.")
+                continue
+            lines.append(f"{name}={decrypted}")
+        # Handle multi-line values and special characters
+        elif '\n' in decrypted or '"' in decrypted:
+            lines.append(f'{name}="{decrypted}"')
+        else:
+            lines.append(f"{name}={decrypted}")
+    return "\n".join(lines) + "\n"
+
+
+def _open_fifo_writer(path, timeout):
+    """Wait up to `timeout` seconds for a reader to open the FIFO at `path`;
+    returns a blocking write fd, or None on timeout."""
+    import errno
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            if e.errno != errno.ENXIO:  # ENXIO: no reader yet
+                raise
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+            continue
+        os.set_blocking(fd, True)
+        return fd
+
+
+def _export_fifo(path, data, timeout):
+    """Serve `data` to the first reader of a new 0600 named pipe at `path`.
+
+    The pipe is unlinked as soon as that reader connects (so no second reader
+    can), or after `timeout`, Ctrl-C or SIGTERM: nothing is left on disk.
+    Returns True once the whole payload was read.
+    """
+    import signal
+
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    os.mkfifo(path, 0o600)
+    previous = signal.signal(signal.SIGTERM, _terminate)
+    try:
+        os.chmod(path, 0o600)  # whatever the umask
+        print_info(f"Waiting up to {timeout:g}s for a reader on '{path}' (Ctrl-C to cancel)...")
+        fd = _open_fifo_writer(path, timeout)
+        os.remove(path)
+        if fd is None:
+            print_error(f"No reader opened '{path}' within {timeout:g}s; removed it.")
+            return False
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return True
+    except BrokenPipeError:
+        print_error("The reader closed the pipe before reading everything.")
+        return False
+    except KeyboardInterrupt:
+        print_info("Cancelled.")
+        return False
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def export_secrets(args):
+    """Export secrets to a .env file, or stream them once through a named pipe"""
     fernet = load_or_create_key()
     vault = load_vault()
     
-    input_file = args.file
+    if not vault:
+        print_info("No secrets to export.")
+        return
+    
+    output_file = args.output if args.output else ".env"
+    fifo = getattr(args, 'fifo', None)
+    fmt = getattr(args, 'format', None) or 'dotenv'
+    if fifo:
+        if not hasattr(os, 'mkfifo'):
+            print_error("--fifo needs named pipes (POSIX).")
+            sys.exit(1)
+        if os.path.lexists(fifo):
+            print_error(f"'{fifo}' already exists; --fifo creates a new pipe.")
+            sys.exit(1)
+    elif os.path.exists(output_file) and not getattr(args, 'force', False):
+        print_warning(f"File '{output_file}' already exists.")
+        response = input("Overwrite? [y/N]: ").strip().lower()
+        if response != 'y':
+            print_info("Operation cancelled.")
+            return
     
+    wanted = _selected_names(args, vault)
+    for name in wanted:
+        if name not in vault:
+            print_warning(f"Secret '{name}' not found, skipping.")
+    try:
+        values = _resolve_secrets(fernet, vault, wanted,
+                                  interpolate=not getattr(args, 'no_interpolate', False))
+    except ValueError as e:
+        print_error(str(e))
+        sys.exit(1)
+    content = _render_export(values, fmt)
+
+    if fifo:
+        try:
+            served = _export_fifo(fifo, content.encode(), getattr(args, 'timeout', None) or FIFO_TIMEOUT)
+        except OSError as e:
+            print_error(f"Error creating pipe '{fifo}': {e}")
+            sys.exit(1)
+        if not served:
+            sys.exit(1)
+        _audit("export", sorted(values))
+        print_success(f"Streamed {len(values)} secrets through '{fifo}' (pipe removed)")
+        return
+
+    try:
+        with open(output_file, 'w') as f:
+            _audit("export", sorted(values))
+            f.write(content)
+
+        print_success(f"Exported {len(values)} secrets to '{output_file}'")
+        print_warning(f"Remember: Add '{output_file}' to .gitignore!")
+    except PermissionError:
+        print_error(f"Permission denied writing to '{output_file}'")
+    except IOError as e:
+        print_error(f"Error exporting secrets: {e}")
+
+
+def _scan_template(path):
+    """First pass over a template: {name: [line numbers]} for every ${NAME}."""
+    refs = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for line_num, line in enumerate(f, 1):
+            for m in _REF_PATTERN.finditer(line):
+                if m.group(1):
+                    refs.setdefault(m.group(1), []).append(line_num)
+    return refs
+
+
+def render_template(args):
+    """Render a template, substituting ${NAME} with decrypted secrets"""
+    template = args.template
+    if not os.path.isfile(template):
+        print_error(f"Template '{template}' not found.")
+        sys.exit(1)
+
+    try:
+        refs = _scan_template(template)
+    except (IOError, UnicodeDecodeError) as e:
+        print_error(f"Error reading template: {e}")
+        sys.exit(1)
+
+    # Diagnostics go to stderr so they never end up inside rendered stdout.
+    with contextlib.redirect_stdout(sys.stderr):
+        vault = load_vault()
+        undefined = {n: lines for n, lines in refs.items() if n not in vault}
+        keep_undefined = getattr(args, 'allow_undefined', False)
+        for name, lines in sorted(undefined.items(), key=lambda item: item[1][0]):
+            where = ", ".join(str(n) for n in lines)
+            report = print_warning if keep_undefined else print_error
+            report(f"Undefined secret '{name}' referenced on line(s) {where}")
+        if undefined and not keep_undefined:
+            print_info("Add the missing secrets or pass --allow-undefined to keep them verbatim.")
+            sys.exit(1)
+
+    # Ask before decrypting anything, so a declined overwrite costs nothing.
+    output_file = getattr(args, 'output', None)
+    if output_file and os.path.exists(output_file) and not getattr(args, 'force', False):
+        print_warning(f"File '{output_file}' already exists.")
+        response = input("Overwrite? [y/N]: ").strip().lower()
+        if response != 'y':
+            print_info("Operation cancelled.")
+            return
+
+    with contextlib.redirect_stdout(sys.stderr):
+        # Decrypt only what the template references, in one batch.
+        fernet = load_or_create_key()
+        wanted = sorted(n for n in refs if n in vault)
+        try:
+            values = _resolve_secrets(fernet, vault, wanted)
+        except ValueError as e:
+            print_error(str(e))
+            sys.exit(1)
+        failed = [n for n in wanted if n not in values]
+        for name in failed:
+            where = ", ".join(str(n) for n in refs[name])
+            print_error(f"Secret '{name}' referenced on line(s) {where} could not be decrypted")
+        if failed:
+            print_info("Nothing was rendered.")
+            sys.exit(1)
+        _audit("render", sorted(values))
+
+    def expand(m):
+        if m.group(1) is None:
+            return "${"
+        return values.get(m.group(1), m.group(0))
+
+    # Second pass streams line by line, so template size never matters.
+    with open(template, 'r', encoding='utf-8', newline='') as src:
+        if not output_file:
+            for line in src:
+                sys.stdout.write(_REF_PATTERN.sub(expand, line))
+            sys.stdout.flush()
+            return
+        # mkstemp: random name, O_EXCL and 0600 — never a pre-planted file.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)),
+                                   prefix=f".{os.path.basename(output_file)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as out:
+                for line in src:
+                    out.write(_REF_PATTERN.sub(expand, line))
+            os.replace(tmp, output_file)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+    print_success(f"Rendered {len(values)} secret(s) into '{output_file}'")
+
+
+# --- Importers ---------------------------------------------------------------
+# Each importer is a generator over an open file yielding (where, key, value);
+# an unparseable record yields (where, None, reason) so the caller can report
+# and count it. Line-oriented formats stream; JSON/YAML documents are parsed
+# whole because the stdlib has no incremental parser for them.
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+        return value[1:-1]
+    return value
+
+
+def _import_dotenv(f):
+    """KEY=value lines; `export KEY=...`, comments and quoted values allowed."""
+    for line_num, line in enumerate(f, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('export '):
+            line = line[len('export '):].lstrip()
+        if '=' not in line:
+            yield (f"Line {line_num}", None, "Invalid format")
+            continue
+        # Split on first = only (value may contain =)
+        key, value = line.split('=', 1)
+        yield (f"Line {line_num}", key.strip(), _unquote(value.strip()))
+
+
+def _import_docker(f):
+    """docker --env-file: values are literal; a bare KEY copies the current env."""
+    for line_num, line in enumerate(f, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        if '=' not in line:
+            key = line.strip()
+            if key in os.environ:
+                yield (f"Line {line_num}", key, os.environ[key])
+            else:
+                yield (f"Line {line_num}", None, f"'{key}' is not set in the environment")
+            continue
+        key, value = line.split('=', 1)
+        yield (f"Line {line_num}", key.strip(), value)
+
+
+def _flat_items(mapping, where):
+    for key, value in mapping.items():
+        if isinstance(value, (dict, list)):
+            yield (where, None, f"'{key}' is not a scalar")
+        elif value is None:
+            yield (where, None, f"'{key}' has no value")
+        elif isinstance(value, str):
+            yield (where, key, value)
+        else:
+            yield (where, key, json.dumps(value))
+
+
+def _k8s_secret_items(doc, where):
+    """Key/values of a k8s Secret manifest: base64 `data` plus plain `stringData`."""
+    for key, value in (doc.get("data") or {}).items():
+        try:
+            yield (where, key, base64.b64decode(value, validate=True).decode('utf-8'))
+        except (ValueError, TypeError, UnicodeDecodeError):
+            yield (where, None, f"'{key}' is not valid base64 text")
+    yield from _flat_items(doc.get("stringData") or {}, where)
+
+
+def _import_json(f):
+    """A flat {"KEY": "value"} object, or a k8s Secret / List in JSON form."""
+    try:
+        doc = json.load(f)
+    except ValueError as e:
+        yield ("JSON", None, f"Invalid JSON: {e}")
+        return
+    if isinstance(doc, dict) and doc.get("kind") in ("Secret", "List"):
+        yield from _import_k8s_docs([doc])
+    elif isinstance(doc, dict):
+        yield from _flat_items(doc, "JSON")
+    else:
+        yield ("JSON", None, "Expected a top-level object")
+
+
+def _yaml_documents(f):
+    if not YAML_AVAILABLE:
+        return None
+    import yaml
+    return [d for d in yaml.safe_load_all(f) if d is not None]
+
+
+def _import_yaml(f):
+    """A flat YAML mapping (requires PyYAML), or k8s Secret manifests."""
+    try:
+        docs = _yaml_documents(f)
+    except Exception as e:
+        yield ("YAML", None, f"Invalid YAML: {e}")
+        return
+    if docs is None:
+        yield ("YAML", None, "YAML support not installed (pip install pyyaml)")
+        return
+    if any(isinstance(d, dict) and d.get("kind") in ("Secret", "List") for d in docs):
+        yield from _import_k8s_docs(docs)
+        return
+    for doc in docs:
+        if isinstance(doc, dict):
+            yield from _flat_items(doc, "YAML")
+
+
+def _import_k8s_docs(docs):
+    for doc in docs:
+        items = doc.get("items") if doc.get("kind") == "List" else [doc]
+        for item in items or []:
+            if isinstance(item, dict) and item.get("kind") == "Secret":
+                name = (item.get("metadata") or {}).get("name", "?")
+                yield from _k8s_secret_items(item, f"Secret {name}")
+
+
+def _import_k8s_minimal(f):
+    """Fallback for k8s Secret YAML without PyYAML: top-level data/stringData maps."""
+    section, name = None, "?"
+    for line_num, line in enumerate(f, 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        if stripped == '---':
+            section = None
+            continue
+        if not line[0].isspace():
+            key = stripped.split(':', 1)[0]
+            section = key if key in ("data", "stringData") else None
+            continue
+        if stripped.startswith('name:') and section is None:
+            name = _unquote(stripped.split(':', 1)[1].strip())
+            continue
+        if section is None:
+            continue
+        if ':' not in stripped:
+            yield (f"Line {line_num}", None, "Invalid format")
+            continue
+        key, value = stripped.split(':', 1)
+        value = _unquote(value.strip())
+        if section == "data":
+            yield from _k8s_secret_items({"data": {key.strip(): value}}, f"Secret {name}")
+        else:
+            yield (f"Line {line_num}", key.strip(), value)
+
+
+def _import_k8s(f):
+    """Kubernetes Secret manifests (YAML or JSON, single or multi-document)."""
+    head = f.read(1)
+    f.seek(0)
+    if head == '{':
+        yield from _import_json(f)
+    elif YAML_AVAILABLE:
+        yield from _import_yaml(f)
+    else:
+        yield from _import_k8s_minimal(f)
+
+
+def _env_name(label):
+    """Turn a free-form label ("GitHub token") into an env-var name (GITHUB_TOKEN)."""
+    name = re.sub(r'[^A-Za-z0-9_]+', '_', label.strip()).strip('_').upper()
+    return f"_{name}" if name[:1].isdigit() else name
+
+
+def _import_csv(f):
+    """Password-manager CSV exports: a name/title column plus a value/password column."""
+    import csv
+    reader = csv.DictReader(f)
+    fields = {(h or "").strip().lower(): h for h in reader.fieldnames or []}
+    name_col = next((fields[c] for c in ("name", "title", "key", "variable") if c in fields), None)
+    value_col = next((fields[c] for c in ("value", "password", "secret") if c in fields), None)
+    if not name_col or not value_col:
+        yield ("CSV", None, "Need a name/title column and a value/password column")
+        return
+    for row_num, row in enumerate(reader, 2):
+        label, value = row.get(name_col) or "", row.get(value_col) or ""
+        if not value:
+            yield (f"Row {row_num}", None, "Empty value")
+            continue
+        yield (f"Row {row_num}", _env_name(label), value)
+
+
+IMPORTERS = {
+    'dotenv': _import_dotenv,
+    'docker': _import_docker,
+    'json': _import_json,
+    'yaml': _import_yaml,
+    'k8s': _import_k8s,
+    'csv': _import_csv,
+}
+
+
+def _sniff_import_format(path):
+    """Guess the importer from the extension, then from the first few KB."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+            head = f.read(4096)
+    except IOError:
+        head = ""
+    looks_k8s = re.search(r'^kind:\s*(Secret|List)\b', head, re.M) or \
+        re.search(r'"kind"\s*:\s*"(Secret|List)"', head)
+    if looks_k8s:
+        return 'k8s'
+    if ext == '.json' or head.lstrip().startswith('{'):
+        return 'json'
+    if ext in ('.yaml', '.yml'):
+        return 'yaml'
+    first_line = head.splitlines()[0].lower() if head else ""
+    if ext == '.csv' or (',' in first_line and
+                         re.search(r'\b(name|title)\b', first_line) and
+                         re.search(r'\b(password|value|secret)\b', first_line)):
+        return 'csv'
+    return 'dotenv'
+
+
+def import_secrets(args):
+    """Import secrets from a .env, docker env-file, JSON, YAML, k8s Secret or CSV file"""
+    input_file = args.file
+
     if not os.path.exists(input_file):
         print_error(f"File '{input_file}' not found.")
         return
-    
+
+    fmt = getattr(args, 'format', None) or 'auto'
+    if fmt == 'auto':
+        fmt = _sniff_import_format(input_file)
+    importer = IMPORTERS[fmt]
+    dry_run = getattr(args, 'dry_run', False)
+    force = getattr(args, 'force', False)
+
+    vault = load_vault()
+    fernet = load_or_create_key()
+
+    # Parse everything first; later duplicates win, like a shell sourcing a file.
+    pending = {}
+    skipped = 0
     try:
-        imported = 0
-        skipped = 0
-        
-        with open(input_file, 'r') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                
-                # Skip empty lines and comments
-                if not line or line.startswith('#'):
-                    continue
-                
-                # Parse KEY=value format
-                if '=' not in line:
-                    print_warning(f"Line {line_num}: Invalid format, skipping")
+        with open(input_file, 'r', encoding='utf-8-sig', newline='') as f:
+            for where, key, value in importer(f):
+                if key is None:
+                    print_warning(f"{where}: {value}, skipping")
                     skipped += 1
-                    continue
-                
-                # Split on first = only (value may contain =)
-                key, value = line.split('=', 1)
-                key = key.strip()
-                value = value.strip()
-                
-                # Remove surrounding quotes if present
-                if (value.startswith('"') and value.endswith('"')) or \
-                   (value.startswith("'") and value.endswith("'")):
-                    value = value[1:-1]
-                
-                if not key:
-                    print_warning(f"Line {line_num}: Empty key, skipping")
+                elif not key:
+                    print_warning(f"{where}: Empty key, skipping")
                     skipped += 1
-                    continue
-                
-                # Check for existing secret
-                if key in vault and not getattr(args, 'force', False):
-                    print_warning(f"Secret '{key}' already exists, skipping (use --force to overwrite)")
-                    skipped += 1
-                    continue
-                
-                # Encrypt and store
-                encrypted = fernet.encrypt(value.encode()).decode()
-                vault[key] = encrypted
-                imported += 1
-        
-        save_vault(vault)
-        print_success(f"Imported {imported} secrets from '{input_file}'")
-        if skipped > 0:
-            print_info(f"Skipped {skipped} entries")
-        print_warning(f"Consider deleting '{input_file}' now that secrets are secure!")
-        
+                else:
+                    pending[key] = value
     except PermissionError:
         print_error(f"Permission denied reading '{input_file}'")
-    except IOError as e:
+        return
+    except (IOError, UnicodeDecodeError) as e:
         print_error(f"Error reading file: {e}")
+        return
+
+    # Classify against the current vault. Only colliding entries are decrypted.
+    plan = []
+    for key in sorted(pending):
+        if key not in vault:
+            plan.append(('+', key))
+        elif decrypt_secret(fernet, vault[key], key) == pending[key]:
+            plan.append(('=', key))
+        elif force:
+            plan.append(('~', key))
+        else:
+            plan.append(('!', key))
+
+    if dry_run:
+        labels = {'+': "new", '~': "changed", '=': "unchanged",
+                  '!': "exists, differs (use --force to overwrite)"}
+        print_info(f"Dry run: {input_file} ({fmt}) against the current vault")
+        for action, key in plan:
+            print(f"   {action} {key}  ({labels[action]})")
+        return
+
+    meta = load_meta()
+    index_key = _index_key(fernet, meta)
+    imported = 0
+    for action, key in plan:
+        if action == '!':
+            print_warning(f"Secret '{key}' already exists, skipping (use --force to overwrite)")
+            skipped += 1
+        elif action in ('+', '~'):
+            # Large values (a kubeconfig in a k8s Secret) go to the blob store.
+            vault[key], fields = _store_text(fernet, key, pending[key], index_key)
+            _record_meta(meta, key, "").update(fields)
+            imported += 1
+
+    # One write for the whole batch.
+    if imported:
+        save_vault(vault, fernet)
+        save_meta(meta)
+    print_success(f"Imported {imported} secrets from '{input_file}'")
+    unchanged = sum(1 for action, _ in plan if action == '=')
+    if unchanged:
+        print_info(f"{unchanged} entries already up to date")
+    if skipped > 0:
+        print_info(f"Skipped {skipped} entries")
+    print_warning(f"Consider deleting '{input_file}' now that secrets are secure!")
 
 
 def _derive_key_from_password(password, salt, iterations=PBKDF2_ITERATIONS):
@@ -538,24 +2823,719 @@ def _derive_key_from_password(password, salt, iterations=PBKDF2_ITERATIONS):
     return base64.urlsafe_b64encode(key)
 
 
+# --- Streaming v3 bundle format ---------------------------------------------
+# MAGIC || header || frames. The header carries the KDF parameters, AEAD cipher,
+# flags, chunk size and a random 7-byte nonce prefix. The plaintext payload is
+# a sequence of named members, optionally zlib-compressed, cut into fixed-size
+# chunks. Chunk i is sealed with nonce = prefix || be32(i) || final-flag and
+# the header as associated data, so reordering, truncation, splicing and
+# header tampering all fail authentication. Frames are be32(len) || ciphertext.
+# Memory use is bounded by STREAM_WORKERS * STREAM_WINDOW chunks, whatever the
+# vault size, and chunks within a window are sealed/opened in parallel.
+
+VAULT_MAGIC_V3 = b"ELKV3\n"
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_WORKERS = min(4, os.cpu_count() or 1)
+STREAM_WINDOW = 4            # chunks in flight per worker
+STREAM_KDF_PBKDF2 = 1
+STREAM_KDF_X25519 = 2        # random data key, wrapped once per recipient
+STREAM_CIPHER_AESGCM = 1
+STREAM_CIPHER_CHACHA20 = 2
+STREAM_FLAG_ZLIB = 0x01
+_STREAM_HEADER = struct.Struct('>B16sIBBI7s')  # kdf, salt, iters, cipher, flags, chunk, prefix
+RECIPIENT_STANZA_SIZE = 32 + 32 + 16         # ephemeral public key, wrapped data key, tag
+
+
+def _stream_aead(cipher_id, key):
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    if cipher_id == STREAM_CIPHER_AESGCM:
+        return AESGCM(key)
+    if cipher_id == STREAM_CIPHER_CHACHA20:
+        return ChaCha20Poly1305(key)
+    raise ValueError(f"Unsupported bundle cipher {cipher_id}")
+
+
+def _chunk_nonce(prefix, index, final):
+    return prefix + struct.pack('>I', index) + (b'\x01' if final else b'\x00')
+
+
+def _rechunk(pieces, size):
+    """Re-cut an iterator of byte strings into `size`-byte chunks (last may be short)."""
+    buf = bytearray()
+    for piece in pieces:
+        buf += piece
+        while len(buf) >= size:
+            yield bytes(buf[:size])
+            del buf[:size]
+    yield bytes(buf)
+
+
+def _zlib_pieces(pieces):
+    import zlib
+    comp = zlib.compressobj(6)
+    for piece in pieces:
+        out = comp.compress(piece)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+def _zlib_unpieces(chunks):
+    import zlib
+    decomp = zlib.decompressobj()
+    for chunk in chunks:
+        out = decomp.decompress(chunk)
+        if out:
+            yield out
+    tail = decomp.flush()
+    if tail:
+        yield tail
+
+
+def _pack_members(members):
+    """Payload stream: be16(len(name)) || name || be64(size) || data, then be16(0).
+
+    `members` is a list of (name, bytes_or_path); paths are streamed from disk.
+    """
+    for name, src in members:
+        encoded = name.encode()
+        if isinstance(src, bytes):
+            yield struct.pack('>H', len(encoded)) + encoded + struct.pack('>Q', len(src))
+            yield src
+            continue
+        with open(src, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            yield struct.pack('>H', len(encoded)) + encoded + struct.pack('>Q', size)
+            remaining = size
+            while remaining:
+                piece = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not piece:
+                    raise IOError(f"'{src}' changed size while bundling")
+                remaining -= len(piece)
+                yield piece
+    yield struct.pack('>H', 0)
+
+
+def _windowed(items, size):
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) == size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def _seal_stream(chunks, aead, prefix, aad, out):
+    """Encrypt plaintext chunks and write length-prefixed frames to `out`."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def tagged():
+        index, previous = 0, None
+        for chunk in chunks:
+            if previous is not None:
+                yield index, previous, False
+                index += 1
+            previous = chunk
+        yield index, previous if previous is not None else b"", True
+
+    def seal(job):
+        index, chunk, final = job
+        return aead.encrypt(_chunk_nonce(prefix, index, final), chunk, aad)
+
+    with ThreadPoolExecutor(max_workers=STREAM_WORKERS) as pool:
+        for window in _windowed(tagged(), STREAM_WORKERS * STREAM_WINDOW):
+            for sealed in pool.map(seal, window):
+                out.write(struct.pack('>I', len(sealed)) + sealed)
+
+
+def _open_stream(src, aead, prefix, aad):
+    """Yield authenticated plaintext chunks; raises InvalidTag on any tampering."""
+    from concurrent.futures import ThreadPoolExecutor
+    from cryptography.exceptions import InvalidTag
+
+    max_frame = STREAM_CHUNK_SIZE * 4 + 64
+
+    def frames():
+        index, pending = 0, None
+        while True:
+            head = src.read(4)
+            if not head:
+                break
+            if len(head) != 4:
+                raise InvalidTag()
+            (length,) = struct.unpack('>I', head)
+            if length > max_frame:
+                raise InvalidTag()
+            body = src.read(length)
+            if len(body) != length:
+                raise InvalidTag()
+            if pending is not None:
+                yield index, pending, False
+                index += 1
+            pending = body
+        if pending is None:
+            raise InvalidTag()  # truncated before the final chunk
+        yield index, pending, True
+
+    def open_frame(job):
+        index, body, final = job
+        return aead.decrypt(_chunk_nonce(prefix, index, final), body, aad)
+
+    with ThreadPoolExecutor(max_workers=STREAM_WORKERS) as pool:
+        for window in _windowed(frames(), STREAM_WORKERS * STREAM_WINDOW):
+            for chunk in pool.map(open_frame, window):
+                yield chunk
+
+
+class _ChunkReader:
+    """Exact-size reads over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = bytearray()
+
+    def _fill(self, n):
+        while len(self._buf) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                raise ValueError("Bundle payload ended unexpectedly")
+            self._buf += chunk
+
+    def read(self, n):
+        self._fill(n)
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def copy(self, n, out):
+        while n:
+            if not self._buf:
+                self._fill(1)
+            take = min(n, len(self._buf))
+            out.write(self._buf[:take])
+            del self._buf[:take]
+            n -= take
+
+
+# --- Blob store ----------------------------------------------------------------
+# Values over BLOB_THRESHOLD bytes (or not valid UTF-8) are kept out of
+# vault.json, which then holds only "b1:<address>". The blob itself lives in
+# <vault>/blobs/<address>.blob, where the address is an HMAC-SHA256 of the
+# plaintext under a subkey of the master key: equal values are stored once and
+# addresses reveal nothing without the key. A blob file is BLOB_MAGIC ||
+# 16-byte salt || 7-byte nonce prefix || frames sealed as in the v3 bundle
+# format, under a per-blob key derived from the salt, so values are encrypted
+# and decrypted chunk by chunk and never held whole. Reading re-derives the
+# address and rejects a blob whose content does not match its name. Loading,
+# listing and saving the vault never open blob files, so they cost the same
+# however many blobs there are. A blob is deleted once neither the vault nor
+# any history file refers to it.
+
+BLOB_TAG = "b1"
+BLOB_MAGIC = b"ELKB1\n"
+BLOB_THRESHOLD = 64 * 1024
+_BLOB_HEADER_SIZE = len(BLOB_MAGIC) + 16 + 7
+
+
+def _blob_dir():
+    return os.path.join(VAULT_DIR, "blobs")
+
+
+def _blob_path(address):
+    return os.path.join(_blob_dir(), address + ".blob")
+
+
+def _blob_address(value):
+    """The address a stored value refers to, or None for an inline entry."""
+    tag, sep, address = value.partition(":")
+    if sep and tag == BLOB_TAG and re.match(r'^[0-9a-f]{64}$', address):
+        return address
+    return None
+
+
+def _blob_keys(fernet, salt):
+    """(address HMAC key, AEAD for the blob written with `salt`)."""
+    import hmac
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    key = hmac.new(_subkey(fernet, "blob"), salt, hashlib.sha256).digest()
+    return _subkey(fernet, "blob/address"), AESGCM(key)
+
+
+def _write_blob(fernet, chunks, observers=()):
+    """Stream plaintext chunks into the blob store; returns (vault value, size).
+
+    `observers` are hash objects that also see every chunk, so a caller can
+    fingerprint the value in the same pass.
+    """
+    import hmac
+    os.makedirs(_blob_dir(), mode=0o700, exist_ok=True)
+    salt, prefix = os.urandom(16), os.urandom(7)
+    address_key, aead = _blob_keys(fernet, salt)
+    address = hmac.new(address_key, digestmod=hashlib.sha256)
+    size = 0
+
+    def observed():
+        nonlocal size
+        for chunk in chunks:
+            address.update(chunk)
+            for observer in observers:
+                observer.update(chunk)
+            size += len(chunk)
+            yield chunk
+
+    header = BLOB_MAGIC + salt + prefix
+    fd, tmp = tempfile.mkstemp(prefix=".blob-", dir=_blob_dir())
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            _seal_stream(_rechunk(observed(), STREAM_CHUNK_SIZE), aead, prefix, header, f)
+            if _durability() != 'fast':
+                f.flush()
+                os.fsync(f.fileno())
+        path = _blob_path(address.hexdigest())
+        if os.path.exists(path):
+            os.remove(tmp)  # the same value is already stored
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return BLOB_TAG + ":" + address.hexdigest(), size
+
+
+def _read_blob(fernet, address):
+    """Yield a blob's plaintext chunks; raises InvalidToken if it fails to
+    authenticate. The address is only checked after the last chunk, so a
+    caller writing chunks out must discard them if this raises."""
+    import hmac
+    from cryptography.exceptions import InvalidTag
+    with open(_blob_path(address), 'rb') as f:
+        header = f.read(_BLOB_HEADER_SIZE)
+        if len(header) != _BLOB_HEADER_SIZE or not header.startswith(BLOB_MAGIC):
+            raise InvalidToken
+        address_key, aead = _blob_keys(fernet, header[len(BLOB_MAGIC):-7])
+        digest = hmac.new(address_key, digestmod=hashlib.sha256)
+        try:
+            for chunk in _open_stream(f, aead, header[-7:], header):
+                digest.update(chunk)
+                yield chunk
+        except InvalidTag:
+            raise InvalidToken
+    if not hmac.compare_digest(digest.hexdigest(), address):
+        raise InvalidToken
+
+
+def _store_chunks(fernet, name, chunks, index_key):
+    """Encrypt a value given as plaintext byte chunks.
+
+    Short UTF-8 values become ordinary entries; anything longer than
+    BLOB_THRESHOLD, or binary, is streamed into the blob store. Returns
+    (vault value, metadata fields), or None if the value is empty.
+    """
+    import hmac
+    chunks = iter(chunks)
+    head = bytearray()
+    for chunk in chunks:
+        head += chunk
+        if len(head) > BLOB_THRESHOLD:
+            break
+    else:
+        if not head:
+            return None
+        try:
+            text = head.decode()
+        except UnicodeDecodeError:
+            text = None
+        if text is not None:
+            fields = {"length": len(head), "provider": _guess_provider(text),
+                      "fp": _fingerprint(index_key, text)}
+            value = _encrypt_value(fernet, name, head)
+            head[:] = bytes(len(head))
+            return value, fields
+
+    fp = hmac.new(index_key, digestmod=hashlib.sha256)
+    value, size = _write_blob(fernet, itertools.chain([bytes(head)], chunks), [fp])
+    head[:] = bytes(len(head))
+    return value, {"length": size, "provider": None, "fp": fp.hexdigest()[:32]}
+
+
+def _store_text(fernet, name, text, index_key):
+    """_store_chunks for a str value (batch, import); empty values stay inline."""
+    stored = _store_chunks(fernet, name, [text.encode()], index_key)
+    if stored is None:
+        return _encrypt_value(fernet, name, b""), {
+            "length": 0, "provider": None, "fp": _fingerprint(index_key, "")}
+    return stored
+
+
+def _value_fields(fernet, name, value, index_key):
+    """Metadata fields (length, provider, fp) of a stored value, computed
+    chunk by chunk for blobs and without decoding, so binary values work.
+    Raises InvalidToken or OSError like _decrypt_value."""
+    import hmac
+    address = _blob_address(value)
+    if address:
+        fp = hmac.new(index_key, digestmod=hashlib.sha256)
+        size = 0
+        for chunk in _read_blob(fernet, address):
+            fp.update(chunk)
+            size += len(chunk)
+        return {"length": size, "provider": None, "fp": fp.hexdigest()[:32]}
+    plaintext = _decrypt_value(fernet, value, name)
+    try:
+        provider = _guess_provider(plaintext.decode())
+    except UnicodeDecodeError:
+        provider = None
+    fields = {"length": len(plaintext), "provider": provider,
+              "fp": hmac.new(index_key, plaintext, hashlib.sha256).hexdigest()[:32]}
+    _wipe_bytes(plaintext)
+    return fields
+
+
+def _blob_references(vault):
+    return {a for a in map(_blob_address, vault.values()) if a}
+
+
+def _gc_blobs(candidates):
+    """Delete the blobs in `candidates` that neither the vault nor any history
+    file still refers to. Called with the vault lock held, only after a blob
+    reference was dropped, so ordinary saves never scan the history."""
+    import glob
+    candidates = set(candidates)
+    if not candidates:
+        return
+    live = _blob_references(_read_json_file(VAULT_FILE, {}) or {})
+    for path in glob.glob(os.path.join(_history_dir(), "*.json")):
+        data = _read_json_file(path, None)
+        if isinstance(data, dict) and isinstance(data.get("versions"), list):
+            live.update(_blob_address(v.get("value") or "") for v in data["versions"])
+    for address in candidates - live:
+        try:
+            os.remove(_blob_path(address))
+        except FileNotFoundError:
+            pass
+
+
+# --- Recipients (X25519) -------------------------------------------------------
+# Each user has an identity keypair in <vault>/identity.key. A recipient bundle
+# is sealed once under a random data key; every recipient gets an 80-byte
+# stanza wrapping that key to their public key (ephemeral X25519 + HKDF +
+# ChaCha20-Poly1305), so sharing with one more teammate costs one wrap rather
+# than a re-encryption, and importing needs no password or KDF.
+
+RECIPIENT_PREFIX = "x25519:"
+
+
+def _identity_file():
+    return os.path.join(VAULT_DIR, "identity.key")
+
+
+def _load_identity(create=False):
+    """Return this user's X25519 private key, or None when there is none yet."""
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    path = _identity_file()
+    raw = _read_identity_bytes(path)
+    if raw is None and create:
+        ensure_vault_dir()
+        with _vault_lock():
+            raw = _read_identity_bytes(path)
+            if raw is None:
+                raw = os.urandom(32)
+                _atomic_write(path, raw)
+    return X25519PrivateKey.from_private_bytes(raw) if raw else None
+
+
+def _read_identity_bytes(path):
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+    if len(raw) != 32:
+        raise ValueError(f"'{path}' is not a valid identity key")
+    return raw
+
+
+def _public_bytes(key):
+    from cryptography.hazmat.primitives import serialization
+    return key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+
+def _format_recipient(public_key):
+    encoded = base64.urlsafe_b64encode(_public_bytes(public_key)).decode().rstrip("=")
+    return RECIPIENT_PREFIX + encoded
+
+
+def _parse_recipient(text):
+    """Parse an `x25519:...` public key; raises ValueError."""
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PublicKey
+    text = text.strip()
+    if not text.startswith(RECIPIENT_PREFIX):
+        raise ValueError(f"Not a recipient key: '{text}'")
+    encoded = text[len(RECIPIENT_PREFIX):]
+    try:
+        raw = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    except (ValueError, TypeError):
+        raise ValueError(f"Not a recipient key: '{text}'")
+    if len(raw) != 32:
+        raise ValueError(f"Not a recipient key: '{text}'")
+    return X25519PublicKey.from_public_bytes(raw)
+
+
+def _recipient_keys(values):
+    """Public keys from --recipient values: a key, or a file of keys (one per line)."""
+    keys = []
+    for value in values:
+        if not value.startswith(RECIPIENT_PREFIX) and os.path.isfile(value):
+            with open(value) as f:
+                lines = [line.strip() for line in f]
+            keys.extend(_parse_recipient(line) for line in lines
+                        if line and not line.startswith('#'))
+        else:
+            keys.append(_parse_recipient(value))
+    return keys
+
+
+def _wrap_key(shared, ephemeral_pub, recipient_pub):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=ephemeral_pub + recipient_pub,
+                info=b"envlockr/bundle-wrap").derive(shared)
+
+
+def _wrap_data_key(data_key, recipient, aad):
+    """One recipient stanza: ephemeral public key || sealed data key."""
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+    ephemeral = X25519PrivateKey.generate()
+    ephemeral_pub = _public_bytes(ephemeral.public_key())
+    wrap = _wrap_key(ephemeral.exchange(recipient), ephemeral_pub, _public_bytes(recipient))
+    # The wrap key is single-use, so a fixed nonce is safe.
+    return ephemeral_pub + ChaCha20Poly1305(wrap).encrypt(b"\0" * 12, data_key, aad)
+
+
+def _unwrap_data_key(stanzas, identity, aad):
+    """The data key from whichever stanza `identity` can open, or None."""
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PublicKey
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+    own_pub = _public_bytes(identity.public_key())
+    for stanza in stanzas:
+        ephemeral_pub, sealed = stanza[:32], stanza[32:]
+        try:
+            shared = identity.exchange(X25519PublicKey.from_public_bytes(ephemeral_pub))
+            wrap = _wrap_key(shared, ephemeral_pub, own_pub)
+            return ChaCha20Poly1305(wrap).decrypt(b"\0" * 12, sealed, aad)
+        except (InvalidTag, ValueError):
+            continue
+    return None
+
+
+def _write_v3_bundle(out, password, members, compress=True, recipients=None):
+    """Stream `members` into `out` as a v3 bundle.
+
+    With `recipients` (X25519 public keys) the payload is sealed under a random
+    data key that is wrapped for each recipient, and no password is used.
+    """
+    salt = os.urandom(16)
+    prefix = os.urandom(7)
+    flags = STREAM_FLAG_ZLIB if compress else 0
+    if recipients:
+        header = VAULT_MAGIC_V3 + _STREAM_HEADER.pack(
+            STREAM_KDF_X25519, salt, 0, STREAM_CIPHER_AESGCM,
+            flags, STREAM_CHUNK_SIZE, prefix)
+        key = os.urandom(32)
+        stanzas = [_wrap_data_key(key, r, header) for r in recipients]
+        out.write(header + struct.pack('>H', len(stanzas)) + b"".join(stanzas))
+    else:
+        header = VAULT_MAGIC_V3 + _STREAM_HEADER.pack(
+            STREAM_KDF_PBKDF2, salt, PBKDF2_ITERATIONS, STREAM_CIPHER_AESGCM,
+            flags, STREAM_CHUNK_SIZE, prefix)
+        key = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, PBKDF2_ITERATIONS)
+        out.write(header)
+    pieces = _pack_members(members)
+    if compress:
+        pieces = _zlib_pieces(pieces)
+    _seal_stream(_rechunk(pieces, STREAM_CHUNK_SIZE),
+                 _stream_aead(STREAM_CIPHER_AESGCM, key), prefix, header, out)
+
+
+def _read_v3_header(src):
+    """Read a v3 header (magic already consumed).
+
+    Returns (aad, fields, stanzas): the authenticated header bytes, its unpacked
+    fields and, for recipient bundles, the wrapped data keys that follow it.
+    Stanzas sit outside the associated data so recipients can be appended
+    without re-encrypting the payload.
+    """
+    raw = src.read(_STREAM_HEADER.size)
+    if len(raw) != _STREAM_HEADER.size:
+        raise ValueError("Truncated bundle header")
+    fields = _STREAM_HEADER.unpack(raw)
+    stanzas = []
+    if fields[0] == STREAM_KDF_X25519:
+        head = src.read(2)
+        if len(head) != 2:
+            raise ValueError("Truncated recipient list")
+        (count,) = struct.unpack('>H', head)
+        stanzas = [src.read(RECIPIENT_STANZA_SIZE) for _ in range(count)]
+        if any(len(s) != RECIPIENT_STANZA_SIZE for s in stanzas):
+            raise ValueError("Truncated recipient list")
+    elif fields[0] != STREAM_KDF_PBKDF2:
+        raise ValueError(f"Unsupported bundle key derivation {fields[0]}")
+    return VAULT_MAGIC_V3 + raw, fields, stanzas
+
+
+def _read_v3_bundle(src, header, key, stage_dir):
+    """Decrypt a v3 bundle body (header already read) into temp files.
+
+    Returns {member name: temp path}. Nothing is returned — and every temp file
+    is removed — unless the whole stream authenticated, so a tampered or
+    truncated bundle can never be half-installed.
+    """
+    aad, (_kdf, _salt, _iters, cipher_id, flags, _chunk, prefix), _stanzas = header
+    chunks = _open_stream(src, _stream_aead(cipher_id, key), prefix, aad)
+    if flags & STREAM_FLAG_ZLIB:
+        chunks = _zlib_unpieces(chunks)
+
+    reader = _ChunkReader(chunks)
+    staged = {}
+    try:
+        while True:
+            (name_len,) = struct.unpack('>H', reader.read(2))
+            if not name_len:
+                break
+            name = reader.read(name_len).decode()
+            (size,) = struct.unpack('>Q', reader.read(8))
+            fd, tmp = tempfile.mkstemp(prefix=".import-", dir=stage_dir)
+            staged[name] = tmp
+            with os.fdopen(fd, 'wb') as f:
+                reader.copy(size, f)
+        # Drain to the final chunk so its authentication tag is checked.
+        for _ in reader._chunks:
+            pass
+    except BaseException:
+        for tmp in staged.values():
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        raise
+    return staged
+
+
+def _read_master_key_bytes():
+    """Master key bytes for bundling: the key file, else the OS keychain."""
+    if os.path.exists(KEY_FILE):
+        with open(KEY_FILE, 'rb') as f:
+            return f.read()
+    key = _keyring_get_key()
+    if key:
+        return key
+    raise IOError(f"No master key found (neither '{KEY_FILE}' nor the OS keychain)")
+
+
 def encrypt_vault_cmd(args):
-    """Encrypt the vault file with a password for portability"""
+    """Encrypt the vault file with a password for portability
+
+    Not read-only: once a v3 bundle is written, the fingerprints it shipped
+    are recorded in this vault's meta.json as the merge ancestor (see below).
+    """
     if not os.path.exists(VAULT_FILE):
         print_error("No vault found to encrypt.")
         return
 
-    password = args.password
-    if not password:
-        password = getpass.getpass(prompt="Enter password to encrypt vault: ")
-        confirm = getpass.getpass(prompt="Confirm password: ")
-        if password != confirm:
-            print_error("Passwords do not match.")
-            return
+    output_file = getattr(args, 'output', None) or "vault.envlockr"
+    if getattr(args, 'format', 'v3') == 'v2' and _blob_references(load_vault()):
+        print_error("This vault holds blob values, which --format v2 cannot carry.")
+        print_info("Use the default --format v3 (envlockr >= 2.1 can import it).")
+        return
+    recipients = None
+    if getattr(args, 'recipient', None):
+        if getattr(args, 'format', 'v3') == 'v2':
+            print_error("Recipient bundles need --format v3.")
+            return
+        try:
+            recipients = _recipient_keys(args.recipient)
+            # Always include ourselves, so `share` can add recipients later.
+            recipients.append(_load_identity(create=True).public_key())
+        except (IOError, ValueError) as e:
+            print_error(str(e))
+            return
+        unique = {_public_bytes(r): r for r in recipients}
+        recipients = list(unique.values())
+        password = None
+    else:
+        password = args.password
+        if not password:
+            password = getpass.getpass(prompt="Enter password to encrypt vault: ")
+            confirm = getpass.getpass(prompt="Confirm password: ")
+            if password != confirm:
+                print_error("Passwords do not match.")
+                return
+
+        if not password:
+            print_error("Password cannot be empty.")
+            return
+
+    if getattr(args, 'format', 'v3') == 'v2':
+        _encrypt_vault_v2(password, output_file)
+        return
+
+    try:
+        key_data = _read_master_key_bytes()
+    except IOError as e:
+        print_error(f"Error reading vault files: {e}")
+        return
 
-    if not password:
-        print_error("Password cannot be empty.")
+    fernet = _make_fernet(key_data)
+    vault = load_vault()
+    meta = load_meta()
+    _ensure_fingerprints(fernet, vault, meta)
+    shipped = {n: meta["entries"][n]["fp"] for n in vault
+               if meta["entries"].get(n, {}).get("fp")}
+
+    members = [("key.key", key_data), ("vault.json", VAULT_FILE)]
+    if os.path.exists(_meta_file()):
+        members.append(("meta.json", _meta_file()))
+    members += [(f"blobs/{a}.blob", _blob_path(a)) for a in sorted(_blob_references(vault))]
+    compress = not getattr(args, 'no_compress', False)
+
+    # "-" streams to stdout (e.g. piping into ssh); status then goes to stderr.
+    to_stdout = output_file == '-'
+    try:
+        if to_stdout:
+            _write_v3_bundle(sys.stdout.buffer, password, members, compress, recipients)
+            sys.stdout.buffer.flush()
+        else:
+            with open(output_file, 'wb') as f:
+                _write_v3_bundle(f, password, members, compress, recipients)
+    except IOError as e:
+        with contextlib.redirect_stdout(sys.stderr if to_stdout else sys.stdout):
+            print_error(f"Error writing encrypted vault: {e}")
         return
 
+    # What we shipped becomes the common ancestor for a later
+    # `import-vault --merge` of the bundle coming back. This is the one write
+    # export makes to the source vault, and only after the bundle is complete.
+    _record_sync_ancestor(meta, _key_id(key_data), shipped)
+    save_meta(meta)
+    with contextlib.redirect_stdout(sys.stderr if to_stdout else sys.stdout):
+        print_success(f"Vault encrypted to '{'<stdout>' if to_stdout else output_file}'")
+        if recipients:
+            print_info(f"Only the {len(recipients)} recipient identities can import it "
+                       "(including yours).")
+        else:
+            print_info("Share this file safely — it requires the password to decrypt.")
+
+
+def _encrypt_vault_v2(password, output_file):
+    """Write the older single-token v2 bundle (for teammates on envlockr < 2.1)."""
     try:
         with open(VAULT_FILE, 'r') as f:
             vault_data = f.read()
@@ -576,7 +3556,6 @@ def encrypt_vault_cmd(args):
     fernet = Fernet(_derive_key_from_password(password, salt))
     token = fernet.encrypt(bundle.encode())
 
-    output_file = getattr(args, 'output', None) or "vault.envlockr"
     try:
         with open(output_file, 'wb') as f:
             f.write(VAULT_MAGIC + salt + token)
@@ -586,29 +3565,308 @@ def encrypt_vault_cmd(args):
         print_error(f"Error writing encrypted vault: {e}")
 
 
-def decrypt_vault_cmd(args):
-    """Decrypt a password-protected vault file and restore it"""
-    input_file = getattr(args, 'file', None) or "vault.envlockr"
+def _install_blob_member(name, tmp):
+    """Move a staged "blobs/<address>.blob" member into the blob store; False
+    if `name` is not a blob member. Blobs are content-addressed, so one that
+    is already present is kept as is."""
+    match = re.match(r'^blobs/([0-9a-f]{64})\.blob$', name)
+    if not match:
+        return False
+    path = _blob_path(match.group(1))
+    if os.path.exists(path):
+        os.remove(tmp)
+    else:
+        os.makedirs(_blob_dir(), mode=0o700, exist_ok=True)
+        os.replace(tmp, path)
+    return True
+
+
+def _install_bundle_members(staged):
+    """Move decrypted bundle members from their staging files into place."""
+    targets = {"vault.json": VAULT_FILE, "key.key": KEY_FILE, "meta.json": _meta_file()}
+    with _vault_lock():
+        previous = _blob_references(_read_json_file(VAULT_FILE, {}) or {})
+        for name, tmp in staged.items():
+            if _install_blob_member(name, tmp):
+                continue
+            if name not in targets:
+                os.remove(tmp)  # written by a newer envlockr; nothing to map it to
+                continue
+            if name == "key.key" and sys.platform != 'win32':
+                os.chmod(tmp, 0o600)
+            os.replace(tmp, targets[name])
+            _loaded.pop(targets[name], None)
+            if name == "key.key":
+                _session_cache_clear()
+            elif name == "vault.json":
+                _write_names_cache(_read_json_file(VAULT_FILE, {}) or {})
+        _gc_blobs(previous)
+        if "vault.json" in staged and os.path.exists(_integrity_file()):
+            _init_integrity(load_or_create_key(), _read_json_file(VAULT_FILE, {}) or {})
+
+
+def _confirm_overwrite_vault(args):
+    if os.path.exists(VAULT_FILE) and not getattr(args, 'force', False):
+        print_warning("A vault already exists at this location.")
+        response = input("Overwrite? [y/N]: ").strip().lower()
+        if response != 'y':
+            print_info("Operation cancelled.")
+            return False
+    return True
 
-    if not os.path.exists(input_file):
-        print_error(f"File '{input_file}' not found.")
+
+def _key_id(key_bytes):
+    """Short public identifier for a master key (names sync ancestors)."""
+    return hashlib.sha256(b"envlockr-key-id:" + key_bytes.strip()).hexdigest()[:16]
+
+
+def _record_sync_ancestor(meta, key_id, fingerprints):
+    """Remember {name: fingerprint} as the common ancestor for bundles under key_id."""
+    meta.setdefault("sync", {})[key_id] = {"at": _utcnow(), "ancestor": fingerprints}
+
+
+def _merge_bundle(members, args):
+    """Three-way merge of a decrypted bundle into the local vault.
+
+    Entries are compared by keyed fingerprints, never by ciphertext. Incoming
+    fingerprints are reused when the bundle shares our index key; otherwise the
+    incoming entry is decrypted once with the bundle's key. The ancestor is the
+    last state seen from the same source key. Per entry (L=local, R=remote,
+    B=ancestor): L==R -> nothing; L==B -> take remote (or delete); R==B ->
+    keep local; otherwise a conflict, resolved by --prefer (default: local).
+    """
+    remote_key = members["key.key"]
+    remote_fernet = _make_fernet(remote_key)
+    remote_vault = json.loads(members["vault.json"].decode() or "{}")
+    remote_meta = json.loads(members["meta.json"].decode()) if "meta.json" in members else {}
+    remote_entries = remote_meta.get("entries") or {}
+
+    fernet = load_or_create_key()
+    vault = load_vault()
+    meta = load_meta()
+    _ensure_fingerprints(fernet, vault, meta)
+    index_key = _index_key(fernet, meta)
+    local_entries = meta["entries"]
+    same_index = bool(remote_meta.get("index_id")) and \
+        remote_meta.get("index_id") == meta.get("index_id")
+    same_key = remote_key.strip() == _read_master_key_bytes().strip()
+
+    fields = {}
+    remote_fps = {}
+    skipped = set()
+    for name, value in remote_vault.items():
+        fp = remote_entries.get(name, {}).get("fp") if same_index else None
+        if not fp:
+            try:
+                fields[name] = _value_fields(remote_fernet, name, value, index_key)
+            except (InvalidToken, OSError):
+                print_warning(f"Incoming secret '{name}' could not be decrypted, skipping.")
+                skipped.add(name)
+                continue
+            fp = fields[name]["fp"]
+        remote_fps[name] = fp
+
+    source = _key_id(remote_key)
+    ancestor = meta.get("sync", {}).get(source, {}).get("ancestor", {})
+    prefer = getattr(args, 'prefer', None) or 'local'
+    take, delete, conflicts = [], [], []
+    # A skipped entry is unknown, not absent: never delete the local copy for it.
+    for name in sorted((set(vault) | set(remote_fps)) - skipped):
+        local = local_entries.get(name, {}).get("fp") if name in vault else None
+        remote = remote_fps.get(name)
+        base = ancestor.get(name)
+        if local == remote:
+            continue
+        if local == base:
+            (take if remote else delete).append(name)
+        elif remote == base:
+            continue
+        else:
+            conflicts.append(name)
+            if prefer == 'remote':
+                (take if remote else delete).append(name)
+
+    def version(entries, name):
+        return entries.get(name, {}).get("version", "?")
+
+    for name in conflicts:
+        side = "remote" if prefer == 'remote' else "local"
+        print_warning(f"Conflict on '{name}' (local v{version(local_entries, name)}, "
+                      f"remote v{version(remote_entries, name)}) — kept {side}")
+
+    if getattr(args, 'dry_run', False):
+        print_info("Dry run — no changes written.")
+        for name in take:
+            print(f"   {'~' if name in vault else '+'} {name}")
+        for name in delete:
+            print(f"   - {name}")
+        return
+
+    def remote_chunks(name):
+        value = remote_vault[name]
+        address = _blob_address(value)
+        if address:
+            return _read_blob(remote_fernet, address)
+        return [_decrypt_value(remote_fernet, value, name)]
+
+    # Re-encrypt everything we take under the local key in one pass; with the
+    # same master key the incoming ciphertext is reused as-is. Blobs are
+    # re-stored as bytes, so binary values survive a cross-key merge. Nothing
+    # is written unless every taken entry decrypts.
+    taken = {}
+    try:
+        for name in take:
+            if same_key:
+                taken[name] = remote_vault[name]
+                if name not in fields and "length" not in (remote_entries.get(name) or {}):
+                    fields[name] = _value_fields(remote_fernet, name, remote_vault[name], index_key)
+                continue
+            stored = _store_chunks(fernet, name, remote_chunks(name), index_key)
+            if stored is None:
+                stored = (_encrypt_value(fernet, name, b""),
+                          {"length": 0, "provider": None, "fp": _fingerprint(index_key, "")})
+            taken[name], fields[name] = stored
+    except (InvalidToken, OSError):
+        print_error(f"Incoming secret '{name}' could not be decrypted; nothing was merged.")
+        if not same_key:
+            with _vault_lock():
+                _gc_blobs(_blob_references(taken))
         return
 
+    for name, value in taken.items():
+        vault[name] = value
+        entry = dict(remote_entries.get(name) or {"created": _utcnow(), "tags": []})
+        entry.update(fields.get(name, {}))
+        entry["fp"] = remote_fps[name]
+        entry["version"] = max(entry.get("version", 0),
+                               local_entries.get(name, {}).get("version", 0)) + 1
+        local_entries[name] = entry
+    for name in delete:
+        vault.pop(name, None)
+        local_entries.pop(name, None)
+
+    if take or delete:
+        save_vault(vault, fernet)
+    # Skipped entries keep their old ancestor, so a later readable bundle
+    # still merges them three-way.
+    synced = dict(remote_fps)
+    synced.update((name, ancestor[name]) for name in skipped if name in ancestor)
+    _record_sync_ancestor(meta, source, synced)
+    save_meta(meta)
+    print_success(f"Merged: {len(take)} updated/added, {len(delete)} removed, "
+                  f"{len(conflicts)} conflict(s).")
+
+
+def _bundle_password(args):
+    """The import password from --password or a prompt; None (reported) if empty."""
     password = args.password
     if not password:
         password = getpass.getpass(prompt="Enter password to decrypt vault: ")
-
     if not password:
         print_error("Password cannot be empty.")
+        return None
+    return password
+
+
+def _bundle_key(header, args):
+    """Payload key for a v3 bundle: unwrapped with our identity, or derived
+    from the password. Returns None after reporting an error."""
+    aad, fields, stanzas = header
+    if fields[0] == STREAM_KDF_X25519:
+        try:
+            identity = _load_identity()
+        except ValueError as e:
+            print_error(str(e))
+            return None
+        key = _unwrap_data_key(stanzas, identity, aad) if identity else None
+        if key is None:
+            print_error("This bundle is not addressed to your identity.")
+            print_info("Ask the sender to run `envlockr share FILE -r <key>` with your `envlockr identity`.")
+        return key
+    password = _bundle_password(args)
+    if not password:
+        return None
+    _kdf, salt, iterations = fields[:3]
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+
+def decrypt_vault_cmd(args):
+    """Decrypt a password-protected vault file and restore (or merge) it"""
+    input_file = getattr(args, 'file', None) or "vault.envlockr"
+
+    if input_file != '-' and not os.path.exists(input_file):
+        print_error(f"File '{input_file}' not found.")
         return
 
     try:
-        with open(input_file, 'rb') as f:
-            data = f.read()
+        src = sys.stdin.buffer if input_file == '-' else open(input_file, 'rb')
     except IOError as e:
         print_error(f"Error reading file: {e}")
         return
 
+    merge = getattr(args, 'merge', False)
+    with contextlib.ExitStack() as stack:
+        if src is not sys.stdin.buffer:
+            stack.enter_context(src)
+        magic = src.read(len(VAULT_MAGIC_V3))
+
+        # v3: streamed and authenticated chunk by chunk into staging files.
+        if magic == VAULT_MAGIC_V3:
+            from cryptography.exceptions import InvalidTag
+            try:
+                header = _read_v3_header(src)
+            except ValueError as e:
+                print_error(f"Corrupted file: {e}")
+                return
+            except IOError as e:
+                print_error(f"Error reading file: {e}")
+                return
+            key = _bundle_key(header, args)
+            if key is None:
+                return
+            ensure_vault_dir()
+            try:
+                staged = _read_v3_bundle(src, header, key, VAULT_DIR)
+            except (InvalidTag, ValueError, struct.error):
+                print_error("Wrong password or corrupted file.")
+                return
+            except IOError as e:
+                print_error(f"Error reading file: {e}")
+                return
+            if merge:
+                members, blobs = {}, []
+                for name, tmp in staged.items():
+                    if _install_blob_member(name, tmp):
+                        blobs.append(name[len("blobs/"):-len(".blob")])
+                        continue
+                    with open(tmp, 'rb') as f:
+                        members[name] = f.read()
+                    os.remove(tmp)
+                _merge_bundle(members, args)
+                with _vault_lock():
+                    _gc_blobs(blobs)  # incoming blobs the merge did not take
+                return
+            if not _confirm_overwrite_vault(args):
+                for tmp in staged.values():
+                    os.remove(tmp)
+                return
+            try:
+                _install_bundle_members(staged)
+                print_success("Vault restored successfully.")
+            except IOError as e:
+                print_error(f"Error restoring vault: {e}")
+            return
+
+        try:
+            data = magic + src.read()
+        except IOError as e:
+            print_error(f"Error reading file: {e}")
+            return
+
+    password = _bundle_password(args)
+    if not password:
+        return
+
     # v2 format carries a random salt header; legacy files used a fixed salt.
     if data.startswith(VAULT_MAGIC):
         salt = data[len(VAULT_MAGIC):len(VAULT_MAGIC) + 16]
@@ -626,34 +3884,234 @@ def decrypt_vault_cmd(args):
         return
 
     bundle = json.loads(decrypted)
+    if merge:
+        _merge_bundle({"vault.json": bundle["vault"].encode(),
+                       "key.key": base64.b64decode(bundle["key"])}, args)
+        return
 
     # Check for existing vault
-    if os.path.exists(VAULT_FILE) and not getattr(args, 'force', False):
-        print_warning("A vault already exists at this location.")
-        response = input("Overwrite? [y/N]: ").strip().lower()
-        if response != 'y':
-            print_info("Operation cancelled.")
-            return
+    if not _confirm_overwrite_vault(args):
+        return
 
     ensure_vault_dir()
 
     try:
-        with open(VAULT_FILE, 'w') as f:
-            f.write(bundle["vault"])
-        key_bytes = base64.b64decode(bundle["key"])
-        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
-        if sys.platform != 'win32':
-            fd = os.open(KEY_FILE, flags, 0o600)
-            with os.fdopen(fd, 'wb') as f:
-                f.write(key_bytes)
-        else:
-            with open(KEY_FILE, 'wb') as f:
-                f.write(key_bytes)
+        with _vault_lock():
+            _atomic_write(VAULT_FILE, bundle["vault"].encode())
+            _write_key_file(base64.b64decode(bundle["key"]))
+            _loaded.pop(VAULT_FILE, None)
+            _write_names_cache(_read_json_file(VAULT_FILE, {}) or {})
+            if os.path.exists(_integrity_file()):
+                _init_integrity(load_or_create_key(), _read_json_file(VAULT_FILE, {}) or {})
         print_success("Vault restored successfully.")
     except IOError as e:
         print_error(f"Error restoring vault: {e}")
 
 
+# --- Incremental backups -----------------------------------------------------
+# <dir>/objects/ab/<id>   one encrypted (name, ciphertext, metadata) record
+# <dir>/snapshots/<id>    encrypted manifest {name: object id}
+# Object ids are an HMAC of the record under a backup key derived from the
+# master key, so identical entries are stored once and shared by every
+# snapshot while ids reveal nothing about their content. Blob files are
+# already encrypted and content-addressed; they are copied as-is, with their
+# address as object id, and listed under "blobs" in the manifest. Taking a snapshot
+# costs one HKDF (no password KDF) and writes only objects that are new.
+
+def _backup_dir(args):
+    return getattr(args, 'dir', None) or os.path.join(VAULT_DIR, "backups")
+
+
+def _backup_seal(key, data, label):
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    nonce = os.urandom(12)
+    return nonce + AESGCM(key).encrypt(nonce, data, label.encode())
+
+
+def _backup_open(key, blob, label):
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    return AESGCM(key).decrypt(blob[:12], blob[12:], label.encode())
+
+
+def _object_path(root, object_id):
+    return os.path.join(root, "objects", object_id[:2], object_id)
+
+
+def _list_snapshots(root):
+    try:
+        return sorted(os.listdir(os.path.join(root, "snapshots")))
+    except OSError:
+        return []
+
+
+def _read_snapshot(root, key, snapshot_id):
+    with open(os.path.join(root, "snapshots", snapshot_id), 'rb') as f:
+        return json.loads(_backup_open(key, f.read(), snapshot_id))
+
+
+def _own_snapshots(root, key):
+    """[(id, manifest)] for the snapshots `key` opens, oldest first, and the
+    number skipped (written under another key in a shared --dir, or corrupt)."""
+    from cryptography.exceptions import InvalidTag
+    own, skipped = [], 0
+    for snapshot_id in _list_snapshots(root):
+        try:
+            own.append((snapshot_id, _read_snapshot(root, key, snapshot_id)))
+        except (InvalidTag, ValueError):
+            print_warning(f"Snapshot {snapshot_id} does not open with this master key, skipping.")
+            skipped += 1
+    return own, skipped
+
+
+def _take_snapshot(root, key, vault, meta):
+    """Write a snapshot of `vault`; returns (snapshot id, new object count)."""
+    import hmac
+    entries, written = {}, 0
+    for name, value in sorted(vault.items()):
+        record = json.dumps({"name": name, "value": value,
+                             "meta": meta["entries"].get(name)},
+                            sort_keys=True, separators=(',', ':')).encode()
+        object_id = hmac.new(key, record, hashlib.sha256).hexdigest()
+        entries[name] = object_id
+        path = _object_path(root, object_id)
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        _write_private_file(path, _backup_seal(key, record, object_id))
+        written += 1
+    blobs = sorted(_blob_references(vault))
+    for address in blobs:
+        path = _object_path(root, address)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            shutil.copyfile(_blob_path(address), path)
+            os.chmod(path, 0o600)
+            written += 1
+
+    # Millisecond timestamp first so ids sort chronologically.
+    now = time.time()
+    snapshot_id = (time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) +
+                   f"{int(now * 1000) % 1000:03d}Z-{os.urandom(3).hex()}")
+    manifest = json.dumps({"id": snapshot_id, "created": _utcnow(),
+                           "entries": entries, "blobs": blobs}).encode()
+    os.makedirs(os.path.join(root, "snapshots"), mode=0o700, exist_ok=True)
+    _write_private_file(os.path.join(root, "snapshots", snapshot_id),
+                        _backup_seal(key, manifest, snapshot_id))
+    return snapshot_id, written
+
+
+def _prune_snapshots(root, key, keep):
+    """Drop all but the newest `keep` (>= 1) snapshots, then GC unreferenced objects.
+
+    Callers hold the vault lock so a concurrent snapshot cannot land objects
+    between the liveness scan and the sweep.
+    """
+    if keep < 1:
+        raise ValueError("keep must be at least 1")
+    own, skipped = _own_snapshots(root, key)
+    doomed = own[:-keep]
+    for snapshot_id, _manifest in doomed:
+        os.remove(os.path.join(root, "snapshots", snapshot_id))
+    if skipped:
+        # Their objects cannot be told apart from garbage; keep everything.
+        print_warning("Not collecting objects: some snapshots belong to another key.")
+        return len(doomed), 0
+
+    live = set()
+    for _snapshot_id, manifest in own[-keep:]:
+        live.update(manifest["entries"].values())
+        live.update(manifest.get("blobs", []))
+    removed = 0
+    objects = os.path.join(root, "objects")
+    for dirpath, _dirs, files in os.walk(objects):
+        for object_id in files:
+            if object_id not in live:
+                os.remove(os.path.join(dirpath, object_id))
+                removed += 1
+    return len(doomed), removed
+
+
+def backup_command(args):
+    """Snapshot the vault into an incremental, content-addressed backup directory"""
+    root = _backup_dir(args)
+    fernet = load_or_create_key()
+    key = _subkey(fernet, "backup")
+
+    if getattr(args, 'list', False):
+        snapshots, _skipped = _own_snapshots(root, key)
+        if not snapshots:
+            print_info(f"No snapshots in '{root}'.")
+            return
+        print(f"{Colors.CYAN}🗄  Snapshots in {root} ({len(snapshots)}){Colors.NC}")
+        for snapshot_id, manifest in snapshots:
+            print(f"   {Colors.BOLD}•{Colors.NC} {snapshot_id}  "
+                  f"{len(manifest['entries'])} secret(s)")
+        return
+
+    with _vault_lock():
+        if not getattr(args, 'prune_only', False):
+            vault = load_vault()
+            if not vault:
+                print_info("No secrets to back up.")
+                return
+            os.makedirs(root, mode=0o700, exist_ok=True)
+            snapshot_id, written = _take_snapshot(root, key, vault, load_meta())
+            print_success(f"Snapshot {snapshot_id}: {len(vault)} secret(s), "
+                          f"{written} new object(s) in '{root}'")
+
+        keep = getattr(args, 'keep', None)
+        if keep is not None:
+            dropped, removed = _prune_snapshots(root, key, keep)
+            if dropped or removed:
+                print_info(f"Pruned {dropped} snapshot(s), removed {removed} unreferenced object(s).")
+
+
+def restore_command(args):
+    """Rebuild the vault from one backup snapshot"""
+    from cryptography.exceptions import InvalidTag
+    root = _backup_dir(args)
+    snapshots = _list_snapshots(root)
+    snapshot_id = args.snapshot
+    if snapshot_id == 'latest' and snapshots:
+        snapshot_id = snapshots[-1]
+    if snapshot_id not in snapshots:
+        print_error(f"Snapshot '{args.snapshot}' not found in '{root}'.")
+        print_info("Use 'envlockr backup --list' to see available snapshots.")
+        return
+
+    fernet = load_or_create_key()
+    key = _subkey(fernet, "backup")
+    vault, meta = {}, {"entries": {}}
+    try:
+        manifest = _read_snapshot(root, key, snapshot_id)
+        for name, object_id in manifest["entries"].items():
+            with open(_object_path(root, object_id), 'rb') as f:
+                record = json.loads(_backup_open(key, f.read(), object_id))
+            vault[name] = record["value"]
+            if record.get("meta"):
+                meta["entries"][name] = record["meta"]
+        blobs = [a for a in manifest.get("blobs", []) if not os.path.exists(_blob_path(a))]
+    except InvalidTag:
+        print_error("Snapshot does not match this master key, or it is corrupted.")
+        return
+    except (IOError, ValueError) as e:
+        print_error(f"Error reading snapshot: {e}")
+        return
+
+    if not _confirm_overwrite_vault(args):
+        return
+    for address in blobs:
+        os.makedirs(_blob_dir(), mode=0o700, exist_ok=True)
+        shutil.copyfile(_object_path(root, address), _blob_path(address))
+        os.chmod(_blob_path(address), 0o600)
+    _loaded.pop(VAULT_FILE, None)  # a restore replaces the vault; nothing to rebase
+    save_vault(vault, fernet)
+    current = load_meta()
+    current["entries"] = meta["entries"]
+    save_meta(current)
+    print_success(f"Restored {len(vault)} secret(s) from snapshot {snapshot_id}.")
+
+
 def export_vault_cmd(args):
     """Export vault as a password-encrypted portable file"""
     # Alias for encrypt-vault with --output
@@ -666,6 +4124,71 @@ def import_vault_cmd(args):
     decrypt_vault_cmd(args)
 
 
+def identity_command(args):
+    """Print this user's recipient public key, creating the identity if needed."""
+    try:
+        created = not os.path.exists(_identity_file())
+        identity = _load_identity(create=True)
+    except (IOError, ValueError) as e:
+        print_error(f"Could not load identity: {e}")
+        sys.exit(1)
+    # The key goes to stdout alone so it can be piped or redirected to a file.
+    if created:
+        with contextlib.redirect_stdout(sys.stderr):
+            print_success(f"Created identity '{_identity_file()}'")
+    print(_format_recipient(identity.public_key()))
+
+
+def share_command(args):
+    """Add recipients to a recipient bundle without re-encrypting its payload."""
+    path = args.file
+    try:
+        recipients = _recipient_keys(args.recipient)
+        identity = _load_identity()
+    except (IOError, ValueError) as e:
+        print_error(str(e))
+        sys.exit(1)
+    try:
+        src = open(path, 'rb')
+    except IOError as e:
+        print_error(f"Error reading file: {e}")
+        sys.exit(1)
+    with src:
+        try:
+            if src.read(len(VAULT_MAGIC_V3)) != VAULT_MAGIC_V3:
+                raise ValueError("not a v3 bundle")
+            aad, fields, stanzas = _read_v3_header(src)
+        except ValueError as e:
+            print_error(f"Cannot share '{path}': {e}")
+            sys.exit(1)
+        if fields[0] != STREAM_KDF_X25519:
+            print_error(f"'{path}' is password-protected; re-export it with --recipient.")
+            sys.exit(1)
+        key = _unwrap_data_key(stanzas, identity, aad) if identity else None
+        if key is None:
+            print_error("This bundle is not addressed to your identity, so you cannot share it.")
+            sys.exit(1)
+        stanzas += [_wrap_data_key(key, r, aad) for r in recipients]
+        if len(stanzas) > 0xFFFF:
+            print_error("Too many recipients for one bundle.")
+            sys.exit(1)
+
+        # Rewrite only the recipient list; the sealed payload is copied as-is.
+        fd, tmp = tempfile.mkstemp(prefix=".share-", dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(aad + struct.pack('>H', len(stanzas)) + b"".join(stanzas))
+                shutil.copyfileobj(src, out, STREAM_CHUNK_SIZE)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+    print_success(f"Added {len(recipients)} recipient(s) to '{path}' ({len(stanzas)} in total).")
+
+
 def secure_key_cmd(args):
     """Migrate an on-disk master key into the OS keychain."""
     if not KEYRING_AVAILABLE:
@@ -708,6 +4231,54 @@ def secure_key_cmd(args):
         print_error(f"Could not remove key file: {e}")
 
 
+# --- Secret file descriptors (run --fd/--file) --------------------------------
+# `run --fd NAME` hands a secret to the child as an inherited file descriptor
+# instead of an environment variable, with the descriptor number in NAME_FD;
+# `--file NAME` sets NAME_FILE=/proc/self/fd/N for programs that want a path.
+# The value is written into an anonymous memfd (memory only, never on disk)
+# which is then sealed against writes, resizing and further seals. It is not
+# subject to ARG_MAX, never shows up in /proc/<pid>/environ and is not copied
+# into the environment of everything the child spawns. Blob-backed secrets
+# are streamed into the memfd chunk by chunk, verbatim. Linux only.
+
+def _sealed_memfd(name, chunks):
+    """A sealed, read-only memfd holding `chunks`, positioned at 0 (close-on-exec)."""
+    import fcntl
+    fd = os.memfd_create(f"envlockr:{name}", os.MFD_CLOEXEC | os.MFD_ALLOW_SEALING)
+    try:
+        for chunk in chunks:
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(fd, view):]
+        fcntl.fcntl(fd, fcntl.F_ADD_SEALS, fcntl.F_SEAL_WRITE | fcntl.F_SEAL_GROW |
+                    fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_SEAL)
+        os.lseek(fd, 0, os.SEEK_SET)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _fd_handles(args, vault):
+    """{name: 'fd' | 'file'} from --fd/--file (repeatable, comma-separated)."""
+    handles = {}
+    for kind in ('fd', 'file'):
+        for item in getattr(args, kind, None) or []:
+            for name in (n.strip() for n in item.split(',')):
+                if name:
+                    handles[name] = kind
+    if not handles:
+        return handles
+    if not hasattr(os, 'memfd_create'):
+        print_error("--fd/--file need memfd_create (Linux).")
+        sys.exit(1)
+    missing = sorted(n for n in handles if n not in vault)
+    if missing:
+        print_error(f"Secret(s) not found: {', '.join(missing)}")
+        sys.exit(1)
+    return handles
+
+
 def run_command(args):
     """Run a command with secrets injected into its environment (no .env on disk)."""
     if not args.cmd:
@@ -727,32 +4298,609 @@ def run_command(args):
     if not vault:
         print_warning("No secrets stored — running command with the current environment.")
 
-    if getattr(args, 'only', None):
-        wanted = [n.strip() for n in args.only.split(',') if n.strip()]
-    else:
-        wanted = list(vault.keys())
-
-    child_env = os.environ.copy()
-    injected = 0
+    handles = _fd_handles(args, vault)
+    wanted = [n for n in _selected_names(args, vault) if n not in handles]
     for name in wanted:
         if name not in vault:
             print_warning(f"Secret '{name}' not found, skipping.")
+    # Blobs go to their memfd straight from disk; other handles resolve as usual.
+    streamed = {n for n in handles if _blob_address(vault[n])}
+    wanted += [n for n in handles if n not in streamed]
+
+    with _SecretArena(sum(len(vault[n]) for n in wanted if n in vault)) as arena, \
+            contextlib.ExitStack() as fds:
+        try:
+            values = _resolve_secrets(fernet, vault, wanted, arena=arena,
+                                      interpolate=not getattr(args, 'no_interpolate', False))
+        except ValueError as e:
+            print_error(str(e))
+            sys.exit(1)
+
+        passed, pass_fds = {}, []
+        for name, kind in handles.items():
+            if name not in streamed and name not in values:
+                sys.exit(1)  # decryption failure, already reported
+            try:
+                fd = _sealed_memfd(name, _read_blob(fernet, _blob_address(vault[name]))
+                                   if name in streamed else [values.pop(name)])
+            except InvalidToken:
+                print_error(f"Failed to decrypt secret '{name}'.")
+                sys.exit(1)
+            except OSError as e:
+                print_error(f"Error passing '{name}' by descriptor: {e}")
+                sys.exit(1)
+            fds.callback(os.close, fd)
+            pass_fds.append(fd)
+            passed[f"{name}_FD" if kind == 'fd' else f"{name}_FILE"] = \
+                str(fd) if kind == 'fd' else f"/proc/self/fd/{fd}"
+
+        # Build the child environment as bytes straight from the arena (str only
+        # where the platform has no bytes environment, i.e. Windows). These are
+        # the only plaintext copies outside locked memory; they are zeroed as
+        # soon as the child exits.
+        if os.supports_bytes_environ:
+            child_env = dict(os.environb)
+            secrets = {os.fsencode(n): bytes(v) for n, v in values.items()}
+        else:
+            child_env = os.environ.copy()
+            secrets = {n: str(v, 'utf-8') for n, v in values.items()}
+        child_env.update(secrets)
+        for var, ref in passed.items():
+            if os.supports_bytes_environ:
+                child_env[os.fsencode(var)] = ref.encode()
+            else:
+                child_env[var] = ref
+        injected = len(values) + len(handles)
+        _audit("run", sorted(set(values) | set(handles)))
+
+        # Diagnostic goes to stderr so it never pollutes the child's stdout
+        # (e.g. `envlockr run -- cmd > out`).
+        via = f" ({len(handles)} by descriptor)" if handles else ""
+        print(f"{Colors.BLUE}ℹ️  Injecting {injected} secret(s){via} into: "
+              f"{' '.join(cmd)}{Colors.NC}", file=sys.stderr)
+        try:
+            completed = subprocess.run(cmd, env=child_env, pass_fds=pass_fds)
+        except FileNotFoundError:
+            print_error(f"Command not found: {cmd[0]}")
+            sys.exit(127)
+        finally:
+            for value in secrets.values():
+                _wipe_bytes(value)
+    sys.exit(completed.returncode)
+
+
+# --- Process supervisor (up) -------------------------------------------------
+# `up` reads a Procfile ("name: command", or "name[A,B]: command" to inject
+# only secrets A and B), decrypts the union of what the processes need once,
+# starts each command with its own subset, and then stays resident as the only
+# envlockr process: it prefixes and multiplexes their output, forwards
+# SIGHUP/SIGUSR1/SIGUSR2, and on Ctrl-C, SIGTERM or the first process exiting,
+# stops the others one at a time in reverse start order.
+
+UP_SHUTDOWN_TIMEOUT = 10.0  # seconds each process gets to exit before SIGKILL
+_PROCFILE_LINE = re.compile(r'^([A-Za-z0-9_.-]+)\s*(?:\[([^\]]*)\])?\s*:\s*(\S.*)$')
+
+
+def _parse_procfile(path):
+    """[(name, [secret names] or None for all, command)], in file order."""
+    entries, seen = [], set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            m = _PROCFILE_LINE.match(line)
+            if not m:
+                raise ValueError(f"{path}:{line_num}: expected 'name: command' or 'name[A,B]: command'")
+            name, subset, command = m.groups()
+            if name in seen:
+                raise ValueError(f"{path}:{line_num}: duplicate process '{name}'")
+            seen.add(name)
+            if subset is not None:
+                subset = [n.strip() for n in subset.split(',') if n.strip()]
+            entries.append((name, subset, command))
+    return entries
+
+
+def _pump_output(stream, prefix, lock):
+    """Copy a child's output to our stdout line by line, each line prefixed."""
+    out = getattr(sys.stdout, 'buffer', None)
+    for line in iter(stream.readline, b''):
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        with lock:
+            if out is not None:
+                out.write(prefix + line)
+            else:
+                sys.stdout.write((prefix + line).decode('utf-8', 'replace'))
+            sys.stdout.flush()
+    stream.close()
+
+
+def _stop_process(proc, sig, timeout):
+    """Signal a child's process group (the process itself on Windows) and wait."""
+    import signal
+    if proc.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            proc.terminate()
+        else:
+            os.killpg(proc.pid, sig)
+    except OSError:
+        return
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        if os.name == 'nt':
+            proc.kill()
+        else:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        proc.wait()
+
+
+def up_command(args):
+    """Run every process in a Procfile with secrets injected, from one decryption pass"""
+    import signal
+    import threading
+    procfile = getattr(args, 'procfile', None) or 'Procfile'
+    try:
+        entries = _parse_procfile(procfile)
+    except (OSError, ValueError) as e:
+        print_error(str(e))
+        sys.exit(1)
+    if not entries:
+        print_error(f"No processes defined in '{procfile}'.")
+        sys.exit(1)
+
+    fernet = load_or_create_key()
+    vault = load_vault()
+    wanted = []
+    for _, subset, _ in entries:
+        for name in (sorted(vault) if subset is None else subset):
+            if name not in vault:
+                print_warning(f"Secret '{name}' not found, skipping.")
+            elif name not in wanted:
+                wanted.append(name)
+
+    timeout = getattr(args, 'timeout', None) or UP_SHUTDOWN_TIMEOUT
+    width = max(len(name) for name, _, _ in entries)
+    palette = [Colors.CYAN, Colors.GREEN, Colors.YELLOW, Colors.BLUE, Colors.RED]
+    lock = threading.Lock()
+    procs, pumps = [], []
+
+    def shutdown():
+        for name, proc in reversed(procs):
+            _stop_process(proc, signal.SIGTERM, timeout)
+
+    with _SecretArena(sum(len(vault[n]) for n in wanted)) as arena:
+        try:
+            values = _resolve_secrets(fernet, vault, wanted, arena=arena,
+                                      interpolate=not getattr(args, 'no_interpolate', False))
+        except ValueError as e:
+            print_error(str(e))
+            sys.exit(1)
+        _audit("up", sorted(values))
+
+        popen_flags = {'start_new_session': True} if os.name != 'nt' else \
+            {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        try:
+            for i, (name, subset, command) in enumerate(entries):
+                names = [n for n in (sorted(vault) if subset is None else subset) if n in values]
+                if os.supports_bytes_environ:
+                    env = dict(os.environb)
+                    secrets = {os.fsencode(n): bytes(values[n]) for n in names}
+                else:
+                    env = os.environ.copy()
+                    secrets = {n: str(values[n], 'utf-8') for n in names}
+                env.update(secrets)
+                try:
+                    proc = subprocess.Popen(command, shell=True, env=env, stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                            **popen_flags)
+                finally:
+                    for value in secrets.values():
+                        _wipe_bytes(value)
+                procs.append((name, proc))
+                prefix = f"{palette[i % len(palette)]}{name:<{width}} |{Colors.NC} ".encode()
+                pump = threading.Thread(target=_pump_output, args=(proc.stdout, prefix, lock),
+                                        daemon=True)
+                pump.start()
+                pumps.append(pump)
+                print(f"{Colors.BLUE}ℹ️  Started {name} (pid {proc.pid}) with "
+                      f"{len(names)} secret(s){Colors.NC}", file=sys.stderr)
+        except OSError as e:
+            print_error(f"Could not start process: {e}")
+            shutdown()
+            sys.exit(1)
+    # The arena is closed and the child environments are wiped: from here on the
+    # supervisor holds no plaintext.
+
+    stop = []
+    forwarded = [getattr(signal, n) for n in ('SIGHUP', 'SIGUSR1', 'SIGUSR2') if hasattr(signal, n)]
+
+    def on_stop(signum, frame):
+        stop.append(signum)
+
+    def on_forward(signum, frame):
+        for _, proc in procs:
+            if proc.poll() is None:
+                try:
+                    os.killpg(proc.pid, signum)
+                except OSError:
+                    pass
+
+    previous = {sig: signal.signal(sig, on_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+    previous.update({sig: signal.signal(sig, on_forward) for sig in forwarded})
+    exit_code = 0
+    try:
+        while not stop:
+            exited = [(name, proc) for name, proc in procs if proc.poll() is not None]
+            if exited:
+                name, proc = exited[0]
+                # A child killed by signal N reports -N; exit like a shell would.
+                exit_code = proc.returncode if proc.returncode >= 0 else 128 - proc.returncode
+                print(f"{Colors.BLUE}ℹ️  {name} exited with code {proc.returncode} — "
+                      f"stopping the rest{Colors.NC}", file=sys.stderr)
+                break
+            time.sleep(0.1)
+        shutdown()
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+    for pump in pumps:
+        pump.join(timeout=1.0)  # drain output; a lingering grandchild may hold the pipe
+    sys.exit(exit_code)
+
+
+# --- File materialization (mount) --------------------------------------------
+# Writes each selected secret as its own 0600 file under a RAM-backed directory
+# for tools that want secrets as files (TLS keys, kubeconfigs). Updates go
+# through a temp file + os.replace so readers never see a half-written value.
+
+MOUNT_POLL_INTERVAL = 1.0  # seconds between vault.json checks in --follow mode
+
+
+def _default_mount_dir():
+    """Return a RAM-backed directory for mounted secrets, or None."""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, "envlockr")
+    if os.path.isdir("/dev/shm"):
+        uid = os.getuid() if hasattr(os, 'getuid') else 0
+        return os.path.join("/dev/shm", f"envlockr-{uid}")
+    return None
+
+
+def _unsafe_mount_dir(path):
+    """Why `path` must not be used as the default mount directory, or None.
+
+    The default lives at a predictable name under a shared directory, so it
+    must be a real directory, ours, and closed to everyone else.
+    """
+    if not hasattr(os, 'getuid'):
+        return None
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode):
+        return "it is a symlink"
+    if not stat.S_ISDIR(st.st_mode):
+        return "it is not a directory"
+    if st.st_uid != os.getuid():
+        return "it is owned by another user"
+    if st.st_mode & 0o077:
+        return f"its mode {st.st_mode & 0o777:o} lets other users in"
+    return None
+
+
+def _is_tmpfs(path):
+    """Return True/False if `path` is on tmpfs/ramfs, or None if unknown."""
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, fstype = "", None
+    for mountpoint, kind in mounts:
+        mountpoint = mountpoint.replace("\\040", " ")
+        prefix = mountpoint.rstrip("/") + "/"
+        if (path == mountpoint or path.startswith(prefix)) and len(mountpoint) > len(best):
+            best, fstype = mountpoint, kind
+    return fstype in ("tmpfs", "ramfs") if fstype else None
+
+
+def _safe_filename(name):
+    """Secret names become file names; refuse anything that could escape the dir."""
+    return bool(name) and name not in (".", "..") and not name.startswith(".") \
+        and "/" not in name and "\\" not in name and "\0" not in name
+
+
+def _write_private_file(path, data):
+    """Atomically replace `path` with `data` (bytes), created 0600."""
+    # mkstemp: unpredictable name, O_EXCL and 0600, so nothing pre-planted in
+    # the directory can capture the plaintext.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        # Unbuffered, so plaintext is not copied into a BufferedWriter buffer.
+        with os.fdopen(fd, 'wb', buffering=0) as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _vault_signature():
+    """Cheap change detector for vault.json (no read, no decrypt)."""
+    try:
+        st = os.stat(VAULT_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _sync_mounted(fernet, vault, wanted, directory, current):
+    """Bring `directory` in line with `vault`, touching only changed entries.
+
+    `current` maps name -> ciphertext of what is already on disk; the returned
+    mapping is the new state. Unchanged ciphertext means no decrypt, no write.
+    """
+    synced = {}
+    for name in wanted:
+        if name not in vault:
+            continue
+        if current.get(name) == vault[name]:
+            synced[name] = vault[name]
             continue
-        decrypted = decrypt_secret(fernet, vault[name])
-        if decrypted is not None:
-            child_env[name] = decrypted
-            injected += 1
+        with _SecretArena(len(vault[name])) as arena:
+            decrypted = _decrypt_into(arena, fernet, vault[name], name)
+            if decrypted is None:
+                continue
+            _write_private_file(os.path.join(directory, name), decrypted)
+            decrypted.release()
+        synced[name] = vault[name]
+    for name in set(current) - set(synced):
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    return synced
+
+
+def mount_command(args):
+    """Materialize secrets as 0600 files under a tmpfs directory."""
+    explicit = getattr(args, 'dir', None)
+    directory = explicit or _default_mount_dir()
+    if not directory:
+        print_error("No RAM-backed directory found ($XDG_RUNTIME_DIR or /dev/shm).")
+        print_info("Pass a tmpfs directory explicitly: envlockr mount DIR")
+        sys.exit(1)
 
-    # Diagnostic goes to stderr so it never pollutes the child's stdout
-    # (e.g. `envlockr run -- cmd > out`).
-    print(f"{Colors.BLUE}ℹ️  Injecting {injected} secret(s) into: "
-          f"{' '.join(cmd)}{Colors.NC}", file=sys.stderr)
     try:
-        completed = subprocess.run(cmd, env=child_env)
-        sys.exit(completed.returncode)
-    except FileNotFoundError:
-        print_error(f"Command not found: {cmd[0]}")
-        sys.exit(127)
+        os.makedirs(directory, mode=0o700)
+        created = True
+    except FileExistsError:
+        created = False
+    problem = None if explicit else _unsafe_mount_dir(directory)
+    if problem:
+        print_error(f"Refusing to mount into '{directory}': {problem}.")
+        print_info("Remove it, or pass a directory you own: envlockr mount DIR")
+        sys.exit(1)
+    if not os.path.isdir(directory):
+        print_error(f"'{directory}' is not a directory.")
+        sys.exit(1)
+
+    on_tmpfs = _is_tmpfs(directory)
+    if on_tmpfs is False and not getattr(args, 'allow_disk', False):
+        print_error(f"'{directory}' is not on tmpfs — secrets would be written to disk.")
+        print_info("Use /dev/shm or $XDG_RUNTIME_DIR, or pass --allow-disk to override.")
+        if created:
+            os.rmdir(directory)
+        sys.exit(1)
+    if on_tmpfs is None:
+        print_warning(f"Could not confirm that '{directory}' is RAM-backed.")
+
+    fernet = load_or_create_key()
+    vault = load_vault()
+
+    wanted = _selected_names(args, vault)
+    for name in [n for n in wanted if not _safe_filename(n)]:
+        print_warning(f"Secret '{name}' is not a safe file name, skipping.")
+    wanted = [n for n in wanted if _safe_filename(n)]
+    for name in wanted:
+        if name not in vault:
+            print_warning(f"Secret '{name}' not found, skipping.")
+
+    mounted = _sync_mounted(fernet, vault, wanted, directory, {})
+    _audit("mount", sorted(mounted))
+    print_success(f"Mounted {len(mounted)} secret(s) in '{directory}'")
+    if not getattr(args, 'follow', False):
+        return
+
+    # --follow: poll vault.json and rewrite only entries whose ciphertext
+    # changed; everything is removed again on exit (Ctrl-C or SIGTERM).
+    import signal
+
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    previous = signal.signal(signal.SIGTERM, _terminate)
+    interval = getattr(args, 'interval', None) or MOUNT_POLL_INTERVAL
+    seen = _vault_signature()
+    print_info("Watching the vault for changes (Ctrl-C to unmount)...")
+    try:
+        while True:
+            time.sleep(interval)
+            sig = _vault_signature()
+            if sig == seen:
+                continue
+            seen = sig
+            vault = load_vault()
+            before = dict(mounted)
+            mounted = _sync_mounted(fernet, vault, wanted, directory, mounted)
+            _audit("mount", sorted(n for n in mounted if before.get(n) != mounted[n]))
+            changed = sum(1 for n in set(before) | set(mounted)
+                          if before.get(n) != mounted.get(n))
+            if changed:
+                print_info(f"Refreshed {changed} secret file(s).")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        _sync_mounted(fernet, {}, [], directory, mounted)
+        if created:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        print_info(f"Removed mounted secrets from '{directory}'.")
+
+
+# --- Fingerprint index -------------------------------------------------------
+# Every entry's meta carries a keyed HMAC fingerprint of its value (see
+# _record_meta), so "where is this value?", "which secrets share a value?" and
+# "how do two profiles differ?" are set operations over fingerprints instead of
+# one Fernet decryption per entry. Profiles compare directly when they share
+# an index key. `diff` itself never writes; `diff --reindex` re-indexes the
+# second profile under the first one's key once (a decrypt pass over it).
+
+def _profile_dir(name):
+    return BASE_DIR if not name or name == "default" else os.path.join(BASE_DIR, "envs", name)
+
+
+@contextlib.contextmanager
+def _using_profile(name):
+    """Temporarily point the active vault paths at another profile."""
+    global PROFILE, VAULT_DIR, VAULT_FILE, KEY_FILE
+    saved = (PROFILE, VAULT_DIR, VAULT_FILE, KEY_FILE)
+    set_profile(name)
+    try:
+        yield
+    finally:
+        PROFILE, VAULT_DIR, VAULT_FILE, KEY_FILE = saved
+
+
+def _profile_names():
+    names = ["default"] if os.path.exists(os.path.join(BASE_DIR, "vault.json")) else []
+    envs = os.path.join(BASE_DIR, "envs")
+    if os.path.isdir(envs):
+        names += sorted(n for n in os.listdir(envs)
+                        if os.path.exists(os.path.join(envs, n, "vault.json")))
+    return names
+
+
+def _indexed_vault(save=True):
+    """(fernet, vault, meta) for the active profile with every fingerprint present.
+
+    `save=False` backfills missing fingerprints in memory only.
+    """
+    fernet = load_or_create_key()
+    vault = load_vault()
+    meta = load_meta()
+    if _ensure_fingerprints(fernet, vault, meta) and save:
+        save_meta(meta)
+    return fernet, vault, meta
+
+
+def _fingerprints(vault, meta):
+    return {n: meta["entries"][n]["fp"] for n in vault if meta["entries"].get(n, {}).get("fp")}
+
+
+def diff_profiles(args):
+    """Compare two profiles by fingerprint, without decrypting values"""
+    for name in (args.profile_a, args.profile_b):
+        if not os.path.exists(os.path.join(_profile_dir(name), "vault.json")):
+            print_error(f"Profile '{name}' has no vault.")
+            return
+
+    reindex = getattr(args, 'reindex', False)
+    with _using_profile(args.profile_a):
+        fernet_a, vault_a, meta_a = _indexed_vault(save=reindex)
+        index_key = _index_key(fernet_a, meta_a)
+    with _using_profile(args.profile_b):
+        fernet_b, vault_b, meta_b = _indexed_vault(save=reindex)
+        if meta_b.get("index_id") != meta_a.get("index_id"):
+            if not reindex:
+                print_error(f"Profiles '{args.profile_a}' and '{args.profile_b}' use different "
+                            "fingerprint keys; their values cannot be compared.")
+                print_info(f"Run `envlockr diff {args.profile_a} {args.profile_b} --reindex` "
+                           f"once to re-index '{args.profile_b}' under the key of "
+                           f"'{args.profile_a}' (decrypts every entry and rewrites its metadata).")
+                sys.exit(1)
+            print_info(f"Re-indexing '{args.profile_b}' with the fingerprint key of "
+                       f"'{args.profile_a}' (one-time)...")
+            meta_b["index_key"] = fernet_b.encrypt(index_key).decode()
+            meta_b["index_id"] = meta_a["index_id"]
+            for entry in meta_b["entries"].values():
+                entry.pop("fp", None)
+            _ensure_fingerprints(fernet_b, vault_b, meta_b)
+            save_meta(meta_b)
+
+    fps_a, fps_b = _fingerprints(vault_a, meta_a), _fingerprints(vault_b, meta_b)
+    only_a = sorted(set(fps_a) - set(fps_b))
+    only_b = sorted(set(fps_b) - set(fps_a))
+    both = set(fps_a) & set(fps_b)
+    differ = sorted(n for n in both if fps_a[n] != fps_b[n])
+    same = len(both) - len(differ)
+
+    if getattr(args, 'json', False):
+        print(json.dumps({"only_in_a": only_a, "only_in_b": only_b,
+                          "different": differ, "identical": same}, indent=2))
+        return
+    print(f"{Colors.CYAN}🔍 {args.profile_a} ↔ {args.profile_b}{Colors.NC}")
+    for name in only_a:
+        print(f"   {Colors.RED}-{Colors.NC} {name}  (only in {args.profile_a})")
+    for name in only_b:
+        print(f"   {Colors.GREEN}+{Colors.NC} {name}  (only in {args.profile_b})")
+    for name in differ:
+        print(f"   {Colors.YELLOW}~{Colors.NC} {name}  (values differ)")
+    print_info(f"{same} identical, {len(differ)} different, "
+               f"{len(only_a) + len(only_b)} missing on one side")
+
+
+def dupes_command(args):
+    """List secrets that share the same value"""
+    _fernet, vault, meta = _indexed_vault()
+    groups = {}
+    for name, fp in _fingerprints(vault, meta).items():
+        groups.setdefault(fp, []).append(name)
+    shared = sorted(sorted(names) for names in groups.values() if len(names) > 1)
+    if not shared:
+        print_success("No two secrets share a value.")
+        return
+    print(f"{Colors.CYAN}♊ Secrets sharing a value ({len(shared)} group(s)){Colors.NC}")
+    for names in shared:
+        print(f"   {Colors.BOLD}•{Colors.NC} {', '.join(names)}")
+
+
+def find_command(args):
+    """Find which secrets hold a given value"""
+    value = _resolve_secret_value(args, "Value to look for: ")
+    if not value:
+        print_error("Value cannot be empty.")
+        return
+    profiles = _profile_names() if getattr(args, 'all_profiles', False) else [None]
+    hits = []
+    for profile in profiles:
+        with contextlib.ExitStack() as stack:
+            if profile is not None:
+                stack.enter_context(_using_profile(profile))
+            fernet, vault, meta = _indexed_vault()
+            fp = _fingerprint(_index_key(fernet, meta), value)
+            hits += [(profile, n) for n, f in sorted(_fingerprints(vault, meta).items())
+                     if f == fp]
+    if not hits:
+        print_info("No secret holds that value.")
+        return
+    for profile, name in hits:
+        print(f"   {Colors.BOLD}•{Colors.NC} {name}" + (f"  [{profile}]" if profile else ""))
 
 
 # --- Liveness verification ---------------------------------------------------
@@ -760,6 +4908,7 @@ def run_command(args):
 # authenticated request to see whether the key is still live. Uses only the
 # stdlib (urllib) so no extra dependency is required.
 
+@_timed("verify_http")
 def _http_status(url, headers, timeout):
     """Return the HTTP status code for a GET request, or None on network error."""
     import urllib.request
@@ -845,7 +4994,7 @@ def verify_command(args):
     labels = {'live': 'live', 'invalid': 'INVALID/revoked', 'unknown': 'unknown provider'}
 
     for name in names:
-        decrypted = decrypt_secret(fernet, vault[name])
+        decrypted = decrypt_secret(fernet, vault[name], name)
         if decrypted is None:
             continue
         provider, status = _detect_and_verify(decrypted, timeout)
@@ -854,36 +5003,454 @@ def verify_command(args):
               f"({prov}): {labels[status]}")
 
 
-def main():
-    """Main entry point for EnvLockr CLI"""
-    parser = argparse.ArgumentParser(
-        description="EnvLockr CLI - Secure Local Secrets Manager",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
+# --- Shell completion ---------------------------------------------------------
+# `completion bash|zsh|fish` prints a script with the command list baked in.
+# Secret names come from <profile>/names.cache, a plain sorted list that
+# save_vault rewrites whenever the set of names changes, and profiles from
+# the directories under <base>/envs, so pressing TAB never starts Python.
+
+NAME_COMMANDS = ('get', 'copy', 'delete', 'update', 'history', 'rollback')
+
+_BASH_COMPLETION = r'''# envlockr bash completion — eval "$(envlockr completion bash)"
+_envlockr() {
+    local cur="${COMP_WORDS[COMP_CWORD]}" prev="${COMP_WORDS[COMP_CWORD-1]}"
+    local base="${ENVLOCKR_HOME:-$HOME/.envlockr}" profile="${ENVLOCKR_ENV:-default}"
+    local cmd="" i d
+    for ((i = 1; i < COMP_CWORD; i++)); do
+        case "${COMP_WORDS[i]}" in
+            -e|--env) profile="${COMP_WORDS[i+1]}"; ((i++)) ;;
+            -*) ;;
+            *) [[ -z $cmd ]] && cmd="${COMP_WORDS[i]}" ;;
+        esac
+    done
+    if [[ $prev == -e || $prev == --env ]]; then
+        local envs=(default)
+        for d in "$base"/envs/*/; do [[ -d $d ]] && d="${d%/}" && envs+=("${d##*/}"); done
+        COMPREPLY=($(compgen -W "${envs[*]}" -- "$cur"))
+    elif [[ -z $cmd ]]; then
+        COMPREPLY=($(compgen -W "@COMMANDS@ --env --help --version" -- "$cur"))
+    else
+        case "$cmd" in
+            @NAME_COMMANDS_BASH@)
+                local dir="$base" names=()
+                [[ $profile != default ]] && dir="$base/envs/$profile"
+                # A plain read loop: macOS still ships bash 3.2.
+                if [[ -r $dir/names.cache && $cur != -* ]]; then
+                    local n
+                    while IFS= read -r n; do names+=("$n"); done < "$dir/names.cache"
+                fi
+                COMPREPLY=($(compgen -W "${names[*]}" -- "$cur")) ;;
+        esac
+    fi
+}
+complete -o default -F _envlockr envlockr
+'''
+
+_ZSH_COMPLETION = r'''#compdef envlockr
+# envlockr zsh completion — eval "$(envlockr completion zsh)", or save as _envlockr in $fpath
+_envlockr() {
+    local base=${ENVLOCKR_HOME:-$HOME/.envlockr} profile=${ENVLOCKR_ENV:-default} cmd i
+    for (( i = 2; i < CURRENT; i++ )); do
+        case ${words[i]} in
+            -e|--env) profile=${words[i+1]}; (( i++ )) ;;
+            -*) ;;
+            *) [[ -z $cmd ]] && cmd=${words[i]} ;;
+        esac
+    done
+    if [[ ${words[CURRENT-1]} == (-e|--env) ]]; then
+        local -a envs
+        envs=(default $base/envs/*(N/:t))
+        compadd -a envs
+    elif [[ -z $cmd ]]; then
+        local -a cmds
+        cmds=(
+@COMMANDS_ZSH@
+        )
+        _describe 'command' cmds
+        compadd -- --env --help --version
+    else
+        case $cmd in
+            (@NAME_COMMANDS_BASH@)
+                local dir=$base
+                [[ $profile != default ]] && dir=$base/envs/$profile
+                [[ -r $dir/names.cache ]] && compadd -- ${(f)"$(<$dir/names.cache)"} ;;
+            (*) _files ;;
+        esac
+    fi
+}
+if [[ $zsh_eval_context[-1] == loadautofunc ]]; then
+    _envlockr "$@"
+else
+    compdef _envlockr envlockr
+fi
+'''
+
+_FISH_COMPLETION = r'''# envlockr fish completion — envlockr completion fish | source
+function __envlockr_command
+    set -l tokens (commandline -opc)
+    set -e tokens[1]
+    set -l skip 0
+    for t in $tokens
+        if test $skip = 1
+            set skip 0
+            continue
+        end
+        switch $t
+            case -e --env
+                set skip 1
+            case '-*'
+            case '*'
+                echo $t
+                return 0
+        end
+    end
+    return 1
+end
+
+function __envlockr_base
+    if set -q ENVLOCKR_HOME
+        echo $ENVLOCKR_HOME
+    else
+        echo $HOME/.envlockr
+    end
+end
+
+function __envlockr_profiles
+    echo default
+    for d in (__envlockr_base)/envs/*/
+        basename $d
+    end
+end
+
+function __envlockr_names
+    set -l profile default
+    set -q ENVLOCKR_ENV; and set profile $ENVLOCKR_ENV
+    set -l tokens (commandline -opc)
+    for i in (seq (count $tokens))
+        if contains -- $tokens[$i] -e --env; and test $i -lt (count $tokens)
+            set profile $tokens[(math $i + 1)]
+        end
+    end
+    set -l dir (__envlockr_base)
+    test "$profile" != default; and set dir $dir/envs/$profile
+    if test -r $dir/names.cache
+        while read -l name
+            echo $name
+        end < $dir/names.cache
+    end
+end
+
+complete -c envlockr -s e -l env -x -a '(__envlockr_profiles)' -d 'Vault profile'
+@COMMANDS_FISH@
+complete -c envlockr -f -n 'contains -- (__envlockr_command) @NAME_COMMANDS_FISH@' -a '(__envlockr_names)'
+'''
+
+
+def _completion_script(shell):
+    """The completion script for `shell`, with the current command list."""
+    import shlex
+    names = sorted(COMMANDS)
+    if shell == 'bash':
+        return (_BASH_COMPLETION.replace("@COMMANDS@", " ".join(names))
+                .replace("@NAME_COMMANDS_BASH@", "|".join(NAME_COMMANDS)))
+    if shell == 'zsh':
+        described = "\n".join(
+            "            " + shlex.quote(n + ":" + COMMANDS[n][0].replace(":", "\\:"))
+            for n in names)
+        return (_ZSH_COMPLETION.replace("@COMMANDS_ZSH@", described)
+                .replace("@NAME_COMMANDS_BASH@", "|".join(NAME_COMMANDS)))
+    described = "\n".join(
+        f"complete -c envlockr -f -n 'not __envlockr_command' -a {n} -d {shlex.quote(COMMANDS[n][0])}"
+        for n in names)
+    return (_FISH_COMPLETION.replace("@COMMANDS_FISH@", described)
+            .replace("@NAME_COMMANDS_FISH@", " ".join(NAME_COMMANDS)))
+
+
+def completion_command(args):
+    """Print a shell completion script"""
+    sys.stdout.write(_completion_script(args.shell))
+
+
+# --- Command line ------------------------------------------------------------
+# Subcommands live in a dispatch table: name -> (help, handler, arguments).
+# main() builds the parser for the command being run only, leaving every other
+# command out; when argv names no known command (--help, a typo, nothing at
+# all) all commands are built, so help and "invalid choice" errors list them.
+
+def _arg(*flags, **kwargs):
+    return flags, kwargs
+
+
+def _positive_int(value):
+    """argparse type: an integer >= 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+COMMANDS = {
+    'add': ('Add a new secret', add_secret, (
+        _arg('name', help='Name of the secret (e.g., API_KEY)'),
+        _arg('--value', '-V', default=None, help='Secret value (non-interactive; avoid in shared shells/history)'),
+        _arg('--stdin', action='store_true', help='Read the secret value from stdin'),
+        _arg('--file', default=None, help='Read the secret value from a file (large values are stored as blobs)'),
+        _arg('--force', '-f', action='store_true', help='Overwrite without confirmation'),
+        _arg('--tag', action='append', default=None, help='Tag the secret (repeatable)'),
+    )),
+    'get': ('Retrieve a secret (prints to stdout)', get_secret, (
+        _arg('name', help='Name of the secret'),
+        _arg('--version', type=int, default=None, help='Print this earlier version (see history)'),
+        _arg('--output', '-o', default=None, help='Write the value to a 0600 file instead of stdout'),
+    )),
+    'list': ('List all stored secrets', list_secrets, (
+        _arg('--long', '-l', action='store_true', help='Show size, last update, provider and tags'),
+        _arg('--json', action='store_true', help='Print metadata as JSON'),
+        _arg('--sort', choices=['name', 'created', 'updated', 'size'], default='name', help='Sort order (default: name)'),
+        _arg('--tag', default=None, help='Only list secrets carrying this tag'),
+    )),
+    'copy': ('Copy a secret to clipboard', copy_secret, (
+        _arg('name', help='Name of the secret'),
+    )),
+    'delete': ('Delete a secret', delete_secret, (
+        _arg('name', help='Name of the secret'),
+        _arg('--force', '-f', action='store_true', help='Delete without confirmation'),
+    )),
+    'update': ('Update an existing secret', update_secret, (
+        _arg('name', help='Name of the secret'),
+        _arg('--value', '-V', default=None, help='New secret value (non-interactive)'),
+        _arg('--stdin', action='store_true', help='Read the new value from stdin'),
+        _arg('--file', default=None, help='Read the new value from a file'),
+        _arg('--tag', action='append', default=None, help='Replace the secret\'s tags (repeatable)'),
+    )),
+    'history': ('Show earlier versions of a secret', history_command, (
+        _arg('name', nargs='?', default=None, help='Name of the secret'),
+        _arg('--compact', action='store_true', help='Prune every history file by the retention policy'),
+        _arg('--keep', type=int, default=None, help='With --compact, versions to keep per secret (default: ENVLOCKR_HISTORY or 10)'),
+        _arg('--max-age', default=None, help='With --compact, drop versions replaced longer ago than this (e.g. 90d)'),
+    )),
+    'rollback': ('Restore an earlier version of a secret', rollback_command, (
+        _arg('name', help='Name of the secret'),
+        _arg('--version', type=int, default=None, help='Version to restore (default: the last one replaced)'),
+    )),
+    'batch': ('Apply many add/update/delete/rename ops in one write', batch_command, (
+        _arg('file', nargs='?', default='-', help='NDJSON file with one op per line (default: stdin)'),
+        _arg('--dry-run', action='store_true', help='Validate and show the ops without writing'),
+    )),
+    'export': ('Export secrets to .env file', export_secrets, (
+        _arg('--output', '-o', default='.env', help='Output file path (default: .env)'),
+        _arg('--force', '-f', action='store_true', help='Overwrite without confirmation'),
+        _arg('--only', default=None, help='Comma-separated subset of secrets to export (default: all)'),
+        _arg('--no-interpolate', action='store_true', help='Export values verbatim, without expanding ${NAME} references'),
+        _arg('--format', choices=EXPORT_FORMATS, default='dotenv', help='Output format (default: dotenv)'),
+        _arg('--fifo', default=None, metavar='PATH', help='Stream to one reader through a new 0600 named pipe instead of a file (POSIX)'),
+        _arg('--timeout', type=float, default=FIFO_TIMEOUT, help='With --fifo, seconds to wait for a reader (default: 60)'),
+    )),
+    'render': ('Render a template, substituting ${NAME} with secrets', render_template, (
+        _arg('template', help='Template file containing ${NAME} references'),
+        _arg('--output', '-o', default=None, help='Write to a 0600 file instead of stdout'),
+        _arg('--force', '-f', action='store_true', help='Overwrite without confirmation'),
+        _arg('--allow-undefined', action='store_true', help='Leave references to unknown secrets verbatim instead of failing'),
+    )),
+    'import': ('Import secrets from .env, docker env-file, JSON, YAML, k8s Secret or CSV', import_secrets, (
+        _arg('file', help='Path to the file to import'),
+        _arg('--force', '-f', action='store_true', help='Overwrite existing secrets'),
+        _arg('--format', choices=['auto'] + sorted(IMPORTERS), default='auto', help='Input format (default: sniffed from the file)'),
+        _arg('--dry-run', action='store_true', help='Show what would change without writing'),
+    )),
+    'encrypt-vault': ('Password-protect your vault for backup/sharing', encrypt_vault_cmd, (
+        _arg('--password', '-p', default=None, help='Encryption password (prompted if omitted)'),
+        _arg('--output', '-o', default='vault.envlockr', help='Output file, or - for stdout (default: vault.envlockr)'),
+        _arg('--format', choices=['v3', 'v2'], default='v3', help='Bundle format (default: v3; v2 for envlockr < 2.1)'),
+        _arg('--no-compress', action='store_true', help='Do not zlib-compress the v3 payload'),
+    )),
+    'decrypt-vault': ('Restore a password-protected vault', decrypt_vault_cmd, (
+        _arg('--file', default='vault.envlockr', help='Encrypted vault file, or - for stdin (default: vault.envlockr)'),
+        _arg('--password', '-p', default=None, help='Decryption password (prompted if omitted)'),
+        _arg('--force', '-f', action='store_true', help='Overwrite existing vault without confirmation'),
+    )),
+    # Export Vault (alias for encrypt-vault)
+    'export-vault': ('Export vault as encrypted file for team sharing', export_vault_cmd, (
+        _arg('--password', '-p', default=None, help='Encryption password (prompted if omitted)'),
+        _arg('--output', '-o', default='vault.envlockr', help='Output file, or - for stdout (default: vault.envlockr)'),
+        _arg('--format', choices=['v3', 'v2'], default='v3', help='Bundle format (default: v3; v2 for envlockr < 2.1)'),
+        _arg('--no-compress', action='store_true', help='Do not zlib-compress the v3 payload'),
+        _arg('--recipient', '-r', action='append', metavar='KEY', help='Encrypt to a public key (or a file of keys) instead of a password; repeatable'),
+    )),
+    # Import Vault (alias for decrypt-vault)
+    'import-vault': ('Import an encrypted vault file from a teammate', import_vault_cmd, (
+        _arg('--file', default='vault.envlockr', help='Encrypted vault file, or - for stdin (default: vault.envlockr)'),
+        _arg('--password', '-p', default=None, help='Decryption password (prompted if omitted)'),
+        _arg('--force', '-f', action='store_true', help='Overwrite existing vault without confirmation'),
+        _arg('--merge', action='store_true', help='Three-way merge into the local vault instead of overwriting it'),
+        _arg('--prefer', choices=['local', 'remote'], default='local', help='Conflict resolution for --merge (default: local)'),
+        _arg('--dry-run', action='store_true', help='With --merge, show what would change without writing'),
+    )),
+    # Public-key sharing
+    'identity': ('Print your recipient public key for --recipient', identity_command, ()),
+    'share': ('Add recipients to a recipient bundle without re-encrypting it', share_command, (
+        _arg('file', help='Recipient bundle written by export-vault --recipient'),
+        _arg('--recipient', '-r', action='append', required=True, metavar='KEY', help='Public key (or a file of keys) to add; repeatable'),
+    )),
+    'completion': ('Print a shell completion script', completion_command, (
+        _arg('shell', choices=['bash', 'zsh', 'fish'], help='Shell to complete for'),
+    )),
+    # Backup / restore (incremental, content-addressed snapshots)
+    'backup': ('Take an incremental encrypted snapshot of the vault', backup_command, (
+        _arg('--dir', default=None, help='Backup directory (default: <vault>/backups)'),
+        _arg('--keep', type=_positive_int, default=None, help='Keep only the newest N snapshots (N >= 1) and GC unreferenced objects'),
+        _arg('--list', action='store_true', help='List snapshots instead of taking one'),
+        _arg('--prune-only', action='store_true', help='Apply --keep without taking a new snapshot'),
+    )),
+    'restore': ('Rebuild the vault from a backup snapshot', restore_command, (
+        _arg('--snapshot', required=True, help='Snapshot ID (or "latest")'),
+        _arg('--dir', default=None, help='Backup directory (default: <vault>/backups)'),
+        _arg('--force', '-f', action='store_true', help='Overwrite the current vault without confirmation'),
+    )),
+    # Run (inject secrets into a subprocess — no .env file touches disk)
+    'run': ('Run a command with secrets injected into its environment', run_command, (
+        _arg('--only', default=None, help='Comma-separated subset of secrets to inject (default: all)'),
+        _arg('--no-interpolate', action='store_true', help='Inject values verbatim, without expanding ${NAME} references'),
+        _arg('--fd', action='append', default=None, metavar='NAME', help='Pass NAME as a sealed in-memory file descriptor, number in $NAME_FD (Linux)'),
+        _arg('--file', action='append', default=None, metavar='NAME', help='Like --fd, with a readable path in $NAME_FILE (Linux)'),
+        _arg('cmd', nargs=argparse.REMAINDER, help='Command to run, after "--" (e.g. run -- npm run dev)'),
+    )),
+    'up': ('Run every process in a Procfile with secrets injected (one decryption)', up_command, (
+        _arg('procfile', nargs='?', default='Procfile', help='Procfile with "name[A,B]: command" lines (default: Procfile)'),
+        _arg('--timeout', type=float, default=UP_SHUTDOWN_TIMEOUT, help='Seconds each process gets to stop before it is killed (default: 10)'),
+        _arg('--no-interpolate', action='store_true', help='Inject values verbatim, without expanding ${NAME} references'),
+    )),
+    # Mount (secrets as 0600 files on tmpfs)
+    'mount': ('Write secrets as 0600 files under a tmpfs directory', mount_command, (
+        _arg('dir', nargs='?', default=None, help='Target directory (default: $XDG_RUNTIME_DIR/envlockr or /dev/shm)'),
+        _arg('--only', default=None, help='Comma-separated subset of secrets to mount (default: all)'),
+        _arg('--follow', action='store_true', help='Keep files in sync with the vault; remove them on exit'),
+        _arg('--interval', type=float, default=MOUNT_POLL_INTERVAL, help='Seconds between vault checks with --follow (default: 1)'),
+        _arg('--allow-disk', action='store_true', help='Allow a directory that is not RAM-backed'),
+    )),
+    # Audit log query
+    'audit': ('Show which secrets were accessed, and when', audit_command, (
+        _arg('--name', '-n', default=None, help='Only records for this secret'),
+        _arg('--command', dest='cmd', default=None, help='Only records from this command (get, copy, run, export, ...)'),
+        _arg('--since', default=None, help='Start time: ISO date/time or relative (30m, 12h, 7d)'),
+        _arg('--until', default=None, help='End time, inclusive: ISO date/time or relative'),
+        _arg('--limit', type=_positive_int, default=None, help='Show only the last N records (N >= 1)'),
+        _arg('--json', action='store_true', help='Print raw JSON lines'),
+    )),
+    'fsck': ('Verify the vault against its integrity tree (no decryption)', fsck_command, (
+        _arg('--init', action='store_true', help='Start (or re-baseline) integrity tracking for this vault'),
+    )),
+    # Fingerprint index queries
+    'diff': ('Compare two profiles without decrypting values', diff_profiles, (
+        _arg('profile_a', help='First profile (e.g. prod)'),
+        _arg('profile_b', help='Second profile (e.g. staging)'),
+        _arg('--json', action='store_true', help='Print the comparison as JSON'),
+        _arg('--reindex', action='store_true', help="Re-index profile B under profile A's fingerprint key first (decrypts B once)"),
+    )),
+    'dupes': ('List secrets that share the same value', dupes_command, (
+    )),
+    'find': ('Find which secrets hold a value', find_command, (
+        _arg('--value', '-V', default=None, help='Value to look for (prompted if omitted)'),
+        _arg('--stdin', action='store_true', help='Read the value from stdin'),
+        _arg('--all-profiles', action='store_true', help='Search every profile, not just the active one'),
+    )),
+    # Verify (liveness check against the provider)
+    'verify': ('Check whether stored keys are still live', verify_command, (
+        _arg('name', nargs='?', default=None, help='Verify a single secret (default: all)'),
+        _arg('--timeout', '-t', type=float, default=5, help='Per-request timeout in seconds (default: 5)'),
+    )),
+    # Secure key (migrate on-disk key into the OS keychain)
+    'secure-key': ('Move the master key into your OS keychain', secure_key_cmd, (
+        _arg('--force', '-f', action='store_true', help='Delete the on-disk key file without confirmation'),
+    )),
+}
+
+_EPILOG = """Examples:
   envlockr add API_KEY          Add a new secret
   envlockr get API_KEY          Retrieve a secret
+  envlockr add KUBECONFIG --file ~/.kube/config
+                                Store a large value as an encrypted blob
+  envlockr get KUBECONFIG -o kubeconfig
+                                Write a secret to a 0600 file
   envlockr copy API_KEY         Copy secret to clipboard
   envlockr list                 List all secrets
+  envlockr batch ops.ndjson     Apply many add/update/delete ops in one write
+  envlockr list --long          Sizes, timestamps and tags (no decryption)
+  envlockr history API_KEY      Show the versions kept for a secret
+  envlockr rollback API_KEY     Undo the last update (or delete) of a secret
   envlockr export               Export to .env file
+  envlockr export --fifo /tmp/app.env --format docker &
+                                Stream once through a named pipe (no file on disk)
   envlockr import .env          Import from .env file
+  envlockr render nginx.tmpl    Render ${NAME} references in a template
   envlockr run -- npm run dev   Run a command with secrets injected (no .env)
+  envlockr run --file KUBECONFIG -- kubectl get pods
+                                Pass a secret as a sealed memfd path (Linux)
+  envlockr up                   Run every process in ./Procfile from one decryption
+  envlockr mount --follow       Materialize secrets as files on tmpfs
   envlockr verify               Check whether stored keys are still live
+  envlockr diff prod staging    Compare two profiles (no decryption)
+  envlockr diff prod staging --reindex
+                                Adopt prod's fingerprint key in staging, then compare
+  envlockr audit --since 1d     Show recent secret accesses
+  envlockr fsck                 Detect tampering or rollback of vault.json
+  envlockr dupes                Find secrets that share a value
   envlockr encrypt-vault        Password-protect your vault
   envlockr decrypt-vault        Restore a password-protected vault
   envlockr export-vault         Export vault for team sharing
   envlockr import-vault         Import a shared vault file
+  envlockr export-vault -r KEY  Export for a teammate's public key (no password)
+  envlockr share team.envlockr -r KEY
+                                Add a recipient without re-encrypting
   envlockr secure-key           Move the master key into your OS keychain
+  envlockr backup --keep 30     Incremental snapshot, keeping the newest 30
+  envlockr restore --snapshot latest
+                                Rebuild the vault from a snapshot
   envlockr --env prod list      Use a named, isolated profile
+  eval "$(envlockr completion bash)"
+                                Enable TAB completion (also zsh, fish)
 
 Environment:
   ENVLOCKR_HOME                 Custom vault directory (default: ~/.envlockr)
   ENVLOCKR_ENV                  Default profile name (default: default)
+  ENVLOCKR_AUDIT                Set to 0 to disable the access audit log
+  ENVLOCKR_CIPHER               Entry cipher for writes: fernet (default), aesgcm, chacha20
+  ENVLOCKR_DURABILITY           fast, normal (fsync file; default) or full (also fsync dir)
+  ENVLOCKR_HISTORY              Versions kept per secret (default: 10; 0 disables history)
+  ENVLOCKR_HISTORY_MAX_AGE      Also drop versions replaced longer ago than this (e.g. 90d)
+  ENVLOCKR_METRICS_FILE         Merge Prometheus metrics into this textfile (off by default)
+  ENVLOCKR_SESSION_CACHE        Cache the unlocked key in the Linux session keyring for N seconds
+  ENVLOCKR_KEYRING_TIMEOUT      Seconds to wait for the OS keychain (default: 5)
 
 Documentation: https://github.com/RohanRatwani/envlockr-cli
-        """
+"""
+
+
+def _command_in(argv):
+    """The subcommand named in `argv`, skipping global options; None if absent."""
+    skip = False
+    for token in argv:
+        if skip:
+            skip = False
+        elif token in ('--env', '-e'):
+            skip = True
+        elif token == '--':
+            return None
+        elif not token.startswith('-'):
+            return token
+    return None
+
+
+def _build_parser(command=None):
+    """Top-level parser, with full arguments only for `command` (if known)."""
+    parser = argparse.ArgumentParser(
+        description="EnvLockr CLI - Secure Local Secrets Manager",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=_EPILOG,
     )
-    
     parser.add_argument(
         '--version', '-v',
         action='version',
@@ -897,116 +5464,75 @@ Documentation: https://github.com/RohanRatwani/envlockr-cli
     )
 
     subparsers = parser.add_subparsers(dest='command', metavar='command')
+    for name, (help_text, func, arguments) in COMMANDS.items():
+        if command in COMMANDS and name != command:
+            continue
+        sub = subparsers.add_parser(name, help=help_text)
+        if name == command or command not in COMMANDS:
+            for flags, kwargs in arguments:
+                sub.add_argument(*flags, **kwargs)
+            sub.set_defaults(func=func)
+    return parser
 
-    # Add
-    add_parser = subparsers.add_parser('add', help='Add a new secret')
-    add_parser.add_argument('name', help='Name of the secret (e.g., API_KEY)')
-    add_parser.add_argument('--value', '-V', default=None, help='Secret value (non-interactive; avoid in shared shells/history)')
-    add_parser.add_argument('--stdin', action='store_true', help='Read the secret value from stdin')
-    add_parser.add_argument('--force', '-f', action='store_true', help='Overwrite without confirmation')
-    add_parser.set_defaults(func=add_secret)
-
-    # Get
-    get_parser = subparsers.add_parser('get', help='Retrieve a secret (prints to stdout)')
-    get_parser.add_argument('name', help='Name of the secret')
-    get_parser.set_defaults(func=get_secret)
-
-    # List
-    list_parser = subparsers.add_parser('list', help='List all stored secrets')
-    list_parser.set_defaults(func=list_secrets)
-
-    # Copy
-    copy_parser = subparsers.add_parser('copy', help='Copy a secret to clipboard')
-    copy_parser.add_argument('name', help='Name of the secret')
-    copy_parser.set_defaults(func=copy_secret)
-
-    # Delete
-    delete_parser = subparsers.add_parser('delete', help='Delete a secret')
-    delete_parser.add_argument('name', help='Name of the secret')
-    delete_parser.add_argument('--force', '-f', action='store_true', help='Delete without confirmation')
-    delete_parser.set_defaults(func=delete_secret)
-
-    # Update
-    update_parser = subparsers.add_parser('update', help='Update an existing secret')
-    update_parser.add_argument('name', help='Name of the secret')
-    update_parser.add_argument('--value', '-V', default=None, help='New secret value (non-interactive)')
-    update_parser.add_argument('--stdin', action='store_true', help='Read the new value from stdin')
-    update_parser.set_defaults(func=update_secret)
-
-    # Export
-    export_parser = subparsers.add_parser('export', help='Export secrets to .env file')
-    export_parser.add_argument('--output', '-o', default='.env', help='Output file path (default: .env)')
-    export_parser.add_argument('--force', '-f', action='store_true', help='Overwrite without confirmation')
-    export_parser.set_defaults(func=export_secrets)
-
-    # Import
-    import_parser = subparsers.add_parser('import', help='Import secrets from .env file')
-    import_parser.add_argument('file', help='Path to .env file to import')
-    import_parser.add_argument('--force', '-f', action='store_true', help='Overwrite existing secrets')
-    import_parser.set_defaults(func=import_secrets)
-
-    # Encrypt Vault
-    enc_parser = subparsers.add_parser('encrypt-vault', help='Password-protect your vault for backup/sharing')
-    enc_parser.add_argument('--password', '-p', default=None, help='Encryption password (prompted if omitted)')
-    enc_parser.add_argument('--output', '-o', default='vault.envlockr', help='Output file (default: vault.envlockr)')
-    enc_parser.set_defaults(func=encrypt_vault_cmd)
-
-    # Decrypt Vault
-    dec_parser = subparsers.add_parser('decrypt-vault', help='Restore a password-protected vault')
-    dec_parser.add_argument('--file', default='vault.envlockr', help='Encrypted vault file (default: vault.envlockr)')
-    dec_parser.add_argument('--password', '-p', default=None, help='Decryption password (prompted if omitted)')
-    dec_parser.add_argument('--force', '-f', action='store_true', help='Overwrite existing vault without confirmation')
-    dec_parser.set_defaults(func=decrypt_vault_cmd)
-
-    # Export Vault (alias for encrypt-vault)
-    expv_parser = subparsers.add_parser('export-vault', help='Export vault as encrypted file for team sharing')
-    expv_parser.add_argument('--password', '-p', default=None, help='Encryption password (prompted if omitted)')
-    expv_parser.add_argument('--output', '-o', default='vault.envlockr', help='Output file (default: vault.envlockr)')
-    expv_parser.set_defaults(func=export_vault_cmd)
-
-    # Import Vault (alias for decrypt-vault)
-    impv_parser = subparsers.add_parser('import-vault', help='Import an encrypted vault file from a teammate')
-    impv_parser.add_argument('--file', default='vault.envlockr', help='Encrypted vault file (default: vault.envlockr)')
-    impv_parser.add_argument('--password', '-p', default=None, help='Decryption password (prompted if omitted)')
-    impv_parser.add_argument('--force', '-f', action='store_true', help='Overwrite existing vault without confirmation')
-    impv_parser.set_defaults(func=import_vault_cmd)
 
-    # Run (inject secrets into a subprocess — no .env file touches disk)
-    run_parser = subparsers.add_parser('run', help='Run a command with secrets injected into its environment')
-    run_parser.add_argument('--only', default=None, help='Comma-separated subset of secrets to inject (default: all)')
-    run_parser.add_argument('cmd', nargs=argparse.REMAINDER, help='Command to run, after "--" (e.g. run -- npm run dev)')
-    run_parser.set_defaults(func=run_command)
+def _setup_console():
+    """Make stdout/stderr emoji-safe and enable ANSI colors where supported.
 
-    # Verify (liveness check against the provider)
-    verify_parser = subparsers.add_parser('verify', help='Check whether stored keys are still live')
-    verify_parser.add_argument('name', nargs='?', default=None, help='Verify a single secret (default: all)')
-    verify_parser.add_argument('--timeout', '-t', type=float, default=5, help='Per-request timeout in seconds (default: 5)')
-    verify_parser.set_defaults(func=verify_command)
+    Streams that already encode UTF-8 are left alone.
+    """
+    # Ensure stdout/stderr can encode emoji/Unicode on Windows (cp1252 consoles
+    # otherwise raise UnicodeEncodeError on the ✅/❌/🔐 status glyphs).
+    for stream in (sys.stdout, sys.stderr):
+        if (getattr(stream, 'encoding', None) or '').lower().replace('-', '') == 'utf8':
+            continue
+        try:
+            stream.reconfigure(encoding='utf-8', errors='replace')
+        except (AttributeError, ValueError):
+            pass
+    if sys.platform == 'win32' and sys.stdout.isatty():
+        try:
+            # Enable ANSI colors on Windows 10+
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
+        except Exception:
+            Colors.disable()
 
-    # Secure key (migrate on-disk key into the OS keychain)
-    sk_parser = subparsers.add_parser('secure-key', help='Move the master key into your OS keychain')
-    sk_parser.add_argument('--force', '-f', action='store_true', help='Delete the on-disk key file without confirmation')
-    sk_parser.set_defaults(func=secure_key_cmd)
 
-    args = parser.parse_args()
+def main(argv=None):
+    """Main entry point for EnvLockr CLI"""
+    global _metrics_command
+    argv = sys.argv[1:] if argv is None else argv
+    command = _command_in(argv)
+    _setup_console()
+    parser = _build_parser(command)
+    args = parser.parse_args(argv)
 
     # Resolve the active profile before any vault/key access.
     set_profile(getattr(args, 'env', 'default'))
 
-    # Check key file security on startup
-    check_key_file_security()
-
     if hasattr(args, 'func'):
+        _metrics_command = command
+        start, status = time.perf_counter(), "ok"
         try:
             args.func(args)
         except KeyboardInterrupt:
             print("\n")
             print_info("Operation cancelled.")
             sys.exit(0)
+        except SystemExit as e:
+            status = "ok" if e.code in (0, None) else "error"
+            raise
         except Exception as e:
+            status = "error"
             print_error(f"Unexpected error: {e}")
             print_info("Please report this issue at: https://github.com/RohanRatwani/envlockr-cli/issues")
             sys.exit(1)
+        finally:
+            if os.environ.get("ENVLOCKR_METRICS_FILE"):
+                _metric_inc("envlockr_command_runs_total", (("status", status),))
+                _observe("envlockr_command_duration_seconds", (), time.perf_counter() - start)
+                _flush_metrics()
     else:
         parser.print_help()
 
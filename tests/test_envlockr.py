@@ -4,11 +4,14 @@ Unit tests for EnvLockr CLI
 Run with: python run_tests.py
 """
 
+import argparse
 import json
 import os
 import sys
 import tempfile
+import time
 import shutil
+import stat
 import unittest
 from unittest.mock import patch, MagicMock
 from io import StringIO
@@ -86,6 +89,79 @@ class TestEnvLockrSetup(unittest.TestCase):
         self.assertEqual(loaded_vault, test_vault)
 
 
+class TestKeyProviders(unittest.TestCase):
+    """Test key provider ordering: session cache, keychain timeout, key file."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        if envlockr._keyctl_syscall():
+            envlockr._session_cache_clear()
+        envlockr._keychain_stalled = False
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _hung_keychain(self):
+        import threading
+        release = threading.Event()
+        self.addCleanup(release.set)
+        backend = MagicMock()
+        backend.get_password.side_effect = lambda *a: release.wait(10)
+        return patch.multiple(envlockr, keyring=backend, KEYRING_AVAILABLE=True, create=True)
+
+    def test_hung_keychain_falls_back_to_key_file(self):
+        key = envlockr.Fernet.generate_key()
+        envlockr._write_key_file(key)
+        with self._hung_keychain(), \
+                patch.dict(os.environ, {"ENVLOCKR_KEYRING_TIMEOUT": "0.1"}), \
+                patch('sys.stdout', new=StringIO()) as out:
+            fernet = envlockr.load_or_create_key()
+        self.assertEqual(fernet.decrypt(envlockr.Fernet(key).encrypt(b"x")), b"x")
+        self.assertIn("did not answer", out.getvalue())
+
+    def test_key_material_comes_from_the_raw_key(self):
+        import base64
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+        key = envlockr.Fernet.generate_key()
+        fernet = envlockr._make_fernet(key)
+        self.assertEqual(fernet.raw_key, base64.urlsafe_b64decode(key))
+        expected = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                        info=b"envlockr/backup").derive(fernet.raw_key)
+        self.assertEqual(envlockr._subkey(fernet, "backup"), expected)
+
+    def test_hung_keychain_never_creates_a_shadow_key(self):
+        with self._hung_keychain(), \
+                patch.dict(os.environ, {"ENVLOCKR_KEYRING_TIMEOUT": "0.1"}), \
+                patch('sys.stdout', new=StringIO()), self.assertRaises(SystemExit):
+            envlockr.load_or_create_key()
+        self.assertFalse(os.path.exists(envlockr.KEY_FILE))
+
+    def test_session_cache_serves_key_until_key_changes(self):
+        if not envlockr._keyctl_syscall():
+            self.skipTest("kernel keyring not available")
+        key = envlockr.Fernet.generate_key()
+        envlockr._write_key_file(key)
+        envlockr.save_vault({})
+        with patch.dict(os.environ, {"ENVLOCKR_SESSION_CACHE": "60"}):
+            envlockr.load_or_create_key()
+            if envlockr._session_cache_get() != key:
+                self.skipTest("session keyring not writable here")
+            os.rename(envlockr.KEY_FILE, envlockr.KEY_FILE + ".moved")
+            with patch.object(envlockr, '_read_key_file', side_effect=AssertionError("read")):
+                envlockr.load_or_create_key()  # served from the kernel keyring
+            envlockr._write_key_file(envlockr.Fernet.generate_key())
+            self.assertIsNone(envlockr._session_cache_get())
+
+
 class TestSecretOperations(unittest.TestCase):
     """Test secret add/get/update/delete operations"""
     
@@ -118,6 +194,7 @@ class TestSecretOperations(unittest.TestCase):
         args.force = False
         args.value = "my_secret_value"
         args.stdin = False
+        args.file = None
 
         with patch('sys.stdout', new=StringIO()):
             envlockr.add_secret(args)
@@ -139,6 +216,9 @@ class TestSecretOperations(unittest.TestCase):
         args.force = False
         args.value = "my_secret_value"
         args.stdin = False
+        args.file = None
+        args.version = None
+        args.output = None
 
         with patch('sys.stdout', new=StringIO()):
             envlockr.add_secret(args)
@@ -154,6 +234,8 @@ class TestSecretOperations(unittest.TestCase):
         """Test getting a secret that doesn't exist"""
         args = MagicMock()
         args.name = "NONEXISTENT"
+        args.version = None
+        args.output = None
         
         with patch('sys.stdout', new=StringIO()) as mock_stdout:
             envlockr.get_secret(args)
@@ -170,11 +252,12 @@ class TestSecretOperations(unittest.TestCase):
             args.force = True
             args.value = "value"
             args.stdin = False
+            args.file = None
             with patch('sys.stdout', new=StringIO()):
                 envlockr.add_secret(args)
         
         # List them
-        args = MagicMock()
+        args = MagicMock(long=False, json=False, sort='name', tag=None)
         with patch('sys.stdout', new=StringIO()) as mock_stdout:
             envlockr.list_secrets(args)
             output = mock_stdout.getvalue()
@@ -185,7 +268,7 @@ class TestSecretOperations(unittest.TestCase):
     
     def test_list_empty_vault(self):
         """Test listing when no secrets exist"""
-        args = MagicMock()
+        args = MagicMock(long=False, json=False, sort='name', tag=None)
         
         with patch('sys.stdout', new=StringIO()) as mock_stdout:
             envlockr.list_secrets(args)
@@ -202,6 +285,7 @@ class TestSecretOperations(unittest.TestCase):
         args.force = True
         args.value = "my_secret_value"
         args.stdin = False
+        args.file = None
 
         with patch('sys.stdout', new=StringIO()):
             envlockr.add_secret(args)
@@ -227,6 +311,7 @@ class TestSecretOperations(unittest.TestCase):
         args.force = True
         args.value = "original_value"
         args.stdin = False
+        args.file = None
 
         with patch('sys.stdout', new=StringIO()):
             envlockr.add_secret(args)
@@ -280,12 +365,13 @@ class TestExportImport(unittest.TestCase):
             args.force = True
             args.value = value
             args.stdin = False
+            args.file = None
             with patch('sys.stdout', new=StringIO()):
                 envlockr.add_secret(args)
         
         # Export to file
         output_file = os.path.join(self.temp_dir, ".env")
-        args = MagicMock()
+        args = MagicMock(only=None, no_interpolate=False, fifo=None, format='dotenv')
         args.output = output_file
         args.force = True
         
@@ -300,6 +386,48 @@ class TestExportImport(unittest.TestCase):
         
         self.assertIn("API_KEY=secret123", content)
         self.assertIn("DB_URL=postgres://localhost", content)
+
+    def test_export_formats(self):
+        values = {"B": "line1\nline2", "A": "plain"}
+        self.assertEqual(json.loads(envlockr._render_export(values, 'json')), values)
+        with patch('sys.stdout', new=StringIO()):
+            docker = envlockr._render_export(values, 'docker')
+        self.assertIn("A=plain\n", docker)
+        self.assertNotIn("B=", docker)  # docker env-files can't hold multi-line values
+        self.assertIn('B="line1\nline2"', envlockr._render_export(values, 'dotenv'))
+
+    @unittest.skipUnless(hasattr(os, 'mkfifo'), "named pipes are POSIX-only")
+    def test_export_fifo_serves_one_reader_then_disappears(self):
+        import threading
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"API_KEY": fernet.encrypt(b"secret123").decode()})
+        fifo = os.path.join(self.temp_dir, "env.fifo")
+        args = MagicMock(only=None, no_interpolate=False, fifo=fifo, format='docker', timeout=10)
+        received = []
+
+        def read():
+            for _ in range(500):
+                if os.path.exists(fifo):
+                    break
+                time.sleep(0.01)
+            received.append(stat.S_IMODE(os.stat(fifo).st_mode))
+            with open(fifo) as f:
+                received.append(f.read())
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.export_secrets(args)
+        reader.join(10)
+        self.assertEqual(received[0], 0o600)
+        self.assertIn("API_KEY=secret123\n", received[1])
+        self.assertFalse(os.path.exists(fifo))
+
+        # Nobody reads: the pipe is removed after the timeout.
+        args.timeout = 0.2
+        with patch('sys.stdout', new=StringIO()), self.assertRaises(SystemExit):
+            envlockr.export_secrets(args)
+        self.assertFalse(os.path.exists(fifo))
     
     @patch('builtins.input')
     def test_import_secrets(self, mock_input):
@@ -313,7 +441,7 @@ class TestExportImport(unittest.TestCase):
             f.write('QUOTED_VALUE="with spaces"\n')
         
         # Import it
-        args = MagicMock()
+        args = MagicMock(format='auto', dry_run=False)
         args.file = env_file
         args.force = True
         
@@ -351,6 +479,52 @@ class TestExportImport(unittest.TestCase):
         
         self.assertIn("not found", output.lower())
 
+    def _import(self, path, **opts):
+        args = MagicMock(file=path, force=False, format='auto', dry_run=False)
+        for k, v in opts.items():
+            setattr(args, k, v)
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.import_secrets(args)
+        return out.getvalue()
+
+    def _values(self):
+        fernet = envlockr.load_or_create_key()
+        return {k: envlockr.decrypt_secret(fernet, v)
+                for k, v in envlockr.load_vault().items()}
+
+    def test_import_k8s_secret_manifest(self):
+        path = os.path.join(self.temp_dir, "secret.yaml")
+        with open(path, 'w') as f:
+            f.write("apiVersion: v1\nkind: Secret\nmetadata:\n  name: app\n"
+                    "type: Opaque\ndata:\n  DB_PASSWORD: czNjcjN0\n"
+                    "stringData:\n  MODE: \"prod\"\n")
+        self._import(path)
+        self.assertEqual(self._values(), {"DB_PASSWORD": "s3cr3t", "MODE": "prod"})
+
+    def test_import_password_manager_csv(self):
+        path = os.path.join(self.temp_dir, "export.csv")
+        with open(path, 'w') as f:
+            f.write("name,url,username,password\nGitHub token,https://github.com,me,ghp_x\n")
+        self._import(path)
+        self.assertEqual(self._values(), {"GITHUB_TOKEN": "ghp_x"})
+
+    def test_import_docker_env_file_keeps_quotes(self):
+        path = os.path.join(self.temp_dir, "app.env")
+        with open(path, 'w') as f:
+            f.write('QUOTED="kept"\n')
+        self._import(path, format='docker')
+        self.assertEqual(self._values(), {"QUOTED": '"kept"'})
+
+    def test_import_dry_run_writes_nothing(self):
+        envlockr.save_vault({"A": envlockr.load_or_create_key().encrypt(b"old").decode()})
+        path = os.path.join(self.temp_dir, "in.json")
+        with open(path, 'w') as f:
+            json.dump({"A": "new", "B": "b"}, f)
+        output = self._import(path, dry_run=True)
+        self.assertIn("+ B", output)
+        self.assertIn("! A", output)
+        self.assertEqual(self._values(), {"A": "old"})
+
 
 class TestDecryptSecret(unittest.TestCase):
     """Test the decrypt_secret helper function"""
@@ -396,6 +570,662 @@ class TestDecryptSecret(unittest.TestCase):
         self.assertIsNone(result)
 
 
+class TestEntryCiphers(unittest.TestCase):
+    """Test the AEAD entry format selected by ENVLOCKR_CIPHER."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        self.fernet = envlockr.load_or_create_key()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def test_aead_roundtrip_is_compact(self):
+        for cipher, tag in envlockr.ENTRY_CIPHERS.items():
+            with patch.dict(os.environ, {"ENVLOCKR_CIPHER": cipher}):
+                token = envlockr._encrypt_value(self.fernet, "API_KEY", "sk-123")
+            self.assertTrue(token.startswith(tag + ":"))
+            self.assertLess(len(token), len(self.fernet.encrypt(b"sk-123")))
+            self.assertEqual(envlockr.decrypt_secret(self.fernet, token, "API_KEY"), "sk-123")
+
+    def test_name_is_bound_as_associated_data(self):
+        with patch.dict(os.environ, {"ENVLOCKR_CIPHER": "aesgcm"}):
+            token = envlockr._encrypt_value(self.fernet, "A", "value")
+        with patch('sys.stdout', new=StringIO()):
+            self.assertIsNone(envlockr.decrypt_secret(self.fernet, token, "B"))
+            self.assertIsNone(envlockr.decrypt_secret(self.fernet, token))
+
+    def test_update_migrates_entry_and_fernet_still_reads(self):
+        envlockr.save_vault({"OLD": self.fernet.encrypt(b"legacy").decode(),
+                             "MOVE": self.fernet.encrypt(b"v1").decode()})
+        args = MagicMock(value="v2", stdin=False, file=None, tag=None)
+        args.name = "MOVE"
+        with patch.dict(os.environ, {"ENVLOCKR_CIPHER": "chacha20"}), \
+             patch('sys.stdout', new=StringIO()):
+            envlockr.update_secret(args)
+        vault = envlockr.load_vault()
+        self.assertTrue(vault["MOVE"].startswith("c1:"))
+        self.assertTrue(vault["OLD"].startswith("gAAAAA"))
+        resolved = envlockr._resolve_secrets(self.fernet, vault, ["OLD", "MOVE"])
+        self.assertEqual(resolved, {"OLD": "legacy", "MOVE": "v2"})
+
+    def test_unknown_cipher_exits(self):
+        with patch.dict(os.environ, {"ENVLOCKR_CIPHER": "rot13"}), \
+             patch('sys.stdout', new=StringIO()), self.assertRaises(SystemExit):
+            envlockr._encrypt_value(self.fernet, "A", "x")
+
+
+class TestConcurrentWrites(unittest.TestCase):
+    """Test locked, atomic saves from concurrent processes."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def test_save_rebases_onto_concurrent_save(self):
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"A": fernet.encrypt(b"1").decode(),
+                             "B": fernet.encrypt(b"2").decode()})
+        mine = envlockr.load_vault()
+        # Another process adds C and changes B after we loaded.
+        with open(envlockr.VAULT_FILE) as f:
+            theirs = json.load(f)
+        theirs["C"] = fernet.encrypt(b"3").decode()
+        theirs["B"] = fernet.encrypt(b"22").decode()
+        with open(envlockr.VAULT_FILE, 'w') as f:
+            json.dump(theirs, f)
+
+        mine["D"] = fernet.encrypt(b"4").decode()
+        del mine["A"]
+        envlockr.save_vault(mine)
+        saved = envlockr.load_vault()
+        self.assertEqual(sorted(saved), ["B", "C", "D"])
+        self.assertEqual(saved["B"], theirs["B"])
+
+    def test_save_refuses_to_overwrite_a_corrupted_vault(self):
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"A": fernet.encrypt(b"1").decode()})
+        mine = envlockr.load_vault()
+        with open(envlockr.VAULT_FILE, 'w') as f:
+            f.write("{truncated")
+        mine["B"] = fernet.encrypt(b"2").decode()
+        with patch('sys.stdout', new=StringIO()) as out, self.assertRaises(SystemExit) as ctx:
+            envlockr.save_vault(mine)
+        self.assertEqual(ctx.exception.code, 1)
+        self.assertIn("corrupted", out.getvalue())
+        with open(envlockr.VAULT_FILE) as f:
+            self.assertEqual(f.read(), "{truncated")
+
+    def test_fifty_concurrent_writers_lose_nothing(self):
+        import subprocess
+        script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "envlockr.py")
+        env = dict(os.environ, ENVLOCKR_HOME=self.temp_dir, ENVLOCKR_AUDIT="0",
+                   ENVLOCKR_DURABILITY="fast",
+                   PYTHON_KEYRING_BACKEND="keyring.backends.fail.Keyring")
+        env.pop("ENVLOCKR_ENV", None)
+        procs = [subprocess.Popen([sys.executable, script, "add", f"K{i}", "--value", f"v{i}",
+                                   "--force"], env=env, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+                 for i in range(50)]
+        self.assertEqual([p.wait(timeout=120) for p in procs], [0] * 50)
+
+        fernet = envlockr.load_or_create_key()  # the single key every writer agreed on
+        vault = envlockr.load_vault()
+        self.assertEqual(len(vault), 50)
+        for i in range(50):
+            self.assertEqual(envlockr.decrypt_secret(fernet, vault[f"K{i}"], f"K{i}"), f"v{i}")
+        self.assertEqual(len(envlockr.load_meta()["entries"]), 50)
+
+
+class TestMetrics(unittest.TestCase):
+    """Test the opt-in Prometheus textfile metrics."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.prom = os.path.join(self.temp_dir, "envlockr.prom")
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        envlockr._metrics.clear()
+
+    def tearDown(self):
+        envlockr._metrics.clear()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def test_nothing_recorded_unless_enabled(self):
+        with patch.dict(os.environ):
+            os.environ.pop("ENVLOCKR_METRICS_FILE", None)
+            envlockr.load_vault()
+            envlockr._metric_inc("envlockr_decrypt_failures_total")
+        self.assertEqual(envlockr._metrics, {})
+
+    def test_phases_and_failures_are_merged_into_the_file(self):
+        fernet = envlockr.load_or_create_key()
+        with patch.dict(os.environ, {"ENVLOCKR_METRICS_FILE": self.prom}):
+            for _ in range(2):
+                envlockr.load_vault()
+                with patch('sys.stdout', new=StringIO()):
+                    envlockr.decrypt_secret(fernet, "not-a-token", "A")
+                envlockr._flush_metrics()
+        with open(self.prom) as f:
+            text = f.read()
+        values = envlockr._parse_metrics(text)
+        self.assertEqual(values['envlockr_decrypt_failures_total{command="none"}'], 2)
+        self.assertEqual(values['envlockr_phase_duration_seconds_count'
+                                '{command="none",phase="vault_load"}'], 2)
+        buckets = [line for line in text.splitlines() if 'phase="vault_load",le=' in line]
+        self.assertEqual(len(buckets), len(envlockr.METRICS_BUCKETS) + 1)
+        self.assertEqual(text.count("# TYPE envlockr_phase_duration_seconds histogram"), 1)
+
+    def test_concurrent_runs_add_up(self):
+        import subprocess
+        script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "envlockr.py")
+        env = dict(os.environ, ENVLOCKR_HOME=self.temp_dir, ENVLOCKR_METRICS_FILE=self.prom,
+                   PYTHON_KEYRING_BACKEND="keyring.backends.fail.Keyring")
+        env.pop("ENVLOCKR_ENV", None)
+        procs = [subprocess.Popen([sys.executable, script, "list"], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for _ in range(8)]
+        self.assertEqual([p.wait(timeout=60) for p in procs], [0] * 8)
+        with open(self.prom) as f:
+            values = envlockr._parse_metrics(f.read())
+        self.assertEqual(values['envlockr_command_runs_total{command="list",status="ok"}'], 8)
+        if sys.platform != 'win32':
+            self.assertEqual(stat.S_IMODE(os.stat(self.prom).st_mode), 0o644)
+
+
+class TestCompletion(unittest.TestCase):
+    """Test the completion scripts and the name cache they read."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _cached_names(self):
+        with open(envlockr._names_cache_file()) as f:
+            return f.read().split()
+
+    def test_name_cache_follows_saves(self):
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"B": fernet.encrypt(b"1").decode()})
+        vault = envlockr.load_vault()
+        vault["A"] = fernet.encrypt(b"2").decode()
+        envlockr.save_vault(vault)
+        self.assertEqual(self._cached_names(), ["A", "B"])
+        args = MagicMock(force=True)
+        args.name = "B"
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.delete_secret(args)
+        self.assertEqual(self._cached_names(), ["A"])
+
+    def test_scripts_cover_every_command(self):
+        for shell in ('bash', 'zsh', 'fish'):
+            script = envlockr._completion_script(shell)
+            for name in envlockr.COMMANDS:
+                self.assertIn(name, script)
+            self.assertIn("names.cache", script)
+            self.assertNotIn("@", script.replace("$@", ""))  # every placeholder filled
+
+    @unittest.skipIf(sys.platform == 'win32' or not shutil.which('bash'), "needs bash")
+    def test_bash_completes_names_per_profile_without_python(self):
+        import subprocess
+        os.makedirs(os.path.join(self.temp_dir, "envs", "prod"))
+        with open(os.path.join(self.temp_dir, "envs", "prod", "names.cache"), 'w') as f:
+            f.write("PROD_DB\n")
+        with open(os.path.join(self.temp_dir, "names.cache"), 'w') as f:
+            f.write("API_KEY\nAPI_URL\nOTHER\n")
+        script = os.path.join(self.temp_dir, "envlockr.bash")
+        with open(script, 'w') as f:
+            f.write(envlockr._completion_script('bash'))
+        probe = (f'source "{script}"; '
+                 't() { COMP_WORDS=("$@"); COMP_CWORD=$((${#COMP_WORDS[@]}-1)); '
+                 '_envlockr; echo "${COMPREPLY[*]}"; }; '
+                 't envlockr get API_; t envlockr -e prod rollback ""; t envlockr --env ""; '
+                 't envlockr hist')
+        env = dict(os.environ, ENVLOCKR_HOME=self.temp_dir, PATH="/nonexistent")
+        env.pop("ENVLOCKR_ENV", None)
+        out = subprocess.run([shutil.which('bash'), '--norc', '-c', probe], env=env,
+                             capture_output=True, text=True, check=True).stdout
+        self.assertEqual(out.splitlines(), ["API_KEY API_URL", "PROD_DB", "default prod", "history"])
+
+    def test_bash_script_runs_on_bash_3(self):
+        script = envlockr._completion_script('bash')
+        for builtin in ("mapfile", "readarray", "declare -A", "${cur,,}", "coproc"):
+            self.assertNotIn(builtin, script)  # bash 4+ only; macOS ships 3.2
+
+
+class TestHistory(unittest.TestCase):
+    """Test per-secret version history, rollback and retention."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _set(self, value):
+        args = MagicMock(value=value, stdin=False, file=None, force=True, tag=None)
+        args.name = "API_KEY"
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.add_secret(args)
+
+    def _get(self, version=None):
+        args = MagicMock(version=version, output=None)
+        args.name = "API_KEY"
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.get_secret(args)
+        return out.getvalue().strip()
+
+    def _rollback(self, version=None):
+        args = MagicMock(version=version)
+        args.name = "API_KEY"
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.rollback_command(args)
+        return out.getvalue()
+
+    def test_versions_are_kept_out_of_line(self):
+        for value in ("one", "two", "three"):
+            self._set(value)
+        with open(envlockr.VAULT_FILE) as f:
+            self.assertEqual(list(json.load(f)), ["API_KEY"])  # only the current value
+        self.assertEqual(self._get(), "three")
+        self.assertEqual(self._get(version=1), "one")
+        self.assertEqual(self._get(version=3), "three")
+        self.assertIn("not found", self._get(version=9))
+        self.assertEqual([v["version"] for v in envlockr._load_history("API_KEY")], [1, 2])
+
+    def test_history_of_one_save_is_written_in_one_pass(self):
+        fernet = envlockr.load_or_create_key()
+        names = ("A", "B", "C")
+        envlockr.save_vault({n: fernet.encrypt(b"old").decode() for n in names})
+        with patch.object(envlockr, '_atomic_write_many',
+                          wraps=envlockr._atomic_write_many) as write, \
+             patch('sys.stdout', new=StringIO()):
+            envlockr.save_vault({n: fernet.encrypt(b"new").decode() for n in names})
+        history = [c for c in write.call_args_list
+                   if os.path.dirname(next(iter(c.args[0]))) == envlockr._history_dir()]
+        self.assertEqual(len(history), 1)
+        self.assertEqual(len(history[0].args[0]), 3)
+        for name in names:
+            self.assertEqual(len(envlockr._load_history(name)), 1)
+
+    def test_rollback_restores_and_is_undoable(self):
+        self._set("good")
+        self._set("bad")
+        self.assertIn("version 1 (now version 3)", self._rollback())
+        self.assertEqual(self._get(), "good")
+        self._rollback(version=2)
+        self.assertEqual(self._get(), "bad")
+
+        args = MagicMock(force=True)
+        args.name = "API_KEY"
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.delete_secret(args)
+        self._rollback()
+        self.assertEqual(self._get(), "bad")
+        self.assertEqual(envlockr.load_meta()["entries"]["API_KEY"]["version"], 5)
+
+    def test_retention_by_count_and_age(self):
+        with patch.dict(os.environ, {"ENVLOCKR_HISTORY": "2"}):
+            for i in range(6):
+                self._set(f"v{i}")
+        self.assertEqual([v["version"] for v in envlockr._load_history("API_KEY")], [4, 5])
+
+        path = envlockr._history_file("API_KEY")
+        with open(path) as f:
+            data = json.load(f)
+        data["versions"][0]["replaced"] = "2000-01-01T00:00:00Z"
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        args = MagicMock(compact=True, keep=None, max_age="30d")
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.history_command(args)
+        self.assertIn("Dropped 1", out.getvalue())
+        self.assertEqual([v["version"] for v in envlockr._load_history("API_KEY")], [5])
+
+    def test_history_can_be_disabled(self):
+        with patch.dict(os.environ, {"ENVLOCKR_HISTORY": "0"}):
+            self._set("one")
+            self._set("two")
+        self.assertFalse(os.path.exists(envlockr._history_dir()))
+
+
+class TestBlobStore(unittest.TestCase):
+    """Test out-of-line, content-addressed storage of large values."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        self.data = os.urandom(48 * 1024).hex().encode()  # 96 KiB, over the threshold
+        self.source = os.path.join(self.temp_dir, "kubeconfig")
+        with open(self.source, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _add(self, name, path=None, value=None):
+        args = MagicMock(value=value, stdin=False, file=path, force=True, tag=None)
+        args.name = name
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.add_secret(args)
+
+    def _blobs(self):
+        blob_dir = os.path.join(self.temp_dir, "blobs")
+        return sorted(os.listdir(blob_dir)) if os.path.isdir(blob_dir) else []
+
+    def test_large_file_is_stored_out_of_line_and_round_trips(self):
+        self._add("KUBECONFIG", self.source)
+        self._add("SMALL", value="tiny")
+        vault = envlockr.load_vault()
+        self.assertTrue(vault["KUBECONFIG"].startswith("b1:"))
+        self.assertLess(os.path.getsize(envlockr.VAULT_FILE), 1024)
+        self.assertEqual(len(self._blobs()), 1)
+        self.assertEqual(envlockr.load_meta()["entries"]["KUBECONFIG"]["length"], len(self.data))
+
+        out_path = os.path.join(self.temp_dir, "out")
+        args = MagicMock(version=None, output=out_path)
+        args.name = "KUBECONFIG"
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.get_secret(args)
+        with open(out_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        fernet = envlockr.load_or_create_key()
+        self.assertEqual(envlockr.decrypt_secret(fernet, vault["KUBECONFIG"], "KUBECONFIG"),
+                         self.data.decode())
+
+    def test_batch_and_import_store_large_values_as_blobs(self):
+        big = self.data.decode()
+        args = MagicMock(file='-', dry_run=False)
+        with patch('sys.stdin', StringIO(json.dumps({"op": "add", "name": "FROM_BATCH",
+                                                     "value": big}) + "\n")), \
+             patch('sys.stdout', new=StringIO()):
+            envlockr.batch_command(args)
+        env_file = os.path.join(self.temp_dir, "big.env")
+        with open(env_file, 'w') as f:
+            f.write(f"FROM_IMPORT={big}\nSMALL=x\n")
+        args = MagicMock(file=env_file, force=False, format='auto', dry_run=False)
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.import_secrets(args)
+
+        vault = envlockr.load_vault()
+        self.assertTrue(vault["FROM_BATCH"].startswith("b1:"))
+        self.assertTrue(vault["FROM_IMPORT"].startswith("b1:"))
+        self.assertFalse(vault["SMALL"].startswith("b1:"))
+        self.assertLess(os.path.getsize(envlockr.VAULT_FILE), 2048)
+        fernet = envlockr.load_or_create_key()
+        self.assertEqual(envlockr.decrypt_secret(fernet, vault["FROM_IMPORT"], "FROM_IMPORT"), big)
+        self.assertEqual(envlockr.load_meta()["entries"]["FROM_BATCH"]["length"], len(big))
+
+    def test_v2_export_refuses_blob_values(self):
+        self._add("KUBECONFIG", self.source)
+        out = os.path.join(self.temp_dir, "old.envlockr")
+        args = MagicMock(password="pw", output=out, format="v2", recipient=None)
+        with patch('sys.stdout', new=StringIO()) as stdout:
+            envlockr.encrypt_vault_cmd(args)
+        self.assertIn("--format v2 cannot carry", stdout.getvalue())
+        self.assertFalse(os.path.exists(out))
+
+    def test_stdin_reads_every_line(self):
+        args = MagicMock(value=None, stdin=True, file=None, force=True, tag=None)
+        args.name = "CERT"
+        with patch('sys.stdin', new=StringIO("line one\nline two\n")), \
+             patch('sys.stdout', new=StringIO()):
+            envlockr.add_secret(args)
+        fernet = envlockr.load_or_create_key()
+        self.assertEqual(envlockr.decrypt_secret(fernet, envlockr.load_vault()["CERT"], "CERT"),
+                         "line one\nline two")
+
+    def test_blobs_are_deduplicated_and_collected(self):
+        self._add("A", self.source)
+        self._add("B", self.source)
+        self.assertEqual(len(self._blobs()), 1)  # same content, one blob
+        with patch.dict(os.environ, {"ENVLOCKR_HISTORY": "0"}):
+            for name in ("A", "B"):
+                args = MagicMock(force=True)
+                args.name = name
+                with patch('sys.stdout', new=StringIO()):
+                    envlockr.delete_secret(args)
+                self.assertEqual(len(self._blobs()), 1 if name == "A" else 0)
+
+    def test_rollback_restores_a_binary_blob(self):
+        binary = os.path.join(self.temp_dir, "keystore.p12")
+        with open(binary, 'wb') as f:
+            f.write(b"\xff\xfe" + os.urandom(1024))
+        self._add("KEYSTORE", binary)
+        old = envlockr.load_vault()["KEYSTORE"]
+        self.assertTrue(old.startswith("b1:"))
+        self._add("KEYSTORE", value="replaced")
+
+        args = MagicMock(version=None)
+        args.name = "KEYSTORE"
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.rollback_command(args)
+        self.assertEqual(envlockr.load_vault()["KEYSTORE"], old)
+        self.assertEqual(envlockr.load_meta()["entries"]["KEYSTORE"]["length"], 1026)
+
+    def test_tampered_blob_is_rejected(self):
+        self._add("KUBECONFIG", self.source)
+        path = os.path.join(self.temp_dir, "blobs", self._blobs()[0])
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+        out_path = os.path.join(self.temp_dir, "out")
+        args = MagicMock(version=None, output=out_path)
+        args.name = "KUBECONFIG"
+        with patch('sys.stdout', new=StringIO()), self.assertRaises(SystemExit):
+            envlockr.get_secret(args)
+        self.assertFalse(os.path.exists(out_path))
+
+
+class TestIntegrity(unittest.TestCase):
+    """Test the Merkle integrity tree and `fsck`."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        self.fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({f"K{i}": self.fernet.encrypt(b"v%d" % i).decode() for i in range(20)})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _fsck(self, init=False):
+        with patch('sys.stdout', new=StringIO()) as out:
+            try:
+                envlockr.fsck_command(MagicMock(init=init))
+            except SystemExit as e:
+                return e.code, out.getvalue()
+        return 0, out.getvalue()
+
+    def test_incremental_updates_match_a_full_rebuild(self):
+        self._fsck(init=True)
+        vault = envlockr.load_vault()
+        vault["NEW"] = self.fernet.encrypt(b"n").decode()
+        vault["K3"] = self.fernet.encrypt(b"changed").decode()
+        del vault["K7"]
+        envlockr.save_vault(vault)
+        key = envlockr._integrity_key(self.fernet)
+        tree, counter, entries = envlockr._load_integrity(key)
+        self.assertEqual(tree, envlockr._integrity_tree(key, envlockr.load_vault()))
+        self.assertEqual((counter, entries), (2, 20))
+        self.assertEqual(self._fsck()[0], 0)
+
+    def test_failing_keychain_falls_back_to_the_counter_file(self):
+        self._fsck(init=True)
+        failure = (False, RuntimeError("No recommended backend was available"))
+        with patch.multiple(envlockr, KEYRING_AVAILABLE=True, keyring=MagicMock(), create=True), \
+             patch.object(envlockr, '_keyring_call', return_value=failure):
+            self.assertEqual(envlockr._integrity_counter(), 1)
+            vault = envlockr.load_vault()
+            vault["NEW"] = self.fernet.encrypt(b"n").decode()
+            with patch.object(envlockr, 'load_or_create_key',
+                              side_effect=AssertionError("key loaded under the lock")):
+                envlockr.save_vault(vault, self.fernet)
+            self.assertEqual(envlockr._integrity_counter(), 2)
+        self.assertEqual(self._fsck()[0], 0)
+
+    def test_tampering_is_reported_without_decrypting(self):
+        self._fsck(init=True)
+        with open(envlockr.VAULT_FILE) as f:
+            vault = json.load(f)
+        vault["K1"], vault["K2"] = vault["K2"], vault["K1"]  # swap two ciphertexts
+        del vault["K9"]
+        with open(envlockr.VAULT_FILE, 'w') as f:
+            json.dump(vault, f)
+        with patch.object(envlockr, 'decrypt_secret') as decrypt, \
+             patch.object(envlockr.Fernet, 'decrypt') as fernet_decrypt:
+            code, out = self._fsck()
+        self.assertEqual(code, 1)
+        self.assertIn("20 secret(s) expected, 19 present", out)
+        self.assertIn("K1", out)
+        self.assertIn("K2", out)
+        decrypt.assert_not_called()
+        fernet_decrypt.assert_not_called()
+
+        # A save does not launder the change into the tree.
+        envlockr.save_vault(envlockr.load_vault())
+        self.assertEqual(self._fsck()[0], 1)
+
+    def test_rollback_to_an_older_copy_is_detected(self):
+        self._fsck(init=True)
+        old = {}
+        for path in (envlockr.VAULT_FILE, envlockr._integrity_file()):
+            with open(path, 'rb') as f:
+                old[path] = f.read()
+        vault = envlockr.load_vault()
+        vault["K0"] = self.fernet.encrypt(b"rotated").decode()
+        envlockr.save_vault(vault)
+        for path, data in old.items():
+            with open(path, 'wb') as f:
+                f.write(data)
+        code, out = self._fsck()
+        self.assertEqual(code, 1)
+        self.assertIn("rolled back", out)
+        self.assertEqual(self._fsck(init=True)[0], 0)
+        self.assertEqual(self._fsck()[0], 0)
+
+
+class TestBatch(unittest.TestCase):
+    """Test `batch` NDJSON transactions."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        self.fernet = envlockr.load_or_create_key()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _batch(self, *ops, dry_run=False):
+        args = MagicMock(file='-', dry_run=dry_run)
+        stdin = StringIO("\n".join(json.dumps(op) for op in ops) + "\n")
+        with patch('sys.stdin', stdin), patch('sys.stdout', new=StringIO()) as out:
+            envlockr.batch_command(args)
+        return out.getvalue()
+
+    def test_batch_applies_all_ops_in_one_write(self):
+        envlockr.save_vault({"OLD": self.fernet.encrypt(b"x").decode(),
+                             "GONE": self.fernet.encrypt(b"y").decode()})
+        ops = [{"op": "add", "name": f"K{i}", "value": f"v{i}"} for i in range(50)]
+        ops += [{"op": "update", "name": "K0", "value": "new", "tags": ["prod"]},
+                {"op": "delete", "name": "GONE"},
+                {"op": "rename", "name": "OLD", "to": "NEW"}]
+        with patch.object(envlockr, 'save_vault', wraps=envlockr.save_vault) as save:
+            self._batch(*ops)
+        self.assertEqual(save.call_count, 1)
+
+        vault = envlockr.load_vault()
+        self.assertEqual(len(vault), 51)
+        self.assertNotIn("GONE", vault)
+        self.assertEqual(envlockr.decrypt_secret(self.fernet, vault["K0"], "K0"), "new")
+        self.assertEqual(envlockr.decrypt_secret(self.fernet, vault["NEW"], "NEW"), "x")
+        self.assertEqual(envlockr.load_meta()["entries"]["K0"]["tags"], ["prod"])
+
+    def test_invalid_op_writes_nothing(self):
+        envlockr.save_vault({"A": self.fernet.encrypt(b"1").decode()})
+        before = open(envlockr.VAULT_FILE).read()
+        with self.assertRaises(SystemExit):
+            self._batch({"op": "add", "name": "B", "value": "2"},
+                        {"op": "delete", "name": "B"},
+                        {"op": "update", "name": "B", "value": "3"},  # deleted above
+                        {"op": "add", "name": "A", "value": "4"})     # exists, no force
+        self.assertEqual(open(envlockr.VAULT_FILE).read(), before)
+
+    def test_rename_reencrypts_name_bound_entries(self):
+        with patch.dict(os.environ, {"ENVLOCKR_CIPHER": "aesgcm"}):
+            envlockr.save_vault({"A": envlockr._encrypt_value(self.fernet, "A", "secret")})
+            self._batch({"op": "rename", "name": "A", "to": "B"})
+        vault = envlockr.load_vault()
+        self.assertEqual(envlockr.decrypt_secret(self.fernet, vault["B"], "B"), "secret")
+
+
 class TestNonInteractiveInput(unittest.TestCase):
     """Test --value / --stdin secret input (no getpass hang on piped input)."""
 
@@ -414,7 +1244,7 @@ class TestNonInteractiveInput(unittest.TestCase):
         envlockr.KEYRING_AVAILABLE = self.orig_keyring
 
     def test_add_with_value_flag(self):
-        args = MagicMock(name="A", value="flagval", stdin=False, force=True)
+        args = MagicMock(name="A", value="flagval", stdin=False, file=None, force=True)
         args.name = "A"
         with patch('sys.stdout', new=StringIO()):
             envlockr.add_secret(args)
@@ -424,7 +1254,7 @@ class TestNonInteractiveInput(unittest.TestCase):
 
     def test_resolve_reads_piped_stdin_without_flag(self):
         """A non-TTY stdin must be read instead of blocking on getpass."""
-        args = MagicMock(value=None, stdin=False)
+        args = MagicMock(value=None, stdin=False, file=None)
         with patch('sys.stdin', new=StringIO("piped-secret\n")), \
              patch.object(envlockr.sys.stdin, 'isatty', return_value=False, create=True):
             # StringIO.isatty() returns False already; this is belt-and-suspenders.
@@ -432,7 +1262,7 @@ class TestNonInteractiveInput(unittest.TestCase):
         self.assertEqual(val, "piped-secret")
 
     def test_resolve_uses_getpass_on_tty(self):
-        args = MagicMock(value=None, stdin=False)
+        args = MagicMock(value=None, stdin=False, file=None)
         fake_stdin = MagicMock()
         fake_stdin.isatty.return_value = True
         with patch('sys.stdin', fake_stdin), \
@@ -469,6 +1299,44 @@ class TestColors(unittest.TestCase):
         envlockr.Colors.RED = original_red
 
 
+class TestCLIDispatch(unittest.TestCase):
+    """Test the lazily built command line parser."""
+
+    # Parser construction + parsing for one command, best of several runs.
+    STARTUP_BUDGET_MS = 2.0
+
+    @staticmethod
+    def _best_ms(fn, runs=20):
+        import time
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times) * 1000
+
+    def test_help_lists_every_command(self):
+        with patch('sys.stdout', new=StringIO()) as out, self.assertRaises(SystemExit):
+            envlockr.main(['--help'])
+        for name in envlockr.COMMANDS:
+            self.assertIn(name, out.getvalue())
+
+    def test_only_selected_command_is_built(self):
+        parser = envlockr._build_parser(envlockr._command_in(['-e', 'prod', 'get', 'X']))
+        sub = next(a for a in parser._actions if isinstance(a, argparse._SubParsersAction))
+        self.assertEqual(list(sub.choices), ['get'])
+        args = parser.parse_args(['-e', 'prod', 'get', 'X'])
+        self.assertEqual((args.env, args.name, args.func), ('prod', 'X', envlockr.get_secret))
+
+    def test_parse_budget(self):
+        # Parser construction + parse only; benchmarks/bench_startup.py
+        # measures the wall time of a whole `envlockr get`.
+        lazy = self._best_ms(lambda: envlockr._build_parser('get').parse_args(['get', 'X']))
+        full = self._best_ms(lambda: envlockr._build_parser(None).parse_args(['get', 'X']))
+        self.assertLess(lazy, self.STARTUP_BUDGET_MS)
+        self.assertLess(lazy, full / 3)
+
+
 class TestPasswordVault(unittest.TestCase):
     """Test password-based vault encryption (random salt + legacy fallback)."""
 
@@ -506,7 +1374,7 @@ class TestPasswordVault(unittest.TestCase):
             with open(envlockr.VAULT_FILE, 'w') as f:
                 json.dump({"API_KEY": "ciphertext"}, f)
 
-            enc = MagicMock(password="pw", output=out_file)
+            enc = MagicMock(password="pw", output=out_file, format="v2", recipient=None)
             with patch('sys.stdout', new=StringIO()):
                 envlockr.encrypt_vault_cmd(enc)
 
@@ -518,7 +1386,7 @@ class TestPasswordVault(unittest.TestCase):
             os.remove(envlockr.VAULT_FILE)
             os.remove(envlockr.KEY_FILE)
 
-            dec = MagicMock(file=out_file, password="pw", force=True)
+            dec = MagicMock(file=out_file, password="pw", force=True, merge=False)
             with patch('sys.stdout', new=StringIO()):
                 envlockr.decrypt_vault_cmd(dec)
 
@@ -532,6 +1400,541 @@ class TestPasswordVault(unittest.TestCase):
             envlockr.KEYRING_AVAILABLE = orig_keyring
 
 
+class TestStreamingBundle(unittest.TestCase):
+    """Test the chunked AEAD v3 bundle format."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.temp_dir, "vault.envlockr")
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        # Small chunks and a cheap KDF so the test exercises many frames quickly.
+        self.patches = [patch.object(envlockr, 'STREAM_CHUNK_SIZE', 256),
+                        patch.object(envlockr, 'PBKDF2_ITERATIONS', 1000)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _encrypt(self, **opts):
+        fernet = envlockr.load_or_create_key()
+        self.vault = {f"S{i}": fernet.encrypt(os.urandom(40)).decode() for i in range(50)}
+        envlockr.save_vault(self.vault)
+        with open(envlockr.KEY_FILE, 'rb') as f:
+            self.key = f.read()
+        enc = MagicMock(password="pw", output=self.out_file, format="v3", no_compress=False,
+                        recipient=None)
+        for k, v in opts.items():
+            setattr(enc, k, v)
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.encrypt_vault_cmd(enc)
+        os.remove(envlockr.VAULT_FILE)
+        os.remove(envlockr.KEY_FILE)
+
+    def _decrypt(self, password="pw"):
+        dec = MagicMock(file=self.out_file, password=password, force=True, merge=False)
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.decrypt_vault_cmd(dec)
+        return out.getvalue()
+
+    def test_roundtrip_restores_vault_and_key(self):
+        self._encrypt(no_compress=True)
+        with open(self.out_file, 'rb') as f:
+            self.assertTrue(f.read().startswith(envlockr.VAULT_MAGIC_V3))
+        self._decrypt()
+        self.assertEqual(envlockr.load_vault(), self.vault)
+        with open(envlockr.KEY_FILE, 'rb') as f:
+            self.assertEqual(f.read(), self.key)
+
+    def test_tampered_or_truncated_bundle_is_rejected(self):
+        self._encrypt()
+        with open(self.out_file, 'rb') as f:
+            data = f.read()
+        for bad in (data[:-20], data[:60] + bytes([data[60] ^ 1]) + data[61:]):
+            with open(self.out_file, 'wb') as f:
+                f.write(bad)
+            self.assertIn("corrupted", self._decrypt())
+            self.assertFalse(os.path.exists(envlockr.VAULT_FILE))
+        self.assertEqual(
+            [n for n in os.listdir(self.temp_dir) if n.startswith(".import-")], [])
+
+    def test_wrong_password(self):
+        self._encrypt()
+        self.assertIn("Wrong password", self._decrypt("nope"))
+
+
+class TestRecipientBundles(unittest.TestCase):
+    """Test X25519 recipient bundles (export-vault --recipient, share)."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.bundle = os.path.join(self.temp_dir, "team.envlockr")
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.KEYRING_AVAILABLE = False
+        self.chunk = patch.object(envlockr, 'STREAM_CHUNK_SIZE', 256)
+        self.chunk.start()
+
+    def tearDown(self):
+        self.chunk.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _use(self, who):
+        envlockr.VAULT_DIR = os.path.join(self.temp_dir, who)
+        envlockr.VAULT_FILE = os.path.join(envlockr.VAULT_DIR, "vault.json")
+        envlockr.KEY_FILE = os.path.join(envlockr.VAULT_DIR, "key.key")
+
+    def _identity(self, who):
+        self._use(who)
+        with patch('sys.stdout', new=StringIO()) as out, patch('sys.stderr', new=StringIO()):
+            envlockr.identity_command(MagicMock())
+        return out.getvalue().strip()
+
+    def _export(self, *recipients):
+        self._use("alice")
+        fernet = envlockr.load_or_create_key()
+        self.vault = {f"S{i}": fernet.encrypt(os.urandom(40)).decode() for i in range(30)}
+        envlockr.save_vault(self.vault)
+        args = MagicMock(password=None, output=self.bundle, format="v3", no_compress=False,
+                         recipient=list(recipients))
+        with patch('sys.stdout', new=StringIO()), \
+                patch('getpass.getpass', side_effect=AssertionError("prompted")):
+            envlockr.encrypt_vault_cmd(args)
+
+    def _import(self, who):
+        self._use(who)
+        args = MagicMock(file=self.bundle, password=None, force=True, merge=False)
+        with patch('sys.stdout', new=StringIO()) as out, \
+                patch('getpass.getpass', side_effect=AssertionError("prompted")), \
+                patch('hashlib.pbkdf2_hmac', side_effect=AssertionError("KDF used")):
+            envlockr.decrypt_vault_cmd(args)
+        return out.getvalue()
+
+    def test_recipient_imports_without_password(self):
+        bob = self._identity("bob")
+        self.assertTrue(bob.startswith(envlockr.RECIPIENT_PREFIX))
+        self.assertEqual(self._identity("bob"), bob)  # stable once created
+        self._export(bob)
+        self.assertIn("restored", self._import("bob"))
+        self.assertEqual(envlockr.load_vault(), self.vault)
+
+    def test_non_recipient_is_refused(self):
+        self._export(self._identity("bob"))
+        self._identity("carol")
+        self.assertIn("not addressed", self._import("carol"))
+        self.assertFalse(os.path.exists(envlockr.VAULT_FILE))
+
+    def test_share_appends_one_stanza_and_keeps_payload(self):
+        self._export(self._identity("bob"))
+        carol = self._identity("carol")
+        with open(self.bundle, 'rb') as f:
+            before = f.read()
+        self._use("alice")
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.share_command(MagicMock(file=self.bundle, recipient=[carol]))
+        with open(self.bundle, 'rb') as f:
+            after = f.read()
+        self.assertEqual(len(after), len(before) + envlockr.RECIPIENT_STANZA_SIZE)
+        head = len(envlockr.VAULT_MAGIC_V3) + envlockr._STREAM_HEADER.size + 2
+        tail = before[head + 2 * envlockr.RECIPIENT_STANZA_SIZE:]
+        self.assertTrue(after.endswith(tail))  # payload copied, not re-encrypted
+        self.assertIn("restored", self._import("carol"))
+        self.assertEqual(envlockr.load_vault(), self.vault)
+
+
+class TestVaultMerge(unittest.TestCase):
+    """Test `import-vault --merge` three-way sync."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.bundle = os.path.join(self.temp_dir, "team.envlockr")
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.KEYRING_AVAILABLE = False
+        self.kdf = patch.object(envlockr, 'PBKDF2_ITERATIONS', 1000)
+        self.kdf.start()
+
+    def tearDown(self):
+        self.kdf.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _use(self, who):
+        envlockr.VAULT_DIR = os.path.join(self.temp_dir, who)
+        envlockr.VAULT_FILE = os.path.join(envlockr.VAULT_DIR, "vault.json")
+        envlockr.KEY_FILE = os.path.join(envlockr.VAULT_DIR, "key.key")
+
+    def _set(self, name, value):
+        args = MagicMock(value=value, stdin=False, file=None, force=True, tag=None)
+        args.name = name
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.add_secret(args)
+
+    def _export(self):
+        args = MagicMock(password="pw", output=self.bundle, format="v3", no_compress=False,
+                         recipient=None)
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.encrypt_vault_cmd(args)
+
+    def _import(self, **opts):
+        args = MagicMock(file=self.bundle, password="pw", force=True, merge=True,
+                         prefer='local', dry_run=False)
+        for k, v in opts.items():
+            setattr(args, k, v)
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.decrypt_vault_cmd(args)
+        return out.getvalue()
+
+    def _values(self):
+        fernet = envlockr.load_or_create_key()
+        return {k: envlockr.decrypt_secret(fernet, v)
+                for k, v in envlockr.load_vault().items()}
+
+    def test_merge_keeps_both_sides_changes(self):
+        self._use("me")
+        self._set("A", "a1")
+        self._set("B", "b1")
+        self._set("GONE", "x")
+        self._export()
+
+        self._use("teammate")
+        self._import(merge=False)  # bootstrap from my bundle
+        self._set("B", "b2")
+        self._set("C", "c1")
+        args = MagicMock(force=True)
+        args.name = "GONE"
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.delete_secret(args)
+        self._export()
+
+        self._use("me")
+        self._set("A", "a2")
+        self._set("D", "d1")
+        self.assertIn("0 conflict(s)", self._import())
+        self.assertEqual(self._values(),
+                         {"A": "a2", "B": "b2", "C": "c1", "D": "d1"})
+
+    def test_conflict_is_reported_and_local_kept(self):
+        self._use("me")
+        self._set("A", "base")
+        self._export()
+        self._use("teammate")
+        self._import(merge=False)
+        self._set("A", "theirs")
+        self._export()
+        self._use("me")
+        self._set("A", "mine")
+        output = self._import(dry_run=True)
+        self.assertIn("Conflict on 'A'", output)
+        self.assertEqual(self._values(), {"A": "mine"})
+        self._import(prefer='remote')
+        self.assertEqual(self._values(), {"A": "theirs"})
+
+    def test_merge_without_ancestor_adds_missing_entries(self):
+        self._use("teammate")
+        self._set("SHARED", "s")
+        self._export()
+        self._use("me")
+        self._set("MINE", "m")
+        self._import()
+        self.assertEqual(self._values(), {"MINE": "m", "SHARED": "s"})
+
+    def test_only_a_completed_export_records_the_ancestor(self):
+        self._use("me")
+        self._set("A", "a1")
+        self.bundle = os.path.join(self.temp_dir, "missing-dir", "team.envlockr")
+        self._export()
+        self.assertNotIn("sync", envlockr.load_meta())
+        self.bundle = os.path.join(self.temp_dir, "team.envlockr")
+        self._export()
+        self.assertEqual(list(envlockr.load_meta()["sync"].values())[0]["ancestor"],
+                         {"A": envlockr.load_meta()["entries"]["A"]["fp"]})
+
+    def test_binary_blob_survives_cross_key_merge(self):
+        payload = bytes(range(256)) * 400
+        path = os.path.join(self.temp_dir, "cert.der")
+        with open(path, 'wb') as f:
+            f.write(payload)
+        self._use("teammate")
+        args = MagicMock(value=None, stdin=False, file=path, force=True, tag=None)
+        args.name = "CERT"
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.add_secret(args)
+        self._export()
+        self._use("me")
+        self._set("MINE", "m")
+        self.assertIn("1 updated/added", self._import())
+        fernet = envlockr.load_or_create_key()
+        self.assertEqual(envlockr._decrypt_value(fernet, envlockr.load_vault()["CERT"]), payload)
+        self.assertEqual(envlockr.load_meta()["entries"]["CERT"]["length"], len(payload))
+
+    def test_undecryptable_incoming_entry_is_skipped(self):
+        self._use("teammate")
+        self._set("GOOD", "g")
+        self._set("BAD", "b")
+        self._export()
+        self._use("me")
+        self._set("MINE", "m")
+        self._import()  # BAD is synced and unchanged locally since
+        ancestor = list(envlockr.load_meta()["sync"].values())[0]["ancestor"]
+
+        self._use("teammate")
+        self._set("GOOD", "g2")
+        vault = envlockr.load_vault()
+        vault["BAD"] = "not-a-token"
+        envlockr.save_vault(vault)
+        self._export()
+        self._use("me")
+        output = self._import()
+        self.assertIn("'BAD' could not be decrypted", output)
+        self.assertEqual(self._values(), {"MINE": "m", "GOOD": "g2", "BAD": "b"})
+        synced = list(envlockr.load_meta()["sync"].values())[0]["ancestor"]
+        self.assertEqual(synced["BAD"], ancestor["BAD"])
+
+
+class TestFingerprintIndex(unittest.TestCase):
+    """Test diff / dupes / find over keyed fingerprints."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.BASE_DIR, envlockr.VAULT_DIR, envlockr.VAULT_FILE,
+                     envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.BASE_DIR = self.temp_dir
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        (envlockr.BASE_DIR, envlockr.VAULT_DIR, envlockr.VAULT_FILE,
+         envlockr.KEY_FILE) = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _set(self, profile, name, value):
+        envlockr.set_profile(profile)
+        args = MagicMock(value=value, stdin=False, file=None, force=True, tag=None)
+        args.name = name
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.add_secret(args)
+
+    def test_diff_reindexes_once_then_needs_no_decryption(self):
+        for name, value in (("SAME", "1"), ("CHANGED", "a"), ("PROD_ONLY", "p")):
+            self._set("prod", name, value)
+        for name, value in (("SAME", "1"), ("CHANGED", "b"), ("STAGING_ONLY", "s")):
+            self._set("staging", name, value)
+
+        args = MagicMock(profile_a="prod", profile_b="staging", json=True, reindex=True)
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.diff_profiles(args)  # adopts prod's index key
+        args.reindex = False
+        with patch.object(envlockr, 'decrypt_secret',
+                          side_effect=AssertionError("decrypted")), \
+             patch('sys.stdout', new=StringIO()) as out:
+            envlockr.diff_profiles(args)
+        result = json.loads(out.getvalue())
+        self.assertEqual(result, {"only_in_a": ["PROD_ONLY"], "only_in_b": ["STAGING_ONLY"],
+                                  "different": ["CHANGED"], "identical": 1})
+
+    def test_plain_diff_refuses_different_index_keys_without_writing(self):
+        self._set("prod", "A", "1")
+        self._set("staging", "A", "1")
+        metas = [os.path.join(envlockr._profile_dir(p), "meta.json") for p in ("prod", "staging")]
+
+        def read_all():
+            contents = []
+            for path in metas:
+                with open(path) as f:
+                    contents.append(f.read())
+            return contents
+
+        before = read_all()
+        args = MagicMock(profile_a="prod", profile_b="staging", json=True, reindex=False)
+        with patch('sys.stdout', new=StringIO()) as out, self.assertRaises(SystemExit) as ctx:
+            envlockr.diff_profiles(args)
+        self.assertEqual(ctx.exception.code, 1)
+        self.assertIn("--reindex", out.getvalue())
+        self.assertEqual(read_all(), before)
+
+    def test_dupes_and_find(self):
+        self._set("default", "A", "shared")
+        self._set("default", "B", "shared")
+        self._set("default", "C", "unique")
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.dupes_command(MagicMock())
+        self.assertIn("A, B", out.getvalue())
+        self.assertNotIn("C", out.getvalue().split("group(s)")[1])
+
+        args = MagicMock(value="unique", stdin=False, file=None, all_profiles=False)
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.find_command(args)
+        self.assertIn("C", out.getvalue())
+        self.assertNotIn("A", out.getvalue())
+
+
+class TestAuditLog(unittest.TestCase):
+    """Test the append-only access audit log."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def test_get_is_recorded_and_queryable(self):
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"A": fernet.encrypt(b"1").decode(),
+                             "B": fernet.encrypt(b"2").decode()})
+        for name in ("A", "B", "A"):
+            args = MagicMock(version=None, output=None)
+            args.name = name
+            with patch('sys.stdout', new=StringIO()):
+                envlockr.get_secret(args)
+
+        args = MagicMock(name=None, cmd="get", since="1h", until=None, limit=None, json=True)
+        args.name = "A"
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.audit_command(args)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({r["name"] for r in rows}, {"A"})
+        self.assertEqual(rows[0]["pid"], os.getpid())
+        self.assertEqual(rows[0]["profile"], envlockr.PROFILE)
+
+    def test_date_only_until_covers_the_whole_day(self):
+        envlockr._audit("get", ["A"])
+        today = time.strftime('%Y-%m-%d', time.gmtime())
+        args = MagicMock(cmd=None, since=today, until=today, limit=None, json=True)
+        args.name = None
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.audit_command(args)
+        self.assertEqual([json.loads(line)["name"] for line in out.getvalue().splitlines()], ["A"])
+
+    def test_limit_must_be_positive(self):
+        parser = envlockr._build_parser('audit')
+        with patch('sys.stderr', new=StringIO()), self.assertRaises(SystemExit):
+            parser.parse_args(['audit', '--limit', '0'])
+        self.assertEqual(parser.parse_args(['audit', '--limit', '1']).limit, 1)
+
+    def test_rotation_compresses_and_keeps_history_readable(self):
+        with patch.object(envlockr, 'AUDIT_MAX_BYTES', 200):
+            for i in range(40):
+                envlockr._audit("get", [f"S{i}"])
+        files = os.listdir(self.temp_dir)
+        self.assertTrue(any(f.endswith(".gz") for f in files))
+        self.assertLessEqual(len([f for f in files if f.startswith("audit.log.")]),
+                             envlockr.AUDIT_KEEP)
+        names = [r["name"] for r in envlockr._audit_records()]
+        self.assertEqual(names, sorted(names, key=lambda n: int(n[1:])))
+        self.assertEqual(names[-1], "S39")
+
+    def test_append_overhead_is_small(self):
+        import time
+        start = time.perf_counter()
+        for _ in range(200):
+            envlockr._audit("get", ["A"])
+        self.assertLess((time.perf_counter() - start) / 200, 0.001)
+
+
+class TestBackups(unittest.TestCase):
+    """Test content-addressed incremental snapshots."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.backup_dir = os.path.join(self.temp_dir, "backups")
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        self.fernet = envlockr.load_or_create_key()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _backup(self, **opts):
+        args = MagicMock(dir=self.backup_dir, keep=None, list=False, prune_only=False)
+        for k, v in opts.items():
+            setattr(args, k, v)
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.backup_command(args)
+
+    def _objects(self):
+        return sum(len(files) for _, _, files in
+                   os.walk(os.path.join(self.backup_dir, "objects")))
+
+    def test_unchanged_entries_are_shared(self):
+        vault = {n: self.fernet.encrypt(n.encode()).decode() for n in ("A", "B", "C")}
+        envlockr.save_vault(vault)
+        self._backup()
+        first = envlockr._list_snapshots(self.backup_dir)[0]
+
+        vault["B"] = self.fernet.encrypt(b"rotated").decode()
+        envlockr.save_vault(vault)
+        self._backup()
+        self.assertEqual(len(envlockr._list_snapshots(self.backup_dir)), 2)
+        self.assertEqual(self._objects(), 4)
+
+        args = MagicMock(dir=self.backup_dir, snapshot=first, force=True)
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.restore_command(args)
+        restored = envlockr.load_vault()
+        self.assertEqual(envlockr.decrypt_secret(self.fernet, restored["B"]), "B")
+
+    def test_keep_prunes_and_collects_garbage(self):
+        envlockr.save_vault({"A": self.fernet.encrypt(b"1").decode()})
+        self._backup()
+        envlockr.save_vault({"A": self.fernet.encrypt(b"2").decode()})
+        self._backup(keep=1)
+        self.assertEqual(len(envlockr._list_snapshots(self.backup_dir)), 1)
+        self.assertEqual(self._objects(), 1)
+
+    def test_foreign_snapshots_are_skipped_not_fatal(self):
+        envlockr.save_vault({"A": self.fernet.encrypt(b"1").decode()})
+        self._backup()
+        foreign = envlockr._list_snapshots(self.backup_dir)[0]
+        objects = self._objects()
+        envlockr._write_key_file(envlockr.Fernet.generate_key())  # another user's key
+        self._backup()
+        self._backup(keep=1)
+
+        args = MagicMock(dir=self.backup_dir, keep=None, list=True, prune_only=False)
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.backup_command(args)
+        self.assertIn(f"Snapshot {foreign} does not open", out.getvalue())
+        self.assertIn("(1)", out.getvalue())
+        self.assertIn(foreign, envlockr._list_snapshots(self.backup_dir))
+        self.assertGreaterEqual(self._objects(), objects)
+
+    def test_keep_below_one_is_rejected(self):
+        parser = envlockr._build_parser('backup')
+        for bad in ("0", "-2", "x"):
+            with patch('sys.stderr', new=StringIO()), self.assertRaises(SystemExit):
+                parser.parse_args(['backup', '--keep', bad])
+        self.assertEqual(parser.parse_args(['backup', '--keep', '3']).keep, 3)
+
+
 class TestProfiles(unittest.TestCase):
     """Test --env profile path resolution."""
 
@@ -618,21 +2021,459 @@ class TestRunInjection(unittest.TestCase):
         envlockr.save_vault(vault)
 
         captured = {}
+        key = b"MY_KEY" if os.supports_bytes_environ else "MY_KEY"
 
-        def fake_run(cmd, env=None):
+        def fake_run(cmd, env=None, **kwargs):
             captured['env'] = env
+            value = env[key]
+            captured['value'] = bytes(bytearray(value)) if isinstance(value, bytes) else value
             captured['cmd'] = cmd
             return MagicMock(returncode=0)
 
-        args = MagicMock(only=None, cmd=['--', 'echo', 'hi'])
+        args = MagicMock(only=None, cmd=['--', 'echo', 'hi'], no_interpolate=False,
+                         fd=None, file=None)
         with patch('subprocess.run', side_effect=fake_run), \
              patch('sys.stdout', new=StringIO()):
             with self.assertRaises(SystemExit) as ctx:
                 envlockr.run_command(args)
 
         self.assertEqual(ctx.exception.code, 0)
-        self.assertEqual(captured['env']['MY_KEY'], "s3cr3t")
         self.assertEqual(captured['cmd'], ['echo', 'hi'])
+        if os.supports_bytes_environ:
+            self.assertEqual(captured['value'], b"s3cr3t")
+            if sys.implementation.name == 'cpython':
+                # The parent's copy is zeroed once the child has exited.
+                self.assertEqual(captured['env'][key], bytes(6))
+        else:
+            self.assertEqual(captured['value'], "s3cr3t")
+
+    def test_arena_decrypt_matches_fernet_and_rejects_tampering(self):
+        fernet = envlockr.load_or_create_key()
+        token = fernet.encrypt(b"x" * 33).decode()
+        with envlockr._SecretArena() as arena:
+            view = envlockr._decrypt_into(arena, fernet, token, "A")
+            self.assertEqual(bytes(view), b"x" * 33)
+            tampered = token[:-6] + ("A" if token[-6] != "A" else "B") + token[-5:]
+            with patch('sys.stdout', new=StringIO()):
+                self.assertIsNone(envlockr._decrypt_into(arena, fernet, tampered, "A"))
+
+    def test_interpolation_in_arena(self):
+        fernet = envlockr.load_or_create_key()
+        vault = {"USER": fernet.encrypt(b"bob").decode(),
+                 "URL": fernet.encrypt(b"db://${USER}@h/$${x}").decode()}
+        with envlockr._SecretArena() as arena:
+            values = envlockr._resolve_secrets(fernet, vault, ["URL"], arena=arena)
+            self.assertEqual(bytes(values["URL"]), b"db://bob@h/${x}")
+
+    @unittest.skipUnless(hasattr(os, 'memfd_create'), "memfd_create is Linux-only")
+    def test_fd_and_file_pass_sealed_memfds(self):
+        import subprocess
+        fernet = envlockr.load_or_create_key()
+        big = os.urandom(40 * 1024).hex().encode()  # stored as a blob
+        ref, _size = envlockr._write_blob(fernet, [big])
+        envlockr.save_vault({"TOKEN": fernet.encrypt(b"tok").decode(), "BIG": ref,
+                             "PLAIN": fernet.encrypt(b"env").decode()})
+        probe = os.path.join(self.temp_dir, "probe.py")
+        with open(probe, 'w') as f:
+            f.write("import os\n"
+                    "fd = int(os.environ['TOKEN_FD'])\n"
+                    "print(os.read(fd, 10).decode(), os.environ['PLAIN'],\n"
+                    "      'TOKEN' in os.environ or 'BIG' in os.environ)\n"
+                    "print(len(open(os.environ['BIG_FILE'], 'rb').read()))\n"
+                    "try:\n"
+                    "    os.write(fd, b'x')\n"
+                    "except PermissionError:\n"
+                    "    print('sealed')\n")
+        args = MagicMock(only=None, cmd=['--', sys.executable, probe], no_interpolate=False,
+                         fd=["TOKEN"], file=["BIG"])
+        real_run, done = subprocess.run, []
+
+        def capture(cmd, **kwargs):
+            done.append(real_run(cmd, capture_output=True, text=True, **kwargs))
+            return done[-1]
+
+        with patch('subprocess.run', side_effect=capture), patch('sys.stderr', new=StringIO()):
+            with self.assertRaises(SystemExit) as ctx:
+                envlockr.run_command(args)
+        self.assertEqual(ctx.exception.code, 0, done[0].stderr)
+        self.assertEqual(done[0].stdout.split(), ["tok", "env", "False", str(len(big)), "sealed"])
+
+    def test_fd_for_unknown_secret_fails(self):
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"A": fernet.encrypt(b"a").decode()})
+        args = MagicMock(only=None, cmd=['--', 'true'], no_interpolate=False, fd=["NOPE"], file=None)
+        with patch('sys.stdout', new=StringIO()), patch('subprocess.run') as run, \
+                patch.object(envlockr.os, 'memfd_create', create=True):
+            with self.assertRaises(SystemExit) as ctx:
+                envlockr.run_command(args)
+        self.assertEqual(ctx.exception.code, 1)
+        run.assert_not_called()
+
+
+class TestUp(unittest.TestCase):
+    """Test the Procfile supervisor."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _procfile(self, text):
+        path = os.path.join(self.temp_dir, "Procfile")
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_parse_procfile(self):
+        path = self._procfile("# services\nweb[A, B]: npm start\nworker: python w.py\n")
+        self.assertEqual(envlockr._parse_procfile(path),
+                         [("web", ["A", "B"], "npm start"), ("worker", None, "python w.py")])
+        with self.assertRaises(ValueError):
+            envlockr._parse_procfile(self._procfile("web: a\nweb: b\n"))
+
+    def test_up_injects_each_subset_from_one_decryption(self):
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"A": fernet.encrypt(b"alpha").decode(),
+                             "B": fernet.encrypt(b"beta").decode()})
+        # "one" prints and keeps running; "two" prints once "one" has, then exits,
+        # which stops "one".
+        show = os.path.join(self.temp_dir, "show.py")
+        marker = os.path.join(self.temp_dir, "started")
+        with open(show, "w") as f:
+            f.write("import os, sys, time\n"
+                    "print(os.environ.get('A'), os.environ.get('B'), flush=True)\n"
+                    f"marker = {marker!r}\n"
+                    "if sys.argv[1] == 'serve':\n"
+                    "    open(marker, 'w').close()\n"
+                    "    time.sleep(60)\n"
+                    "while not os.path.exists(marker):\n"
+                    "    time.sleep(0.05)\n")
+        path = self._procfile(f'one[A]: "{sys.executable}" "{show}" serve\n'
+                              f'two[B]: "{sys.executable}" "{show}" exit\n')
+
+        args = MagicMock(procfile=path, timeout=5, no_interpolate=False)
+        with patch.object(envlockr, '_resolve_secrets',
+                          wraps=envlockr._resolve_secrets) as resolve, \
+             patch('sys.stdout', new=StringIO()) as out, patch('sys.stderr', new=StringIO()):
+            with self.assertRaises(SystemExit) as ctx:
+                envlockr.up_command(args)
+        self.assertEqual(ctx.exception.code, 0)
+        self.assertEqual(resolve.call_count, 1)
+        lines = out.getvalue().splitlines()
+        self.assertIn("one | alpha None", lines)
+        self.assertIn("two | None beta", lines)
+
+
+class TestMetadata(unittest.TestCase):
+    """Test the metadata sidecar and key-free `list` views."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _add(self, name, value, tags=None):
+        args = MagicMock(value=value, stdin=False, file=None, force=True, tag=tags)
+        args.name = name
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.add_secret(args)
+
+    def test_add_records_metadata(self):
+        self._add("STRIPE", "sk_live_abcdef", tags=["billing"])
+        entry = envlockr.load_meta()["entries"]["STRIPE"]
+        self.assertEqual(entry["length"], len("sk_live_abcdef"))
+        self.assertEqual(entry["provider"], "Stripe")
+        self.assertEqual(entry["tags"], ["billing"])
+        self.assertEqual(entry["created"], entry["updated"])
+
+    def test_list_json_never_loads_key(self):
+        self._add("A", "short")
+        self._add("B", "a much longer value")
+        args = MagicMock(long=False, json=True, sort='size', tag=None)
+        with patch.object(envlockr, 'load_or_create_key',
+                          side_effect=AssertionError("key loaded")), \
+             patch('sys.stdout', new=StringIO()) as out:
+            envlockr.list_secrets(args)
+        rows = json.loads(out.getvalue())
+        self.assertEqual([r["name"] for r in rows], ["B", "A"])
+        self.assertEqual(rows[1]["length"], 5)
+
+    def test_list_json_omits_internal_fields(self):
+        self._add("A", "short")
+        self.assertIn("fp", envlockr.load_meta()["entries"]["A"])
+        args = MagicMock(long=False, json=True, sort='name', tag=None)
+        with patch('sys.stdout', new=StringIO()) as out:
+            envlockr.list_secrets(args)
+        row = json.loads(out.getvalue())[0]
+        self.assertEqual(set(row), {"name", "created", "updated", "length",
+                                    "provider", "tags", "version"})
+
+    def test_delete_drops_metadata(self):
+        self._add("A", "v")
+        args = MagicMock(force=True)
+        args.name = "A"
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.delete_secret(args)
+        self.assertNotIn("A", envlockr.load_meta()["entries"])
+
+
+class TestInterpolation(unittest.TestCase):
+    """Test ${NAME} references resolved across secrets."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        self.fernet = envlockr.load_or_create_key()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def _vault(self, **values):
+        return {k: self.fernet.encrypt(v.encode()).decode() for k, v in values.items()}
+
+    def test_resolves_nested_references(self):
+        vault = self._vault(
+            DB_USER="app", DB_PASSWORD="pw", DB_HOST="db:5432",
+            DB_AUTH="${DB_USER}:${DB_PASSWORD}",
+            DATABASE_URL="postgres://${DB_AUTH}@${DB_HOST}/x?q=$${HOME}&u=${UNKNOWN}")
+        values = envlockr._resolve_secrets(self.fernet, vault, ["DATABASE_URL"])
+        self.assertEqual(values, {
+            "DATABASE_URL": "postgres://app:pw@db:5432/x?q=${HOME}&u=${UNKNOWN}"})
+
+    def test_only_decrypts_transitive_dependencies_once(self):
+        vault = self._vault(A="${B}${B}", B="${C}", C="c", UNRELATED="u")
+        with patch.object(envlockr, 'decrypt_secret',
+                          wraps=envlockr.decrypt_secret) as dec:
+            values = envlockr._resolve_secrets(self.fernet, vault, ["A", "B"])
+        self.assertEqual(values, {"A": "cc", "B": "c"})
+        self.assertEqual(dec.call_count, 3)
+
+    def test_cycle_is_reported(self):
+        vault = self._vault(A="${B}", B="${C}", C="${A}")
+        with self.assertRaises(ValueError) as ctx:
+            envlockr._resolve_secrets(self.fernet, vault, ["A"])
+        self.assertIn("A -> B -> C -> A", str(ctx.exception))
+
+    def test_value_without_references_is_verbatim(self):
+        vault = self._vault(OLD="ab$${cd}x", PLACEHOLDER="$${HOME}/${UNKNOWN}")
+        values = envlockr._resolve_secrets(self.fernet, vault, ["OLD", "PLACEHOLDER"])
+        self.assertEqual(values, {"OLD": "ab$${cd}x", "PLACEHOLDER": "$${HOME}/${UNKNOWN}"})
+
+    def test_undecryptable_reference_fails(self):
+        vault = self._vault(URL="db://${PASSWORD}@h")
+        vault["PASSWORD"] = "not-a-token"
+        with patch('sys.stdout', new=StringIO()), self.assertRaises(ValueError) as ctx:
+            envlockr._resolve_secrets(self.fernet, vault, ["URL"])
+        self.assertIn("PASSWORD", str(ctx.exception))
+
+
+class TestRender(unittest.TestCase):
+    """Test `render` template substitution."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({
+            "HOST": fernet.encrypt(b"example.com").decode(),
+            "UNUSED": fernet.encrypt(b"x").decode(),
+        })
+        self.template = os.path.join(self.temp_dir, "site.conf.tmpl")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def test_render_to_private_file(self):
+        with open(self.template, 'w') as f:
+            f.write("server_name ${HOST};\nset $$${literal};\n")
+        out = os.path.join(self.temp_dir, "site.conf")
+        args = MagicMock(template=self.template, output=out, force=True,
+                         allow_undefined=False)
+        with patch.object(envlockr, 'decrypt_secret',
+                          wraps=envlockr.decrypt_secret) as dec, \
+             patch('sys.stdout', new=StringIO()):
+            envlockr.render_template(args)
+        self.assertEqual(dec.call_count, 1)  # UNUSED is never decrypted
+        with open(out) as f:
+            self.assertEqual(f.read(), "server_name example.com;\nset $${literal};\n")
+        if sys.platform != 'win32':
+            self.assertEqual(os.stat(out).st_mode & 0o777, 0o600)
+
+    @unittest.skipIf(sys.platform == 'win32', "symlinks need privileges on Windows")
+    def test_render_ignores_planted_temp_names(self):
+        with open(self.template, 'w') as f:
+            f.write("host=${HOST}\n")
+        out = os.path.join(self.temp_dir, "site.conf")
+        decoy = os.path.join(self.temp_dir, "decoy")
+        os.symlink(decoy, os.path.join(self.temp_dir, f".site.conf.{os.getpid()}.tmp"))
+        args = MagicMock(template=self.template, output=out, force=True,
+                         allow_undefined=False)
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.render_template(args)
+        self.assertFalse(os.path.exists(decoy))
+        with open(out) as f:
+            self.assertEqual(f.read(), "host=example.com\n")
+
+    def test_undecryptable_secret_fails_without_output(self):
+        vault = envlockr.load_vault()
+        vault["HOST"] = "not-a-token"
+        envlockr.save_vault(vault)
+        with open(self.template, 'w') as f:
+            f.write("server_name ${HOST};\n")
+        out = os.path.join(self.temp_dir, "site.conf")
+        args = MagicMock(template=self.template, output=out, force=True,
+                         allow_undefined=False)
+        with patch('sys.stderr', new=StringIO()) as err, patch('sys.stdout', new=StringIO()), \
+                self.assertRaises(SystemExit) as ctx:
+            envlockr.render_template(args)
+        self.assertEqual(ctx.exception.code, 1)
+        self.assertIn("'HOST' referenced on line(s) 1 could not be decrypted", err.getvalue())
+        self.assertFalse(os.path.exists(out))
+
+    def test_declined_overwrite_decrypts_nothing(self):
+        with open(self.template, 'w') as f:
+            f.write("server_name ${HOST};\n")
+        out = os.path.join(self.temp_dir, "site.conf")
+        with open(out, 'w') as f:
+            f.write("old")
+        args = MagicMock(template=self.template, output=out, force=False,
+                         allow_undefined=False)
+        with patch.object(envlockr, 'load_or_create_key',
+                          side_effect=AssertionError("key loaded")), \
+             patch('builtins.input', return_value='n'), \
+             patch('sys.stdout', new=StringIO()), patch('sys.stderr', new=StringIO()):
+            envlockr.render_template(args)
+        with open(out) as f:
+            self.assertEqual(f.read(), "old")
+
+    def test_undefined_reference_reports_line(self):
+        with open(self.template, 'w') as f:
+            f.write("a\nb=${MISSING}\n")
+        args = MagicMock(template=self.template, output=None, allow_undefined=False)
+        with patch('sys.stderr', new=StringIO()) as err:
+            with self.assertRaises(SystemExit):
+                envlockr.render_template(args)
+        self.assertIn("'MISSING' referenced on line(s) 2", err.getvalue())
+
+
+class TestMount(unittest.TestCase):
+    """Test `mount` materializing secrets as files."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mount_dir = os.path.join(self.temp_dir, "mnt")
+        self.orig = (envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE)
+        self.orig_keyring = envlockr.KEYRING_AVAILABLE
+        envlockr.VAULT_DIR = self.temp_dir
+        envlockr.VAULT_FILE = os.path.join(self.temp_dir, "vault.json")
+        envlockr.KEY_FILE = os.path.join(self.temp_dir, "key.key")
+        envlockr.KEYRING_AVAILABLE = False
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        envlockr.VAULT_DIR, envlockr.VAULT_FILE, envlockr.KEY_FILE = self.orig
+        envlockr.KEYRING_AVAILABLE = self.orig_keyring
+
+    def test_mount_writes_private_files(self):
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"TLS_KEY": fernet.encrypt(b"pem").decode()})
+
+        args = MagicMock(dir=self.mount_dir, only=None, follow=False, allow_disk=True)
+        with patch('sys.stdout', new=StringIO()):
+            envlockr.mount_command(args)
+
+        path = os.path.join(self.mount_dir, "TLS_KEY")
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b"pem")
+        if sys.platform != 'win32':
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    @unittest.skipIf(sys.platform == 'win32', "symlinks need privileges on Windows")
+    def test_private_write_ignores_planted_temp_names(self):
+        os.makedirs(self.mount_dir)
+        decoy = os.path.join(self.temp_dir, "decoy")
+        os.symlink(decoy, os.path.join(self.mount_dir, f".KEY.{os.getpid()}.tmp"))
+        path = os.path.join(self.mount_dir, "KEY")
+        envlockr._write_private_file(path, b"pem")
+        self.assertFalse(os.path.exists(decoy))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b"pem")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    @unittest.skipIf(sys.platform == 'win32', "POSIX ownership and modes")
+    def test_default_dir_must_be_private(self):
+        fernet = envlockr.load_or_create_key()
+        envlockr.save_vault({"TLS_KEY": fernet.encrypt(b"pem").decode()})
+        args = MagicMock(dir=None, only=None, follow=False, allow_disk=True)
+        elsewhere = os.path.join(self.temp_dir, "elsewhere")
+        os.makedirs(elsewhere, mode=0o700)
+        os.symlink(elsewhere, self.mount_dir)
+        with patch.object(envlockr, '_default_mount_dir', return_value=self.mount_dir), \
+             patch('sys.stdout', new=StringIO()) as out, self.assertRaises(SystemExit):
+            envlockr.mount_command(args)
+        self.assertIn("it is a symlink", out.getvalue())
+        self.assertEqual(os.listdir(elsewhere), [])
+
+        os.remove(self.mount_dir)
+        os.makedirs(self.mount_dir)
+        os.chmod(self.mount_dir, 0o777)
+        with patch.object(envlockr, '_default_mount_dir', return_value=self.mount_dir), \
+             patch('sys.stdout', new=StringIO()) as out, self.assertRaises(SystemExit):
+            envlockr.mount_command(args)
+        self.assertIn("lets other users in", out.getvalue())
+
+        os.chmod(self.mount_dir, 0o700)
+        with patch.object(envlockr, '_default_mount_dir', return_value=self.mount_dir), \
+             patch('sys.stdout', new=StringIO()):
+            envlockr.mount_command(args)
+        self.assertEqual(os.listdir(self.mount_dir), ["TLS_KEY"])
+
+    def test_sync_rewrites_only_changed_entries(self):
+        fernet = envlockr.load_or_create_key()
+        os.makedirs(self.mount_dir)
+        vault = {"A": fernet.encrypt(b"1").decode(), "B": fernet.encrypt(b"2").decode()}
+        state = envlockr._sync_mounted(fernet, vault, ["A", "B"], self.mount_dir, {})
+
+        vault = {"A": vault["A"], "C": fernet.encrypt(b"3").decode()}
+        with patch.object(envlockr, '_decrypt_into',
+                          wraps=envlockr._decrypt_into) as dec:
+            state = envlockr._sync_mounted(
+                fernet, vault, ["A", "B", "C"], self.mount_dir, state)
+        self.assertEqual(dec.call_count, 1)  # only C was new
+        self.assertEqual(sorted(os.listdir(self.mount_dir)), ["A", "C"])
+        self.assertEqual(set(state), {"A", "C"})
 
 
 if __name__ == '__main__':